@@ -5,6 +5,8 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from passlib.context import CryptContext
+from app import metrics, profiling
+from app.staging import UploadRequest
 
 db = SQLAlchemy()
 migrate = Migrate()
@@ -15,10 +17,13 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    app.request_class = UploadRequest
 
     db.init_app(app)
     migrate.init_app(app, db)
     login.init_app(app)
+    metrics.init_app(app)
+    profiling.init_app(app)
 
     # Create upload folder if it doesn't exist
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -30,6 +35,12 @@ def create_app(config_class=Config):
     from app.routes.files import bp as files_bp
     app.register_blueprint(files_bp, url_prefix='/api')
 
+    from app.routes.uploads import bp as uploads_bp
+    app.register_blueprint(uploads_bp, url_prefix='/api')
+
+    from app.routes.jobs import bp as jobs_bp
+    app.register_blueprint(jobs_bp, url_prefix='/api')
+
     from app.routes.main import bp as main_bp
     app.register_blueprint(main_bp)
 
@@ -40,6 +51,11 @@ def create_app(config_class=Config):
     app.cli.add_command(cli.init_db_command)
     app.cli.add_command(cli.create_admin_command)
     app.cli.add_command(cli.sync_uploads_command)
+    app.cli.add_command(cli.purge_upload_sessions_command)
+    app.cli.add_command(cli.purge_trash_command)
+    app.cli.add_command(cli.watch_uploads_command)
+    app.cli.add_command(cli.jobs_worker_command)
+    app.cli.add_command(cli.backfill_metadata_command)
 
     return app
 
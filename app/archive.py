@@ -0,0 +1,409 @@
+"""Streaming ZIP writer used by the folder and bulk download endpoints.
+
+The archive is produced front to back without ever seeking: every member is
+written with a data descriptor (general purpose flag bit 3) so CRC and sizes
+can follow the compressed data, and ZIP64 records are emitted whenever a
+member, an offset or the entry count exceeds the classic format limits.
+
+Members are deflated in independent blocks on a shared thread pool (zlib
+releases the GIL) and written back in order. Each block is primed with the
+tail of the previous one and closed with a sync flush, so the concatenation
+is a single valid deflate stream with nearly the same ratio as a serial
+pass. Content that will not shrink is stored as-is.
+"""
+import os
+import stat
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+CHUNK_SIZE = 1024 * 1024
+DEFLATE_WINDOW = 32 * 1024
+SAMPLE_SIZE = 64 * 1024
+
+# Extensions whose payload is already compressed; deflating them only burns CPU.
+STORED_EXTENSIONS = frozenset({
+    '.7z', '.aac', '.apk', '.avi', '.avif', '.br', '.bz2', '.docx', '.epub',
+    '.flac', '.gif', '.gz', '.heic', '.jar', '.jpeg', '.jpg', '.lz4', '.m4a',
+    '.m4v', '.mkv', '.mov', '.mp3', '.mp4', '.odp', '.ods', '.odt', '.ogg',
+    '.opus', '.png', '.pptx', '.rar', '.tgz', '.webm', '.webp', '.whl',
+    '.xlsx', '.xz', '.zip', '.zst',
+})
+
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_FILECOUNT_LIMIT = (1 << 16) - 1
+ZIP_MAX_UINT32 = 0xFFFFFFFF
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+_VERSION_DEFAULT = 20
+_VERSION_ZIP64 = 45
+_CREATE_SYSTEM_UNIX = 3
+
+_LOCAL_HEADER = struct.Struct('<LHHHHHLLLHH')
+_CENTRAL_HEADER = struct.Struct('<LHHHHHHLLLHHHHHLL')
+_DATA_DESCRIPTOR = struct.Struct('<LLLL')
+_DATA_DESCRIPTOR64 = struct.Struct('<LLQQ')
+_END_RECORD = struct.Struct('<LHHHHLLH')
+_END_RECORD64 = struct.Struct('<LQHHLLQQQQ')
+_END_LOCATOR64 = struct.Struct('<LLQL')
+
+_SIG_LOCAL = 0x04034b50
+_SIG_CENTRAL = 0x02014b50
+_SIG_DESCRIPTOR = 0x08074b50
+_SIG_END = 0x06054b50
+_SIG_END64 = 0x06064b50
+_SIG_LOCATOR64 = 0x07064b50
+
+
+def _dos_datetime(timestamp):
+    tm = time.localtime(timestamp)
+    if tm.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (tm.tm_hour << 11) | (tm.tm_min << 5) | (tm.tm_sec // 2)
+    dos_date = ((tm.tm_year - 1980) << 9) | (tm.tm_mon << 5) | tm.tm_mday
+    return dos_time, dos_date
+
+
+class _Entry:
+    __slots__ = (
+        'name', 'flags', 'method', 'dos_time', 'dos_date', 'crc',
+        'compress_size', 'file_size', 'offset', 'external_attr', 'zip64',
+    )
+
+    def __init__(self, name, method, timestamp, external_attr, offset, zip64, flags):
+        self.name = name
+        self.flags = flags
+        self.method = method
+        self.dos_time, self.dos_date = _dos_datetime(timestamp)
+        self.crc = 0
+        self.compress_size = 0
+        self.file_size = 0
+        self.offset = offset
+        self.external_attr = external_attr
+        self.zip64 = zip64
+
+
+class ZipStream:
+    """Incrementally serializes a ZIP archive as a sequence of byte chunks."""
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._offset = 0
+        self._entries = []
+
+    def _emit(self, data):
+        self._offset += len(data)
+        return data
+
+    def _local_header(self, entry):
+        name = entry.name.encode('utf-8')
+        extra = b''
+        size_field = 0
+        if entry.zip64:
+            extra = struct.pack('<HHQQ', 1, 16, 0, 0)
+            size_field = ZIP_MAX_UINT32
+        return _LOCAL_HEADER.pack(
+            _SIG_LOCAL,
+            _VERSION_ZIP64 if entry.zip64 else _VERSION_DEFAULT,
+            entry.flags,
+            entry.method,
+            entry.dos_time,
+            entry.dos_date,
+            entry.crc if not entry.flags & _FLAG_DATA_DESCRIPTOR else 0,
+            size_field,
+            size_field,
+            len(name),
+            len(extra),
+        ) + name + extra
+
+    def add_directory(self, arcname, timestamp=None):
+        """Return the bytes of an empty directory entry."""
+        name = arcname.replace(os.sep, '/').rstrip('/') + '/'
+        entry = _Entry(
+            name,
+            ZIP_STORED,
+            time.time() if timestamp is None else timestamp,
+            ((stat.S_IFDIR | 0o775) << 16) | 0x10,
+            0,
+            False,
+            _FLAG_UTF8,
+        )
+        self._entries.append(entry)
+        return self.header(entry)
+
+    def begin_file(self, arcname, method, st):
+        """Register a file member and return its entry; the header is written by ``header``."""
+        entry = _Entry(
+            arcname.replace(os.sep, '/'),
+            method,
+            st.st_mtime,
+            (st.st_mode & 0xFFFF) << 16,
+            0,
+            st.st_size * 1.05 > ZIP64_LIMIT,
+            _FLAG_UTF8 | _FLAG_DATA_DESCRIPTOR,
+        )
+        self._entries.append(entry)
+        return entry
+
+    def header(self, entry):
+        entry.offset = self._offset
+        return self._emit(self._local_header(entry))
+
+    def data(self, entry, data):
+        entry.compress_size += len(data)
+        return self._emit(data)
+
+    def descriptor(self, entry, crc, file_size):
+        """Close a member, returning its data descriptor."""
+        if not entry.zip64 and max(file_size, entry.compress_size) > ZIP_MAX_UINT32:
+            raise RuntimeError(f'File "{entry.name}" grew past the ZIP64 limit while archiving')
+        entry.crc = crc
+        entry.file_size = file_size
+        if entry.zip64:
+            packed = _DATA_DESCRIPTOR64.pack(_SIG_DESCRIPTOR, crc, entry.compress_size, file_size)
+        else:
+            packed = _DATA_DESCRIPTOR.pack(_SIG_DESCRIPTOR, crc, entry.compress_size, file_size)
+        return self._emit(packed)
+
+    def _central_header(self, entry):
+        name = entry.name.encode('utf-8')
+        zip64_fields = []
+        file_size = entry.file_size
+        compress_size = entry.compress_size
+        offset = entry.offset
+        if entry.zip64 or file_size > ZIP64_LIMIT:
+            zip64_fields.append(file_size)
+            file_size = ZIP_MAX_UINT32
+        if entry.zip64 or compress_size > ZIP64_LIMIT:
+            zip64_fields.append(compress_size)
+            compress_size = ZIP_MAX_UINT32
+        if offset > ZIP64_LIMIT:
+            zip64_fields.append(offset)
+            offset = ZIP_MAX_UINT32
+
+        extra = b''
+        version = _VERSION_DEFAULT
+        if zip64_fields:
+            extra = struct.pack(f'<HH{len(zip64_fields)}Q', 1, 8 * len(zip64_fields), *zip64_fields)
+            version = _VERSION_ZIP64
+
+        return _CENTRAL_HEADER.pack(
+            _SIG_CENTRAL,
+            (_CREATE_SYSTEM_UNIX << 8) | version,
+            version,
+            entry.flags,
+            entry.method,
+            entry.dos_time,
+            entry.dos_date,
+            entry.crc,
+            compress_size,
+            file_size,
+            len(name),
+            len(extra),
+            0,
+            0,
+            0,
+            entry.external_attr,
+            offset,
+        ) + name + extra
+
+    def finish(self):
+        """Yield the central directory and end-of-archive records."""
+        directory_offset = self._offset
+        buffer = bytearray()
+        for entry in self._entries:
+            buffer += self._central_header(entry)
+            if len(buffer) >= self.chunk_size:
+                yield self._emit(bytes(buffer))
+                buffer.clear()
+        if buffer:
+            yield self._emit(bytes(buffer))
+        directory_size = self._offset - directory_offset
+
+        count = len(self._entries)
+        trailer = b''
+        if (count > ZIP_FILECOUNT_LIMIT
+                or directory_offset > ZIP64_LIMIT
+                or directory_size > ZIP64_LIMIT):
+            end64_offset = self._offset
+            trailer += _END_RECORD64.pack(
+                _SIG_END64, _END_RECORD64.size - 12,
+                (_CREATE_SYSTEM_UNIX << 8) | _VERSION_ZIP64, _VERSION_ZIP64,
+                0, 0, count, count, directory_size, directory_offset,
+            )
+            trailer += _END_LOCATOR64.pack(_SIG_LOCATOR64, 0, end64_offset, 1)
+            count = min(count, ZIP_FILECOUNT_LIMIT)
+            directory_size = min(directory_size, ZIP_MAX_UINT32)
+            directory_offset = min(directory_offset, ZIP_MAX_UINT32)
+        trailer += _END_RECORD.pack(
+            _SIG_END, 0, 0, count, count, directory_size, directory_offset, 0,
+        )
+        yield self._emit(trailer)
+
+
+def iter_folder_members(folder_path, arcname_root):
+    """Yield ``(abs_path, arcname)`` pairs for a folder, ``abs_path`` is None for empty dirs."""
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        rel_root = os.path.relpath(root, folder_path)
+        if not files and not dirs:
+            yield None, arcname_root if rel_root == '.' else os.path.join(arcname_root, rel_root)
+        for fname in sorted(files):
+            abs_path = os.path.join(root, fname)
+            yield abs_path, os.path.join(arcname_root, os.path.relpath(abs_path, folder_path))
+
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='zip-deflate')
+            _executor_workers = workers
+        return _executor
+
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def compression_for(arcname, size, sample):
+    """Pick ``(method, level)`` for a member from its name, size and first block."""
+    if size == 0 or os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+        return ZIP_STORED, 0
+    probe = sample[:SAMPLE_SIZE]
+    if len(probe) >= 4096 and len(zlib.compress(probe, 1)) > len(probe) * 0.95:
+        return ZIP_STORED, 0
+    if size <= CHUNK_SIZE:
+        return ZIP_DEFLATED, 9
+    if size <= 256 * CHUNK_SIZE:
+        return ZIP_DEFLATED, 6
+    return ZIP_DEFLATED, 1
+
+
+def _deflate_block(block, level, zdict):
+    if zdict:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+# Empty fixed-Huffman block with BFINAL set; terminates a run of sync-flushed blocks.
+_DEFLATE_END = b'\x03\x00'
+
+
+def _plan(archive, members, chunk_size, submit):
+    """Yield ``(kind, entry, payload)`` steps in archive order.
+
+    ``payload`` is a future for member data so that blocks can be compressed
+    ahead of the writer; headers and descriptors are produced on emission
+    because they depend on the running offset.
+    """
+    for abs_path, arcname in members:
+        if abs_path is None:
+            yield 'directory', arcname, None
+            continue
+        try:
+            handle = open(abs_path, 'rb')
+        except FileNotFoundError:
+            continue
+        with handle:
+            st = os.fstat(handle.fileno())
+            block = handle.read(chunk_size)
+            method, level = compression_for(arcname, st.st_size, block)
+            entry = archive.begin_file(arcname, method, st)
+            yield 'header', entry, None
+
+            crc = 0
+            file_size = 0
+            previous = b''
+            while block:
+                crc = zlib.crc32(block, crc)
+                file_size += len(block)
+                if method == ZIP_STORED:
+                    yield 'data', entry, _done(block)
+                else:
+                    yield 'data', entry, submit(_deflate_block, block, level, previous[-DEFLATE_WINDOW:])
+                    previous = block
+                block = handle.read(chunk_size)
+            if method == ZIP_DEFLATED:
+                yield 'data', entry, _done(_DEFLATE_END)
+            yield 'descriptor', entry, (crc, file_size)
+
+
+def stream_zip(members, workers=1, chunk_size=CHUNK_SIZE):
+    """Yield a ZIP archive built from ``(abs_path, arcname)`` pairs.
+
+    With ``workers`` > 1 blocks are deflated on a thread pool while at most
+    ``workers * 2`` blocks are held in memory. Output is coalesced into pieces
+    of roughly ``chunk_size`` bytes so that small members do not turn into
+    thousands of tiny writes on the socket.
+    """
+    archive = ZipStream(chunk_size=chunk_size)
+    if workers > 1:
+        submit = _get_executor(workers).submit
+    else:
+        def submit(fn, *args):
+            return _done(fn(*args))
+    max_pending = max(2, workers * 2)
+    queue = deque()
+    in_flight = 0
+
+    def emit(step):
+        kind, entry, payload = step
+        if kind == 'directory':
+            return archive.add_directory(entry)
+        if kind == 'header':
+            return archive.header(entry)
+        if kind == 'data':
+            return archive.data(entry, payload.result())
+        return archive.descriptor(entry, *payload)
+
+    def parts():
+        nonlocal in_flight
+        try:
+            for step in _plan(archive, members, chunk_size, submit):
+                queue.append(step)
+                if step[0] == 'data':
+                    in_flight += 1
+                while in_flight >= max_pending:
+                    step = queue.popleft()
+                    if step[0] == 'data':
+                        in_flight -= 1
+                    yield emit(step)
+            while queue:
+                yield emit(queue.popleft())
+            yield from archive.finish()
+        finally:
+            for _kind, _entry, payload in queue:
+                if isinstance(payload, Future):
+                    payload.cancel()
+
+    pending = bytearray()
+    for data in parts():
+        if len(data) >= chunk_size and not pending:
+            yield data
+            continue
+        pending += data
+        if len(pending) >= chunk_size:
+            yield bytes(pending)
+            pending.clear()
+    if pending:
+        yield bytes(pending)
@@ -0,0 +1,193 @@
+"""Content-addressable storage for uploaded files.
+
+With ``BLOB_STORE_ENABLED`` every uploaded file is stored once under
+``UPLOAD_FOLDER/.blobs/ab/cd/<sha256>`` and hard-linked into the owner's
+folder. The rest of the app keeps reading the user path as before, while
+identical content uploaded twice (by anyone, anywhere) takes disk space only
+once. ``Blob.ref_count`` counts the ``File`` rows pointing at a blob; when it
+drops to zero the blob is moved to the trash.
+
+Stored blobs are read-only, and their size and mtime are recorded so a copy
+changed on disk through one of its links is never handed to anyone else.
+
+Uploads can skip the transfer altogether: the client sends the SHA-256 it
+computed, and if the blob is known it proves possession by hashing a range
+picked by the server (:func:`make_challenge`) before the file is linked.
+"""
+import hashlib
+import os
+import secrets
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Blob
+from app.trash import move_to_trash
+
+HASH_BUFFER_SIZE = 1024 * 1024
+CHALLENGE_SIZE = 64 * 1024
+
+
+def blob_store_enabled():
+    return current_app.config['BLOB_STORE_ENABLED']
+
+
+def blob_root():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], '.blobs')
+
+
+def blob_path(sha256):
+    return os.path.join(blob_root(), sha256[:2], sha256[2:4], sha256)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(HASH_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _link(source, destination):
+    """Hard-links ``source`` at ``destination``, replacing whatever is there."""
+    temp_path = destination + '.uploading'
+    try:
+        os.remove(temp_path)
+    except FileNotFoundError:
+        pass
+    os.link(source, temp_path)
+    os.replace(temp_path, destination)
+
+
+def _acquire(blob):
+    db.session.execute(update(Blob).where(Blob.id == blob.id).values(ref_count=Blob.ref_count + 1))
+
+
+def _seal(path):
+    """Makes a stored blob read-only and returns the mtime to record for it."""
+    os.chmod(path, 0o444)
+    return datetime.utcfromtimestamp(os.stat(path).st_mtime)
+
+
+def _intact(blob, path):
+    """True if the stored copy still has the size and mtime recorded for it.
+
+    Blobs stored before mtimes were recorded are hashed once and sealed.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if stat.st_size != blob.size:
+        return False
+    if blob.mtime is None:
+        if file_sha256(path) != blob.sha256:
+            return False
+        blob.mtime = _seal(path)
+        return True
+    return datetime.utcfromtimestamp(stat.st_mtime) == blob.mtime
+
+
+def ingest(temp_path, destination, sha256=None):
+    """Moves a finished upload into the store and links it at ``destination``.
+
+    Returns the :class:`Blob`, whose reference count now includes the caller's
+    new File row. If the stored copy of that content was changed on disk, the
+    upload is kept as a plain file at ``destination`` and None is returned.
+    Nothing is committed.
+    """
+    digest = sha256 or file_sha256(temp_path)
+    size = os.path.getsize(temp_path)
+    stored_path = blob_path(digest)
+    blob = Blob.query.filter_by(sha256=digest).first()
+
+    if blob is not None and _intact(blob, stored_path):
+        os.remove(temp_path)
+    elif blob is not None and os.path.exists(stored_path):
+        os.replace(temp_path, destination)
+        return None
+    else:
+        os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+        os.replace(temp_path, stored_path)
+        mtime = _seal(stored_path)
+        if blob is None:
+            blob = Blob(sha256=digest, size=size, mtime=mtime, ref_count=0)
+            try:
+                with db.session.begin_nested():
+                    db.session.add(blob)
+                db.session.info.setdefault('new_blobs', []).append(stored_path)
+            except IntegrityError:
+                # Another upload of the same content registered it first.
+                blob = Blob.query.filter_by(sha256=digest).one()
+        else:
+            blob.mtime = mtime
+
+    _link(stored_path, destination)
+    _acquire(blob)
+    return blob
+
+
+def find_blob(sha256, size):
+    """Returns the stored Blob for ``sha256`` if its content is on disk, unchanged."""
+    blob = Blob.query.filter_by(sha256=sha256.lower()).first()
+    if blob is None or blob.size != size or not _intact(blob, blob_path(blob.sha256)):
+        return None
+    return blob
+
+
+def make_challenge(blob):
+    """Picks a random byte range of ``blob`` the client must hash to prove it has the file."""
+    length = min(CHALLENGE_SIZE, blob.size)
+    offset = secrets.randbelow(blob.size - length + 1) if blob.size else 0
+    return {'offset': offset, 'length': length}
+
+
+def verify_challenge(blob, challenge, proof):
+    with open(blob_path(blob.sha256), 'rb') as handle:
+        handle.seek(challenge['offset'])
+        expected = hashlib.sha256(handle.read(challenge['length'])).hexdigest()
+    return secrets.compare_digest(expected, (proof or '').lower())
+
+
+def link_blob(blob, destination):
+    """Links an existing blob at ``destination`` for a new File row. Nothing is committed."""
+    _link(blob_path(blob.sha256), destination)
+    _acquire(blob)
+
+
+def release(counts):
+    """Drops references (``{blob_id: n}``) and deletes blobs nobody uses any more.
+
+    The content goes to the trash, so it is only removed once the caller commits.
+    """
+    if not counts:
+        return
+    for blob_id, count in counts.items():
+        db.session.execute(
+            update(Blob).where(Blob.id == blob_id).values(ref_count=Blob.ref_count - count)
+        )
+    orphans = Blob.query.filter(Blob.id.in_(list(counts)), Blob.ref_count <= 0).all()
+    for blob in orphans:
+        move_to_trash(blob_path(blob.sha256))
+        db.session.delete(blob)
+
+
+@event.listens_for(Session, 'after_commit')
+def _commit_new_blobs(session):
+    session.info.pop('new_blobs', None)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _discard_new_blobs(session, transaction):
+    # Blobs registered by a transaction that rolled back have no row to find them by.
+    if transaction.parent is not None:
+        return
+    for path in session.info.pop('new_blobs', None) or []:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -1,9 +1,16 @@
 import click
-from pathlib import Path
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from flask import current_app
 from flask.cli import with_appcontext
+from sqlalchemy import insert, update
 from app import db
-from app.models import User, Role, File
+from app.models import User, Role, File, UploadSession, touch_ancestors
+
+SYNC_BATCH_SIZE = 1000
+SYNC_SNAPSHOT_CHUNK = 10000
 
 
 @click.command('init-db')
@@ -46,75 +53,308 @@ def create_admin_command(username, password):
     click.echo(f'Admin user "{username}" is ready.')
 
 
-def _sync_directory(path: Path, owner_id, parent_id=None):
-    """Ensure DB entries mirror the filesystem tree."""
-    created = 0
-    if not path.exists():
-        return created
-
-    for entry in path.iterdir():
-        if entry.is_dir():
-            folder = File.query.filter_by(
-                owner_id=owner_id,
-                parent_id=parent_id,
-                filename=entry.name,
-                is_folder=True
-            ).first()
-            if folder is None:
-                folder = File(
-                    filename=entry.name,
-                    owner_id=owner_id,
-                    parent_id=parent_id,
-                    is_folder=True
-                )
-                db.session.add(folder)
-                db.session.commit()
-                created += 1
-            created += _sync_directory(entry, owner_id, folder.id)
-        else:
-            file_record = File.query.filter_by(
-                owner_id=owner_id,
-                parent_id=parent_id,
-                filename=entry.name,
-                is_folder=False
-            ).first()
-            if file_record is None:
-                db.session.add(File(
-                    filename=entry.name,
-                    owner_id=owner_id,
-                    parent_id=parent_id,
-                    is_folder=False
+def _load_snapshot(owner_id):
+    """Existing rows of one owner keyed by ``(parent_id, filename, is_folder)``."""
+    rows = db.session.query(
+        File.id, File.parent_id, File.filename, File.is_folder, File.scanned_mtime, File.tree_path, File.full_path
+    ).filter(File.owner_id == owner_id).execution_options(yield_per=SYNC_SNAPSHOT_CHUNK)
+    snapshot = {}
+    children = defaultdict(list)
+    for row in rows:
+        key = (row.parent_id, row.filename, row.is_folder)
+        if key in snapshot:
+            continue
+        snapshot[key] = row
+        if row.is_folder:
+            children[row.parent_id].append(row)
+    return snapshot, children
+
+
+def _sync_directory(path, owner_id, incremental=False, dry_run=False, batch_size=SYNC_BATCH_SIZE):
+    """Ensure DB entries mirror the filesystem tree below a user folder.
+
+    Existing rows are loaded once into memory, directories are read with
+    ``os.scandir`` and missing rows go in with bulk INSERTs, committed every
+    ``batch_size`` files. Each synced folder row records its directory's
+    mtime in ``scanned_mtime``; with ``incremental`` a directory whose mtime still matches is not
+    listed again and only its known subfolders are visited. Returns a Counter.
+    """
+    from app.watcher import ignored_name
+
+    snapshot, children = _load_snapshot(owner_id)
+    stats = Counter()
+    new_files = []
+    scanned_folders = []
+
+    def flush():
+        if not dry_run:
+            if new_files:
+                db.session.execute(insert(File), new_files)
+                touch_ancestors({row['tree_path'] for row in new_files})
+            if scanned_folders:
+                db.session.execute(update(File), scanned_folders)
+            db.session.commit()
+        new_files.clear()
+        scanned_folders.clear()
+
+    # (disk path, folder id, tree_path of its children, its full_path, recorded mtime)
+    stack = [(path, None, '/', '', None)]
+    while stack:
+        dir_path, folder_id, child_tree_path, folder_full_path, recorded = stack.pop()
+        try:
+            dir_mtime = datetime.utcfromtimestamp(os.stat(dir_path).st_mtime)
+        except FileNotFoundError:
+            continue
+
+        if incremental and recorded is not None and recorded == dir_mtime:
+            stats['unchanged'] += 1
+            for row in children.get(folder_id, ()):
+                stack.append((
+                    os.path.join(dir_path, row.filename), row.id, f'{row.tree_path}{row.id}/', row.full_path, row.scanned_mtime
                 ))
-                created += 1
-    db.session.commit()
-    return created
+            continue
+
+        stats['scanned'] += 1
+        new_folders = []
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if ignored_name(entry.name) or entry.is_symlink():
+                        continue
+                    is_dir = entry.is_dir()
+                    row = snapshot.get((folder_id, entry.name, is_dir))
+                    if row is not None:
+                        if is_dir:
+                            stack.append((entry.path, row.id, f'{row.tree_path}{row.id}/', row.full_path, row.scanned_mtime))
+                        continue
+                    if is_dir:
+                        new_folders.append(entry.name)
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    new_files.append({
+                        'filename': entry.name,
+                        'owner_id': owner_id,
+                        'parent_id': folder_id,
+                        'is_folder': False,
+                        'tree_path': child_tree_path,
+                        'full_path': f'{folder_full_path}/{entry.name}',
+                        'size': st.st_size,
+                        'mtime': datetime.utcfromtimestamp(st.st_mtime)
+                    })
+                    stats['files'] += 1
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+        if new_folders:
+            stats['folders'] += len(new_folders)
+            if dry_run:
+                # Nothing below a folder that does not exist yet can be in the table.
+                for name in new_folders:
+                    stack.append((os.path.join(dir_path, name), ('new', dir_path, name), '/', '', None))
+            else:
+                created = db.session.execute(
+                    insert(File).returning(File.id, File.filename),
+                    [
+                        {
+                            'filename': name,
+                            'owner_id': owner_id,
+                            'parent_id': folder_id,
+                            'is_folder': True,
+                            'tree_path': child_tree_path,
+                            'full_path': f'{folder_full_path}/{name}'
+                        }
+                        for name in new_folders
+                    ]
+                )
+                touch_ancestors([child_tree_path])
+                for new_id, name in created:
+                    stack.append((
+                        os.path.join(dir_path, name), new_id, f'{child_tree_path}{new_id}/',
+                        f'{folder_full_path}/{name}', None
+                    ))
+
+        if isinstance(folder_id, int) and recorded != dir_mtime:
+            scanned_folders.append({'id': folder_id, 'scanned_mtime': dir_mtime})
+        if len(new_files) + len(scanned_folders) >= batch_size:
+            flush()
+    flush()
+    return stats
+
+
+def _user_folders(base_path):
+    """``(name, owner id, path)`` for every ``user_*`` folder; the id is None if the name is invalid."""
+    folders = []
+    with os.scandir(base_path) as entries:
+        for entry in entries:
+            if not entry.is_dir() or not entry.name.startswith('user_'):
+                continue
+            try:
+                owner_id = int(entry.name.split('_', 1)[1])
+            except (IndexError, ValueError):
+                owner_id = None
+            folders.append((entry.name, owner_id, entry.path))
+    return folders
+
+
+def _sync_owner(app, path, owner_id, **options):
+    with app.app_context():
+        return _sync_directory(path, owner_id, **options)
 
 
 @click.command('sync-uploads')
+@click.option('--incremental', is_flag=True, help='Skip directories whose mtime has not changed since the last sync.')
+@click.option('--dry-run', is_flag=True, help='Report what would be created without writing anything.')
+@click.option('--workers', default=4, show_default=True, help='User folders synchronized in parallel.')
+@click.option('--batch-size', default=SYNC_BATCH_SIZE, show_default=True, help='Rows written per transaction.')
 @with_appcontext
-def sync_uploads_command():
+def sync_uploads_command(incremental, dry_run, workers, batch_size):
     """Scan instance/uploads and create missing File entries."""
-    base_path = Path(current_app.config['UPLOAD_FOLDER'])
-    if not base_path.exists():
+    base_path = current_app.config['UPLOAD_FOLDER']
+    if not os.path.isdir(base_path):
         click.echo(f'Upload folder "{base_path}" not found.')
         return
 
-    total_created = 0
-    for entry in base_path.iterdir():
-        if not entry.is_dir() or not entry.name.startswith('user_'):
-            continue
-        try:
-            owner_id = int(entry.name.split('_', 1)[1])
-        except (IndexError, ValueError):
-            click.echo(f'Skipping folder "{entry.name}" (invalid name).')
-            continue
+    owners = []
+    for name, owner_id, path in _user_folders(base_path):
+        if owner_id is None:
+            click.echo(f'Skipping folder "{name}" (invalid name).')
+        else:
+            owners.append((owner_id, path))
 
-        user = User.query.get(owner_id)
-        if user is None:
-            click.echo(f'Skipping folder "{entry.name}" (user {owner_id} not found).')
-            continue
+    usernames = dict(
+        db.session.query(User.id, User.username).filter(User.id.in_([owner_id for owner_id, _ in owners]))
+    )
+    for owner_id, path in owners:
+        if owner_id not in usernames:
+            click.echo(f'Skipping folder "{os.path.basename(path)}" (user {owner_id} not found).')
+    owners = [(owner_id, path) for owner_id, path in owners if owner_id in usernames]
+
+    if db.engine.dialect.name == 'sqlite':
+        # SQLite takes one writer at a time; parallel syncs would only wait on each other.
+        workers = 1
+    options = {'incremental': incremental, 'dry_run': dry_run, 'batch_size': batch_size}
+    app = current_app._get_current_object()
+    totals = Counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(owners) or 1))) as executor:
+        futures = {
+            executor.submit(_sync_owner, app, path, owner_id, **options): (owner_id, path)
+            for owner_id, path in owners
+        }
+        for future in as_completed(futures):
+            owner_id, path = futures[future]
+            try:
+                stats = future.result()
+            except Exception as exc:
+                click.echo(f'Failed to synchronize {path} -> user {owner_id}: {exc}')
+                continue
+            totals.update(stats)
+            click.echo(
+                f'Synchronized {path} -> user {owner_id} ({usernames[owner_id]}): '
+                f'{stats["folders"]} folder(s), {stats["files"]} file(s), '
+                f'{stats["scanned"]} directories scanned, {stats["unchanged"]} unchanged.'
+            )
+
+    created = totals['folders'] + totals['files']
+    if dry_run:
+        click.echo(f'Dry run complete. {created} entries would be created.')
+    else:
+        click.echo(f'Synchronization complete. {created} entries created.')
+
+
+@click.command('purge-upload-sessions')
+@click.option('--max-age-hours', default=48, show_default=True, help='Remove sessions idle for longer than this.')
+@with_appcontext
+def purge_upload_sessions_command(max_age_hours):
+    """Remove abandoned resumable uploads and their staging files."""
+    from app.routes.uploads import _discard_session
+    from app.staging import purge_streams
+
+    cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for session in stale:
+        _discard_session(session)
+    db.session.commit()
+    streams = purge_streams(max_age_hours * 3600)
+    click.echo(f'{len(stale)} upload session(s) and {streams} interrupted upload stream(s) removed.')
+
+
+@click.command('purge-trash')
+@with_appcontext
+def purge_trash_command():
+    """Permanently remove deleted files waiting in the trash folder."""
+    from app.trash import purge_trash
+
+    removed = purge_trash(current_app.config['UPLOAD_FOLDER'])
+    click.echo(f'{removed} trash entr{"y" if removed == 1 else "ies"} removed.')
+
+
+@click.command('jobs-worker')
+@click.option('--processes', default=1, show_default=True, help='Worker processes running jobs in parallel.')
+@click.option('--once', is_flag=True, help='Run queued jobs until the queue is empty, then exit.')
+@with_appcontext
+def jobs_worker_command(processes, once):
+    """Run queued background jobs (archives, trash purges, syncs)."""
+    from app.jobs import run_worker, run_worker_pool
+
+    click.echo(f'Running jobs with {processes} process(es). Press Ctrl+C to stop.')
+    try:
+        if processes > 1:
+            run_worker_pool(current_app._get_current_object(), processes, once=once)
+        else:
+            run_worker(once=once)
+    except KeyboardInterrupt:
+        click.echo('Worker stopped.')
+
+
+@click.command('watch-uploads')
+@click.option('--settle', type=float, default=None, help='Seconds a directory must be quiet before it is reconciled.')
+@click.option('--once', is_flag=True, help='Reconcile the whole upload folder once and exit.')
+@with_appcontext
+def watch_uploads_command(settle, once):
+    """Keep the files table in sync with the upload folder using inotify."""
+    from app.watcher import UploadWatcher
+
+    if settle is None:
+        settle = current_app.config['UPLOAD_WATCHER_SETTLE']
+    watcher = UploadWatcher(current_app.config['UPLOAD_FOLDER'], settle=settle)
+    click.echo(f'Watching {watcher.root} (settle={settle}s). Press Ctrl+C to stop.' if not once else f'Reconciling {watcher.root}.')
+    try:
+        watcher.run(once=once)
+    except KeyboardInterrupt:
+        click.echo('Watcher stopped.')
+
+
+@click.command('backfill-metadata')
+@click.option('--no-checksum', is_flag=True, help='Only record size and mtime; skip hashing file contents.')
+@click.option('--batch-size', default=500, show_default=True, help='Rows updated per transaction.')
+@with_appcontext
+def backfill_metadata_command(no_checksum, batch_size):
+    """Fill in size, mtime and checksum for files stored before they were tracked."""
+    from app.blobs import file_sha256
+    from app.routes.files import _file_disk_path
 
-        click.echo(f'Synchronizing {entry} -> user {owner_id} ({user.username})')
-        total_created += _sync_directory(entry, owner_id)
+    missing = File.checksum.is_(None) if not no_checksum else File.size.is_(None)
+    last_id = 0
+    updated = skipped = 0
+    while True:
+        batch = File.query.filter(
+            File.is_folder.is_(False), missing, File.id > last_id
+        ).order_by(File.id).limit(batch_size).all()
+        if not batch:
+            break
+        for file_obj in batch:
+            path = _file_disk_path(file_obj)
+            try:
+                st = os.stat(path)
+                file_obj.size = st.st_size
+                file_obj.mtime = datetime.utcfromtimestamp(st.st_mtime)
+                if not no_checksum:
+                    file_obj.checksum = file_sha256(path)
+                updated += 1
+            except OSError:
+                skipped += 1
+        last_id = batch[-1].id
+        db.session.commit()
+        click.echo(f'{updated} updated, {skipped} missing on disk (up to id {last_id}).')
 
-    click.echo(f'Synchronization complete. {total_created} entries created.')
+    click.echo(f'Backfill complete. {updated} file(s) updated, {skipped} missing on disk.')
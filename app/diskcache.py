@@ -0,0 +1,112 @@
+"""Size-bounded on-disk cache for generated files.
+
+Entries are files named after their key under ``folder/<key[:2]>/``. A hit
+touches the entry's mtime, so mtime order is least-recently-used order, and
+once the cache outgrows its byte budget the oldest entries are removed until
+it fits again. Entries are written to a temporary name and renamed in
+place only when complete, so readers never see a partial file; several
+processes can share one folder.
+
+Each instance keeps a running total of what it wrote and only walks the
+folder to evict when that total passes the budget (or every
+``RESCAN_EVERY`` writes, to account for other processes), so the budget is
+approximate but adding an entry stays cheap.
+"""
+import os
+import threading
+import uuid
+
+TEMP_SUFFIX = '.tmp'
+RESCAN_EVERY = 256
+
+
+class DiskCache:
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+        self._size = None
+        self._writes = 0
+
+    def path_for(self, key):
+        return os.path.join(self.folder, key[:2], key)
+
+    def get(self, key):
+        """Returns the path of the entry for ``key`` and marks it used, or None."""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def tee(self, key, chunks):
+        """Yields ``chunks`` unchanged while storing them as the entry for ``key``.
+
+        The entry is only kept if the iterator is consumed to the end; a
+        client that disconnects halfway leaves nothing behind.
+        """
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{uuid.uuid4().hex}{TEMP_SUFFIX}'
+        handle = open(temp_path, 'wb')
+        try:
+            for chunk in chunks:
+                handle.write(chunk)
+                yield chunk
+            size = handle.tell()
+            handle.close()
+            os.replace(temp_path, path)
+        finally:
+            if not handle.closed:
+                handle.close()
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+        self._added(size)
+
+    def put(self, key, data):
+        """Stores ``data`` as the entry for ``key`` and returns its path."""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{uuid.uuid4().hex}{TEMP_SUFFIX}'
+        with open(temp_path, 'wb') as handle:
+            handle.write(data)
+        os.replace(temp_path, path)
+        self._added(len(data))
+        return path
+
+    def _added(self, size):
+        self._writes += 1
+        if self._size is not None:
+            self._size += size
+        if self._size is None or self._size > self.max_bytes or self._writes % RESCAN_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits ``max_bytes``."""
+        with self._evict_lock:
+            entries = []
+            total = 0
+            for directory, _dirs, files in os.walk(self.folder):
+                for name in files:
+                    if name.endswith(TEMP_SUFFIX):
+                        continue
+                    path = os.path.join(directory, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+            entries.sort()
+            for _mtime, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._size = total
@@ -0,0 +1,279 @@
+"""Background jobs backed by the ``jobs`` table.
+
+Requests queue long operations with :func:`enqueue` and answer with the job
+id right away; ``flask jobs-worker`` runs them in one or more worker
+processes. A worker claims a job with a conditional UPDATE from ``queued``
+to ``running``, so several workers can poll the same table without a broker
+or row locks. Handlers report progress into the job row, which clients poll
+at ``/api/jobs/<id>``, and files they produce are kept in
+``JOB_ARTIFACT_FOLDER`` until ``JOB_ARTIFACT_TTL`` runs out.
+"""
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import func, update
+
+from app import db
+from app.models import File, Job, User
+
+PROGRESS_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = 30
+# A running job whose heartbeat is this old lost its worker.
+STALE_AFTER = timedelta(minutes=5)
+MAINTENANCE_INTERVAL = 300
+
+_handlers = {}
+
+
+def handler(kind):
+    """Registers ``handle(job, params, progress)`` as the handler for ``kind``.
+
+    It may return a dict with ``artifact_path``, ``artifact_name`` and
+    ``message`` to store on the finished job.
+    """
+    def register(handle):
+        _handlers[kind] = handle
+        return handle
+    return register
+
+
+def enqueue(kind, user_id=None, **params):
+    """Queues a job. Nothing is committed."""
+    if kind not in _handlers:
+        raise ValueError(f'Unknown job kind "{kind}"')
+    job = Job(kind=kind, user_id=user_id, params=json.dumps(params), status='queued', progress_done=0)
+    db.session.add(job)
+    return job
+
+
+def artifact_folder():
+    folder = current_app.config['JOB_ARTIFACT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def remove_jobs(criterion):
+    """Deletes the jobs matching ``criterion`` and their artifacts. Nothing is committed."""
+    for job in Job.query.filter(criterion):
+        if job.artifact_path:
+            try:
+                os.remove(job.artifact_path)
+            except FileNotFoundError:
+                pass
+        db.session.delete(job)
+
+
+class Progress:
+    """Passed to handlers to record progress; writes at most once per PROGRESS_INTERVAL."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._last = 0.0
+
+    def __call__(self, done, total=None, message=None, force=False):
+        now = time.monotonic()
+        if not force and now - self._last < PROGRESS_INTERVAL:
+            return
+        self._last = now
+        values = {'progress_done': done, 'updated_at': datetime.utcnow()}
+        if total is not None:
+            values['progress_total'] = total
+        if message is not None:
+            values['message'] = message
+        db.session.execute(update(Job).where(Job.id == self.job_id).values(**values))
+        db.session.commit()
+
+
+class _Heartbeat(threading.Thread):
+    """Keeps ``updated_at`` fresh while a handler runs, so stale jobs can be told apart."""
+
+    def __init__(self, app, job_id):
+        super().__init__(name=f'job-heartbeat-{job_id}', daemon=True)
+        self.app = app
+        self.job_id = job_id
+        self.stopped = threading.Event()
+
+    def run(self):
+        with self.app.app_context():
+            while not self.stopped.wait(HEARTBEAT_INTERVAL):
+                try:
+                    db.session.execute(
+                        update(Job)
+                        .where(Job.id == self.job_id, Job.status == 'running')
+                        .values(updated_at=datetime.utcnow())
+                    )
+                    db.session.commit()
+                except Exception as exc:
+                    db.session.rollback()
+                    self.app.logger.warning('Job %s heartbeat failed: %s', self.job_id, exc)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def claim_next(worker):
+    """Marks the oldest queued job as running for ``worker`` and returns it, or None."""
+    while True:
+        job_id = db.session.query(Job.id).filter(Job.status == 'queued').order_by(Job.created_at).limit(1).scalar()
+        if job_id is None:
+            return None
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', worker=worker, started_at=now, updated_at=now)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+
+
+def _finish(job_id, **values):
+    values.setdefault('finished_at', datetime.utcnow())
+    values['updated_at'] = values['finished_at']
+    db.session.execute(update(Job).where(Job.id == job_id).values(**values))
+    db.session.commit()
+
+
+def run_job(job):
+    app = current_app._get_current_object()
+    job_id, kind = job.id, job.kind
+    job_handler = _handlers.get(kind)
+    heartbeat = _Heartbeat(app, job_id)
+    heartbeat.start()
+    try:
+        if job_handler is None:
+            raise LookupError(f'No handler for job kind "{kind}"')
+        result = job_handler(job, json.loads(job.params or '{}'), Progress(job_id)) or {}
+    except Exception as exc:
+        db.session.rollback()
+        app.logger.exception('Job %s (%s) failed: %s', job_id, kind, exc)
+        _finish(job_id, status='failed', error=str(exc) or exc.__class__.__name__)
+    else:
+        app.logger.info('Job %s (%s) finished', job_id, kind)
+        _finish(
+            job_id,
+            status='done',
+            progress_done=func.coalesce(Job.progress_total, Job.progress_done),
+            message=result.get('message'),
+            artifact_path=result.get('artifact_path'),
+            artifact_name=result.get('artifact_name')
+        )
+    finally:
+        heartbeat.stop()
+
+
+def maintain():
+    """Fails jobs whose worker died and drops finished jobs past JOB_ARTIFACT_TTL."""
+    now = datetime.utcnow()
+    db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.updated_at < now - STALE_AFTER)
+        .values(status='failed', error='Worker stopped responding', finished_at=now, updated_at=now)
+    )
+    ttl = timedelta(seconds=current_app.config['JOB_ARTIFACT_TTL'])
+    remove_jobs(Job.status.in_(('done', 'failed')) & (Job.finished_at < now - ttl))
+    db.session.commit()
+
+
+def run_worker(once=False):
+    """Runs queued jobs one after another; with ``once``, returns when the queue is empty."""
+    worker = f'{socket.gethostname()}:{os.getpid()}'[:64]
+    poll = current_app.config['JOB_POLL_INTERVAL']
+    last_maintenance = None
+    while True:
+        if last_maintenance is None or time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+            maintain()
+            last_maintenance = time.monotonic()
+        job = claim_next(worker)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll)
+            continue
+        current_app.logger.info('Worker %s running job %s (%s)', worker, job.id, job.kind)
+        run_job(job)
+
+
+def _worker_process(app, once):
+    with app.app_context():
+        # Connections inherited through fork must not be shared with the parent.
+        db.engine.dispose(close=False)
+        run_worker(once=once)
+
+
+def run_worker_pool(app, processes, once=False):
+    """Runs ``processes`` worker processes until they exit or the pool is interrupted."""
+    context = multiprocessing.get_context('fork')
+    children = [
+        context.Process(target=_worker_process, args=(app, once), name=f'jobs-worker-{index}')
+        for index in range(processes)
+    ]
+    db.engine.dispose()
+    for child in children:
+        child.start()
+    try:
+        for child in children:
+            child.join()
+    finally:
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+                child.join()
+
+
+@handler('archive')
+def _archive_job(job, params, progress):
+    from app.routes.files import _archive_members, _stream_archive
+
+    files = File.query.filter(File.id.in_(params.get('file_ids') or [])).all()
+    if not files:
+        raise LookupError('Nothing left to archive')
+    members = list(chain.from_iterable(_archive_members(file_obj) for file_obj in files))
+    total = len(members)
+    progress(0, total, force=True)
+
+    def counted():
+        for index, member in enumerate(members, 1):
+            yield member
+            progress(index)
+
+    path = os.path.join(artifact_folder(), f'{job.id}.zip')
+    with open(path + '.part', 'wb') as handle:
+        for chunk in _stream_archive(counted()):
+            handle.write(chunk)
+    os.replace(path + '.part', path)
+    return {'artifact_path': path, 'artifact_name': params.get('name') or 'files.zip'}
+
+
+@handler('purge_trash')
+def _purge_trash_job(job, params, progress):
+    from app.trash import purge_trash
+
+    removed = purge_trash(current_app.config['UPLOAD_FOLDER'])
+    return {'message': f'{removed} trash entries removed'}
+
+
+@handler('sync_uploads')
+def _sync_uploads_job(job, params, progress):
+    from app.cli import _sync_directory, _user_folders
+
+    owners = [(owner_id, path) for _name, owner_id, path in _user_folders(current_app.config['UPLOAD_FOLDER'])
+              if owner_id is not None]
+    created = 0
+    progress(0, len(owners), force=True)
+    for index, (owner_id, path) in enumerate(owners, 1):
+        if db.session.get(User, owner_id) is None:
+            continue
+        stats = _sync_directory(path, owner_id, incremental=bool(params.get('incremental')))
+        created += stats['folders'] + stats['files']
+        progress(index, message=f'{created} entries created')
+    return {'message': f'{created} entries created'}
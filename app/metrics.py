@@ -0,0 +1,172 @@
+"""Prometheus metrics, served as text at ``/metrics``.
+
+Every request is timed per endpoint and counted by status, with a gauge of
+requests in flight and a histogram of how many SQL statements it ran.
+Uploads, downloads and ZIP builds add their byte counts and build times.
+Recording is a few dict lookups and atomic adds per request, so it can stay
+on in production.
+
+``prometheus_client`` is optional: without it, or with METRICS_ENABLED off,
+nothing is recorded and ``/metrics`` is not registered. Under gunicorn with
+several workers, point ``PROMETHEUS_MULTIPROC_DIR`` at an empty directory so
+the workers' values are aggregated (see the README).
+"""
+import hmac
+import os
+import time
+
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+except ImportError:  # pragma: no cover - optional dependency
+    Counter = None
+
+# Responses whose body counts as downloaded bytes.
+DOWNLOAD_ENDPOINTS = frozenset({
+    'files.download_file',
+    'files.download_bulk',
+    'files.file_thumbnail',
+    'jobs.get_job_artifact',
+})
+UNTRACKED_ENDPOINTS = frozenset({'static', 'metrics'})
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+ZIP_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+if Counter is not None:
+    REQUEST_LATENCY = Histogram(
+        'fileserv_http_request_duration_seconds', 'Time spent handling a request.', ['endpoint', 'method']
+    )
+    REQUESTS = Counter('fileserv_http_requests', 'Requests handled.', ['endpoint', 'method', 'status'])
+    IN_FLIGHT = Gauge(
+        'fileserv_http_requests_in_flight', 'Requests being handled.', ['endpoint'], multiprocess_mode='livesum'
+    )
+    REQUEST_QUERIES = Histogram(
+        'fileserv_db_queries_per_request', 'SQL statements run by one request.', ['endpoint'],
+        buckets=QUERY_BUCKETS
+    )
+    QUERIES = Counter('fileserv_db_queries', 'SQL statements run while handling requests.', ['endpoint'])
+    UPLOADED_BYTES = Counter('fileserv_uploaded_bytes', 'Bytes received in uploads.')
+    DOWNLOADED_BYTES = Counter('fileserv_downloaded_bytes', 'Bytes sent in downloads.', ['endpoint'])
+    ZIP_SECONDS = Histogram('fileserv_zip_build_seconds', 'Time to build a ZIP archive.', buckets=ZIP_BUCKETS)
+    ZIP_BYTES = Counter('fileserv_zip_bytes', 'Bytes of ZIP archives built.')
+
+
+def metrics_enabled():
+    return Counter is not None and current_app.config['METRICS_ENABLED']
+
+
+def init_app(app):
+    if not app.config['METRICS_ENABLED']:
+        return
+    if Counter is None:
+        app.logger.warning('METRICS_ENABLED is set but prometheus_client is not installed; metrics are off.')
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_response)
+    app.teardown_request(_end_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _start_request():
+    endpoint = _endpoint()
+    if endpoint in UNTRACKED_ENDPOINTS:
+        return
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    IN_FLIGHT.labels(endpoint).inc()
+
+
+def _finish_response(response):
+    if 'metrics_start' not in g:
+        return response
+    g.metrics_status = response.status_code
+    endpoint = _endpoint()
+    if endpoint in DOWNLOAD_ENDPOINTS and response.status_code in (200, 206):
+        if response.content_length is not None and not response.headers.get('X-Accel-Redirect'):
+            DOWNLOADED_BYTES.labels(endpoint).inc(response.content_length)
+        elif response.is_streamed:
+            response.response = _count_sent(response.response, DOWNLOADED_BYTES.labels(endpoint))
+    return response
+
+
+def _end_request(exc):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    endpoint = _endpoint()
+    method = request.method
+    status = g.pop('metrics_status', 500 if exc is not None else 200)
+    queries = g.pop('metrics_queries', 0)
+    REQUEST_LATENCY.labels(endpoint, method).observe(time.perf_counter() - start)
+    REQUESTS.labels(endpoint, method, str(status)).inc()
+    IN_FLIGHT.labels(endpoint).dec()
+    REQUEST_QUERIES.labels(endpoint).observe(queries)
+    QUERIES.labels(endpoint).inc(queries)
+
+
+def _count_sent(chunks, counter):
+    try:
+        for chunk in chunks:
+            counter.inc(len(chunk))
+            yield chunk
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_queries' in g:
+        g.metrics_queries += 1
+
+
+def count_upload(nbytes):
+    if nbytes and metrics_enabled():
+        UPLOADED_BYTES.inc(nbytes)
+
+
+def timed_zip(chunks):
+    """Wraps an archive's chunks to record how long it took to build and its size."""
+    if not metrics_enabled():
+        return chunks
+    return _timed_zip(chunks)
+
+
+def _timed_zip(chunks):
+    start = time.perf_counter()
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    ZIP_SECONDS.observe(time.perf_counter() - start)
+    ZIP_BYTES.inc(size)
+
+
+def metrics_view():
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -1,6 +1,10 @@
 from app import db, login, pwd_context
 from flask_login import UserMixin
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session
 from datetime import datetime
+from itertools import chain
+import uuid
 
 class Permission:
     VIEW = 1
@@ -53,6 +57,8 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(64), index=True, unique=True)
     password_hash = db.Column(db.String(128))
     role_id = db.Column(db.Integer, db.ForeignKey('roles.id'))
+    # Bumped whenever this user's file grants change; see app.permissions.
+    permissions_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     files = db.relationship('File', backref='owner', lazy='dynamic')
     
     permissions = db.relationship('UserFilePermission', back_populates='user', lazy='dynamic')
@@ -88,24 +94,103 @@ class User(UserMixin, db.Model):
 
 class File(db.Model):
     __tablename__ = 'files'
+    __table_args__ = (
+        db.Index('ix_files_tree_path', 'tree_path', postgresql_ops={'tree_path': 'text_pattern_ops'}),
+        # Keyset pagination of folder listings (see list_files).
+        db.Index('ix_files_parent_name', 'parent_id', 'is_folder', func.lower(db.text('filename')), 'id'),
+        db.Index('ix_files_parent_created', 'parent_id', 'is_folder', 'created_at', 'id'),
+        db.Index('ix_files_owner_parent', 'owner_id', 'parent_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     is_folder = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     parent_id = db.Column(db.Integer, db.ForeignKey('files.id'), nullable=True)
+    # Materialized ancestry: ids of every ancestor from the root down, e.g.
+    # '/3/17/' for an entry inside folder 17, which lives in root folder 3.
+    tree_path = db.Column(db.Text, nullable=False, default='/')
+    # Names from the owner's root down, e.g. '/Projects/2025/report.pdf'.
+    # Searched by /api/search; on PostgreSQL it has a trigram index
+    # (ix_files_full_path_trgm, created by its migration).
+    full_path = db.Column(db.Text, nullable=True)
+    # Set when the content lives in the blob store (see app.blobs).
+    blob_id = db.Column(db.Integer, db.ForeignKey('blobs.id'), nullable=True, index=True)
+    # Content metadata, recorded at upload time so listings and downloads do
+    # not need to stat or read the file. NULL for folders.
+    size = db.Column(db.BigInteger, nullable=True)
+    mtime = db.Column(db.DateTime, nullable=True)
+    checksum = db.Column(db.String(64), nullable=True)
+    # Folders only: directory mtime seen by the last ``flask sync-uploads``,
+    # which skips the directory with --incremental while it still matches.
+    scanned_mtime = db.Column(db.DateTime, nullable=True)
+    # Bumped on a folder whenever anything below it is added, removed, moved
+    # or changed (see touch_ancestors); folder ZIPs are cached by it.
+    generation = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     children = db.relationship('File', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
 
     permissions = db.relationship('UserFilePermission', back_populates='file', lazy='dynamic')
 
+    @property
+    def subtree_prefix(self):
+        """The ``tree_path`` prefix shared by every descendant of this entry."""
+        return f'{self.tree_path}{self.id}/'
+
+    def ancestor_ids(self):
+        """Returns the ids of the ancestors, root first."""
+        return [int(part) for part in self.tree_path.split('/') if part]
+
+    def get_ancestors(self):
+        """Returns the ancestors, root first.
+
+        Ancestors already in the session are reused; the rest are loaded with
+        a single query, so walking up the tree never costs one query per level.
+        """
+        ids = self.ancestor_ids()
+        if not ids:
+            return []
+        found = {}
+        for ancestor_id in ids:
+            ancestor = db.session.identity_map.get(db.session.identity_key(File, ancestor_id))
+            if ancestor is not None:
+                found[ancestor_id] = ancestor
+        missing = [ancestor_id for ancestor_id in ids if ancestor_id not in found]
+        if missing:
+            for ancestor in File.query.filter(File.id.in_(missing)):
+                found[ancestor.id] = ancestor
+        return [found[ancestor_id] for ancestor_id in ids if ancestor_id in found]
+
+    def descendants(self):
+        """Query over the whole subtree below this entry."""
+        return File.query.filter(File.tree_path.like(self.subtree_prefix + '%'))
+
+    def move_to(self, new_parent, filename=None):
+        """Re-parents (and optionally renames) this entry, rewriting its
+        subtree's ``tree_path`` and ``full_path`` in one UPDATE."""
+        if new_parent is not None and (new_parent.id == self.id or self.id in new_parent.ancestor_ids()):
+            raise ValueError('Cannot move an entry into its own subtree')
+        old_prefix = self.subtree_prefix
+        old_full_path = self.get_full_path()
+        self.parent = new_parent
+        if filename is not None:
+            self.filename = filename
+        self.tree_path = new_parent.subtree_prefix if new_parent is not None else '/'
+        self.full_path = (new_parent.get_full_path() if new_parent is not None else '') + '/' + self.filename
+        File.query.filter(File.tree_path.like(old_prefix + '%')).update(
+            {
+                File.tree_path: self.subtree_prefix + func.substr(File.tree_path, len(old_prefix) + 1),
+                File.full_path: self.full_path + func.substr(File.full_path, len(old_full_path) + 1)
+            },
+            synchronize_session=False
+        )
+
     def get_full_path(self):
         """Returns a unix-like representation of the folder hierarchy."""
-        parts = [self.filename]
-        parent = self.parent
-        while parent is not None:
-            parts.append(parent.filename)
-            parent = parent.parent
-        return '/' + '/'.join(reversed(parts))
+        if self.full_path is not None:
+            return self.full_path
+        parts = [ancestor.filename for ancestor in self.get_ancestors()]
+        parts.append(self.filename)
+        return '/' + '/'.join(parts)
 
     def to_dict(self):
         return {
@@ -113,11 +198,172 @@ class File(db.Model):
             'filename': self.filename,
             'is_folder': self.is_folder,
             'created_at': self.created_at.isoformat() + 'Z',
-            'parent_id': self.parent_id
+            'parent_id': self.parent_id,
+            'size': self.size,
+            'mtime': self.mtime.isoformat() + 'Z' if self.mtime else None,
+            'checksum': self.checksum
         }
 
+
+@event.listens_for(File, 'before_insert')
+def _assign_tree_path(mapper, connection, target):
+    parent = target.__dict__.get('parent')
+    parent_id = parent.id if parent is not None else target.parent_id
+    if parent_id is None:
+        target.tree_path = '/'
+        target.full_path = '/' + target.filename
+        return
+    parent_path = parent.__dict__.get('tree_path') if parent is not None else None
+    parent_full_path = parent.__dict__.get('full_path') if parent is not None else None
+    if parent_path is None or parent_full_path is None:
+        parent_path, parent_full_path = connection.execute(
+            select(File.tree_path, File.full_path).where(File.id == parent_id)
+        ).one()
+    target.tree_path = f'{parent_path}{parent_id}/'
+    target.full_path = f'{parent_full_path}/{target.filename}'
+
+
+def touch_ancestors(tree_paths, connection=None):
+    """Bumps ``generation`` on every folder named in ``tree_paths`` - the
+    ancestors of the entries that changed. Nothing is committed."""
+    folder_ids = sorted({int(part) for tree_path in tree_paths if tree_path for part in tree_path.split('/') if part})
+    files = File.__table__
+    for start in range(0, len(folder_ids), 500):
+        (connection or db.session).execute(
+            update(files)
+            .where(files.c.id.in_(folder_ids[start:start + 500]))
+            .values(generation=files.c.generation + 1)
+        )
+
+
+@event.listens_for(Session, 'after_flush')
+def _touch_changed_folders(session, flush_context):
+    # Bulk INSERT/DELETE statements skip this; their callers touch_ancestors() themselves.
+    tree_paths = set()
+    for target in chain(session.new, session.deleted):
+        if isinstance(target, File):
+            tree_paths.add(target.tree_path)
+    for target in session.dirty:
+        if isinstance(target, File) and session.is_modified(target, include_collections=False):
+            tree_paths.add(target.tree_path)
+            tree_paths.update(inspect(target).attrs.tree_path.history.deleted or ())
+    if tree_paths:
+        touch_ancestors(tree_paths, session.connection())
+
+class Blob(db.Model):
+    """Content stored once under UPLOAD_FOLDER/.blobs, shared by every File
+    whose bytes hash to the same SHA-256."""
+    __tablename__ = 'blobs'
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, unique=True, index=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    # mtime of the stored copy when it was sealed; a mismatch means it was
+    # changed on disk through one of its links.
+    mtime = db.Column(db.DateTime, nullable=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class SharedFile(db.Model):
     __tablename__ = 'shared_files'
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     file_id = db.Column(db.Integer, db.ForeignKey('files.id'), primary_key=True)
     permission = db.Column(db.Integer, nullable=False)
+
+
+class UploadSession(db.Model):
+    """A resumable upload whose chunks are written into a staging file."""
+    __tablename__ = 'upload_sessions'
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Not a foreign key: the destination folder is re-validated on completion and
+    # must stay deletable while uploads into it are pending.
+    parent_id = db.Column(db.Integer, nullable=True)
+    filename = db.Column(db.String(255), nullable=False)
+    relative_path = db.Column(db.Text, nullable=True)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    chunks = db.relationship('UploadChunk', backref='session', lazy='dynamic', cascade='all, delete-orphan')
+
+    @property
+    def total_chunks(self):
+        return -(-self.total_size // self.chunk_size)
+
+    def chunk_length(self, index):
+        return min(self.chunk_size, self.total_size - index * self.chunk_size)
+
+    def received_indexes(self):
+        return [row.index for row in self.chunks.order_by(UploadChunk.index)]
+
+    def received_ranges(self):
+        """Returns the received bytes as a list of ``[start, end)`` ranges."""
+        ranges = []
+        for index in self.received_indexes():
+            start = index * self.chunk_size
+            end = start + self.chunk_length(index)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        return ranges
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'parent_id': self.parent_id,
+            'relative_path': self.relative_path,
+            'total_size': self.total_size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'received': self.received_ranges()
+        }
+
+
+class UploadChunk(db.Model):
+    __tablename__ = 'upload_chunks'
+    session_id = db.Column(db.String(32), db.ForeignKey('upload_sessions.id'), primary_key=True)
+    index = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+
+class Job(db.Model):
+    """A long-running task queued for `flask jobs-worker` (see app/jobs.py)."""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_created', 'status', 'created_at'),
+    )
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    kind = db.Column(db.String(32), nullable=False)
+    # Null for jobs queued by an administrator task rather than a user request.
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(16), nullable=False, default='queued')
+    progress_done = db.Column(db.BigInteger, nullable=False, default=0)
+    progress_total = db.Column(db.BigInteger, nullable=True)
+    message = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    artifact_path = db.Column(db.Text, nullable=True)
+    artifact_name = db.Column(db.String(255), nullable=True)
+    worker = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': {'done': self.progress_done, 'total': self.progress_total},
+            'message': self.message,
+            'error': self.error,
+            'artifact': self.artifact_name if self.status == 'done' and self.artifact_path else None,
+            'created_at': self.created_at.isoformat() + 'Z',
+            'started_at': self.started_at.isoformat() + 'Z' if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() + 'Z' if self.finished_at else None
+        }
@@ -0,0 +1,144 @@
+"""Per-user index of effective file permissions.
+
+A grant in ``user_file_permissions`` covers an entry and everything below it.
+The index keeps a user's grants as two id sets, so deciding whether an entry
+is readable or writable is a set lookup over the entry's own id and the
+ancestor ids stored in ``File.tree_path`` - no rows are loaded and no tree is
+walked.
+
+Indexes are cached per process and tagged with ``User.permissions_version``.
+Anything that changes a user's grants calls :func:`invalidate` in the same
+transaction, which bumps that version. The user row is already loaded on every
+request, so checking the cache costs no query and stays correct across worker
+processes.
+
+:func:`apply_changes` is the one place grants are written: it diffs the
+requested state against the stored rows and only inserts, updates or deletes
+what differs, invalidating just the users whose rows changed.
+"""
+from threading import Lock
+
+from sqlalchemy import delete, insert, tuple_, update
+
+from app import db
+from app.models import User, UserFilePermission
+
+MAX_CACHED_USERS = 1024
+PAIR_CHUNK_SIZE = 500
+GRANT_ACTIONS = ('grant', 'revoke', 'set')
+
+_cache = {}
+_cache_lock = Lock()
+
+
+class PermissionIndex:
+    """Ids of the entries a user was granted read or write access to."""
+
+    __slots__ = ('readable', 'writable')
+
+    def __init__(self, grants):
+        self.readable = frozenset(file_id for file_id, can_read, can_write in grants if can_read or can_write)
+        self.writable = frozenset(file_id for file_id, _can_read, can_write in grants if can_write)
+
+    def allows(self, file_obj, require_write=False):
+        granted = self.writable if require_write else self.readable
+        if not granted:
+            return False
+        return file_obj.id in granted or not granted.isdisjoint(file_obj.ancestor_ids())
+
+
+def get_permission_index(user):
+    """Returns the cached :class:`PermissionIndex` for ``user``, rebuilding it if stale."""
+    version = user.permissions_version
+    cached = _cache.get(user.id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    grants = db.session.query(
+        UserFilePermission.file_id, UserFilePermission.can_read, UserFilePermission.can_write
+    ).filter(UserFilePermission.user_id == user.id).all()
+    index = PermissionIndex(grants)
+    with _cache_lock:
+        if user.id not in _cache and len(_cache) >= MAX_CACHED_USERS:
+            _cache.pop(next(iter(_cache)))
+        _cache[user.id] = (version, index)
+    return index
+
+
+def invalidate(user_ids):
+    """Marks the cached indexes of ``user_ids`` stale. Nothing is committed."""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        db.session.execute(
+            update(User)
+            .where(User.id.in_(user_ids))
+            .values(permissions_version=User.permissions_version + 1)
+        )
+
+
+def _stored_grants(pairs):
+    stored = {}
+    for start in range(0, len(pairs), PAIR_CHUNK_SIZE):
+        chunk = pairs[start:start + PAIR_CHUNK_SIZE]
+        rows = db.session.query(
+            UserFilePermission.user_id, UserFilePermission.file_id,
+            UserFilePermission.can_read, UserFilePermission.can_write
+        ).filter(tuple_(UserFilePermission.user_id, UserFilePermission.file_id).in_(chunk))
+        for user_id, file_id, can_read, can_write in rows:
+            stored[(user_id, file_id)] = (bool(can_read), bool(can_write))
+    return stored
+
+
+def apply_changes(changes):
+    """Applies grant changes and writes only the rows whose flags differ. Nothing is committed.
+
+    ``changes`` is a sequence of ``(action, user_ids, file_ids, can_read,
+    can_write)`` applied in order to every user x file pair: ``grant`` adds
+    the given flags, ``revoke`` clears them and ``set`` replaces both. A pair
+    left with neither flag has its row deleted. Returns the number of rows
+    created, updated and deleted.
+    """
+    pairs = list(dict.fromkeys(
+        (user_id, file_id)
+        for _action, user_ids, file_ids, _can_read, _can_write in changes
+        for user_id in user_ids
+        for file_id in file_ids
+    ))
+    stored = _stored_grants(pairs)
+    state = dict(stored)
+    for action, user_ids, file_ids, can_read, can_write in changes:
+        for user_id in user_ids:
+            for file_id in file_ids:
+                current = state.get((user_id, file_id), (False, False))
+                if action == 'grant':
+                    state[(user_id, file_id)] = (current[0] or can_read, current[1] or can_write)
+                elif action == 'revoke':
+                    state[(user_id, file_id)] = (current[0] and not can_read, current[1] and not can_write)
+                else:
+                    state[(user_id, file_id)] = (can_read, can_write)
+
+    created, updated, deleted = [], [], []
+    for pair, flags in state.items():
+        previous = stored.get(pair)
+        if flags == (False, False):
+            if previous is not None:
+                deleted.append(pair)
+        elif previous is None:
+            created.append({'user_id': pair[0], 'file_id': pair[1], 'can_read': flags[0], 'can_write': flags[1]})
+        elif previous != flags:
+            updated.append({'user_id': pair[0], 'file_id': pair[1], 'can_read': flags[0], 'can_write': flags[1]})
+
+    if created:
+        db.session.execute(insert(UserFilePermission), created)
+    if updated:
+        db.session.execute(update(UserFilePermission), updated)
+    for start in range(0, len(deleted), PAIR_CHUNK_SIZE):
+        db.session.execute(
+            delete(UserFilePermission)
+            .where(tuple_(UserFilePermission.user_id, UserFilePermission.file_id).in_(deleted[start:start + PAIR_CHUNK_SIZE]))
+            .execution_options(synchronize_session=False)
+        )
+    invalidate(
+        {row['user_id'] for row in created} | {row['user_id'] for row in updated} | {user_id for user_id, _ in deleted}
+    )
+    return {'created': len(created), 'updated': len(updated), 'deleted': len(deleted)}
@@ -0,0 +1,131 @@
+"""Opt-in SQL profiling of requests.
+
+With SQL_PROFILING on, or when an admin sends the ``X-Profile-SQL`` header,
+every statement a request runs is recorded with its duration and the line
+in ``app/`` that issued it. After the request a summary is logged and, for
+admins only, returned in the ``X-SQL-Profile`` and ``Server-Timing``
+headers, as call sites and timings are not for everyone to see. The same
+statement issued at least SQL_PROFILING_REPEAT_THRESHOLD times from one call
+site is reported as a likely N+1 (a lazy load or lookup inside a loop).
+
+Statements run while a streamed response body is sent are not included.
+"""
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+
+from flask import current_app, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILE_HEADER = 'X-Profile-SQL'
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(APP_ROOT)
+THIS_FILE = os.path.abspath(__file__)
+REPORTED_GROUPS = 5
+STATEMENT_PREVIEW = 160
+# Expanded IN lists differ only in their number of placeholders.
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*\)')
+
+
+def init_app(app):
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+
+
+def _wants_profile():
+    if current_app.config['SQL_PROFILING']:
+        return True
+    if not request.headers.get(PROFILE_HEADER):
+        return False
+    return current_user.is_authenticated and current_user.is_admin()
+
+
+def _start_profile():
+    if _wants_profile():
+        g.sql_profile = []
+
+
+def _call_site():
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_ROOT) and filename != THIS_FILE:
+            return f'{os.path.relpath(filename, PROJECT_ROOT)}:{frame.f_lineno} ({frame.f_code.co_name})'
+        frame = frame.f_back
+    return '<outside app>'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_profile' in g:
+        conn.info.setdefault('sql_profile_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('sql_profile_start')
+    if not starts or not has_request_context() or 'sql_profile' not in g:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    g.sql_profile.append((_PLACEHOLDER_LIST.sub('(...)', statement), elapsed, _call_site()))
+
+
+def summarize(records, repeat_threshold):
+    """Groups ``(statement, seconds, call_site)`` records by call site and statement.
+
+    Returns ``(total_seconds, groups, repeated)``; each group is
+    ``(count, seconds, call_site, statement)``, slowest first, and
+    ``repeated`` holds the groups that reach ``repeat_threshold``.
+    """
+    grouped = defaultdict(lambda: [0, 0.0])
+    for statement, elapsed, site in records:
+        group = grouped[(site, statement)]
+        group[0] += 1
+        group[1] += elapsed
+    groups = sorted(
+        ((count, seconds, site, statement) for (site, statement), (count, seconds) in grouped.items()),
+        key=lambda group: group[1],
+        reverse=True
+    )
+    repeated = [group for group in groups if group[0] >= repeat_threshold]
+    repeated.sort(key=lambda group: group[0], reverse=True)
+    return sum(elapsed for _statement, elapsed, _site in records), groups, repeated
+
+
+def _preview(statement):
+    statement = ' '.join(statement.split())
+    if len(statement) > STATEMENT_PREVIEW:
+        return statement[:STATEMENT_PREVIEW] + '...'
+    return statement
+
+
+def _finish_profile(response):
+    records = g.pop('sql_profile', None)
+    if records is None:
+        return response
+    total, groups, repeated = summarize(records, current_app.config['SQL_PROFILING_REPEAT_THRESHOLD'])
+    total_ms = total * 1000
+
+    lines = [
+        f'SQL profile {request.method} {request.full_path.rstrip("?")} ({request.endpoint}): '
+        f'{len(records)} statement(s) in {total_ms:.1f} ms, {len(repeated)} repeated pattern(s)'
+    ]
+    for count, seconds, site, statement in repeated[:REPORTED_GROUPS]:
+        lines.append(f'  N+1? {count}x {seconds * 1000:.1f} ms at {site}: {_preview(statement)}')
+    for count, seconds, site, statement in groups[:REPORTED_GROUPS]:
+        lines.append(f'  {seconds * 1000:.1f} ms {count}x at {site}: {_preview(statement)}')
+    log = current_app.logger.warning if repeated else current_app.logger.info
+    log('\n'.join(lines))
+
+    if not (current_user.is_authenticated and current_user.is_admin()):
+        return response
+    response.headers['X-SQL-Profile'] = (
+        f'statements={len(records)}; time_ms={total_ms:.1f}; repeated={len(repeated)}'
+        + (f'; worst="{repeated[0][2]} x{repeated[0][0]}"' if repeated else '')
+    )
+    response.headers.add('Server-Timing', f'sql;dur={total_ms:.1f};desc="{len(records)} statements"')
+    return response
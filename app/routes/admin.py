@@ -1,58 +1,81 @@
-from collections import defaultdict
 import os
-import shutil
+from flask import render_template, redirect, url_for, flash, Blueprint, request, current_app, jsonify
+from flask_login import login_required, current_user
 from flask import render_template, redirect, url_for, flash, Blueprint, request, current_app
-from flask_login import login_required
-from flask import render_template, redirect, url_for, flash, Blueprint, request, current_app
-from app.models import User, Role, File, UserFilePermission
+from sqlalchemy import func, or_
+from sqlalchemy.orm import aliased
+from app.models import User, Role, File, Job, UploadSession, UserFilePermission
 from app.forms import UserForm
 from app import db
-from app.routes.files import _delete_file_tree, _entry_exists
+from app.jobs import enqueue, remove_jobs
+from app.permissions import GRANT_ACTIONS, apply_changes as apply_permission_changes
+from app.routes.files import _delete_file_tree, _delete_records, _topmost_entries
+from app.routes.uploads import _discard_session
+from app.trash import move_to_trash
 
 bp = Blueprint('admin', __name__)
 
 from app.decorators import admin_required
 
 
-def _get_existing_folders():
-    folders = File.query.filter_by(is_folder=True).all()
-    cleaned = []
-    removed = False
-    for folder in folders:
-        if _entry_exists(folder):
-            cleaned.append(folder)
-        else:
-            _delete_file_tree(folder)
-            db.session.delete(folder)
-            removed = True
-    if removed:
-        db.session.commit()
-    return cleaned
-
+FOLDER_ROWS_PER_PAGE = 500
+PERMISSION_CHANGES_MAX_PAIRS = 100000
 
-def _build_folder_rows():
-    folders = _get_existing_folders()
-    children = defaultdict(list)
 
-    for folder in folders:
-        children[folder.parent_id].append(folder)
+def _prune_missing_folders(rows):
+    """Drops (and deletes) listed folders that no longer exist on disk."""
+    if current_app.config['UPLOAD_WATCHER_ENABLED']:
+        # `flask watch-uploads` keeps the table in sync with the disk.
+        return rows
+    base_path = current_app.config['UPLOAD_FOLDER']
+    missing_ids = {
+        entry['folder'].id for entry in rows
+        if not os.path.isdir(os.path.join(base_path, f"user_{entry['folder'].owner_id}", *entry['path'].split('/')[1:]))
+    }
+    if not missing_ids:
+        return rows
+    missing = File.query.filter(File.id.in_(missing_ids)).all()
+    for folder in _topmost_entries(missing):
+        _delete_file_tree(folder)
+    db.session.commit()
+    return [
+        entry for entry in rows
+        if entry['folder'].id not in missing_ids and missing_ids.isdisjoint(entry['ancestors'])
+    ]
 
-    for siblings in children.values():
-        siblings.sort(key=lambda f: f.filename.lower())
 
-    ordered = []
+def _build_folder_rows(root=None, page=1):
+    """One page of folders (siblings by name) with their depth and path: the
+    top-level folders, or ``root`` followed by its subfolders.
 
-    def traverse(parent_id=None, depth=0):
-        for folder in children.get(parent_id, []):
-            ordered.append({
-                'folder': folder,
-                'depth': depth,
-                'path': folder.get_full_path()
-            })
-            traverse(folder.id, depth + 1)
+    Sorting, paging and the has-children check all run in SQL, so a page
+    costs the same however many folders exist; deeper levels are loaded only
+    when ``?root=`` opens them. Returns ``(rows, page, total_pages)``.
+    """
+    child = aliased(File)
+    has_children = db.session.query(child.id).filter(
+        child.parent_id == File.id, child.is_folder.is_(True)
+    ).exists()
+    query = db.session.query(File.id, File.filename, File.owner_id).filter(
+        File.is_folder.is_(True), File.parent_id == (root.id if root is not None else None)
+    )
+    total_pages = max(1, -(-query.count() // FOLDER_ROWS_PER_PAGE))
+    page = min(page, total_pages)
+    folders = query.add_columns(has_children.label('has_children')).order_by(
+        func.lower(File.filename), File.id
+    ).offset((page - 1) * FOLDER_ROWS_PER_PAGE).limit(FOLDER_ROWS_PER_PAGE)
 
-    traverse()
-    return ordered
+    rows = []
+    parent_path, ancestors, depth = '', (), 0
+    if root is not None:
+        parent_path, ancestors, depth = root.get_full_path(), (root.id,), 1
+        rows.append({'folder': root, 'depth': 0, 'path': parent_path, 'ancestors': (), 'has_children': True})
+    for folder in folders:
+        rows.append({
+            'folder': folder, 'depth': depth, 'path': f'{parent_path}/{folder.filename}',
+            'ancestors': ancestors, 'has_children': folder.has_children
+        })
+    return rows, page, total_pages
 
 
 @bp.route('/')
@@ -101,35 +124,41 @@ def edit_user(id):
 @admin_required
 def manage_user_permissions(id):
     user = User.query.get_or_404(id)
-    folder_rows = _build_folder_rows()
+    root_id = request.args.get('root', type=int)
+    root = File.query.filter_by(id=root_id, is_folder=True).first_or_404() if root_id else None
+    page = max(request.args.get('page', 1, type=int), 1)
 
     if request.method == 'POST':
-        UserFilePermission.query.filter_by(user_id=user.id).delete()
-
-        for entry in folder_rows:
-            folder = entry['folder']
-            read_permission = request.form.get(f'read_{folder.id}')
-            write_permission = request.form.get(f'write_{folder.id}')
-
-            if read_permission or write_permission:
-                permission = UserFilePermission(
-                    user_id=user.id,
-                    file_id=folder.id,
-                    can_read=read_permission is not None,
-                    can_write=write_permission is not None
-                )
-                db.session.add(permission)
-
+        # Only the folders shown on the submitted page are touched, and of
+        # those only the ones whose checkboxes changed are written.
+        displayed_ids = set(request.form.getlist('folder_ids', type=int))
+        changes = [
+            ('set', [user.id], [folder_id],
+             request.form.get(f'read_{folder_id}') is not None,
+             request.form.get(f'write_{folder_id}') is not None)
+            for (folder_id,) in db.session.query(File.id).filter(File.id.in_(displayed_ids), File.is_folder.is_(True))
+        ]
+        apply_permission_changes(changes)
         db.session.commit()
         flash('Permissions updated successfully.')
-        return redirect(url_for('admin.manage_user_permissions', id=user.id))
+        return redirect(url_for('admin.manage_user_permissions', id=user.id, root=root_id, page=page))
+
+    folder_rows, page, total_pages = _build_folder_rows(root, page)
+    folder_rows = _prune_missing_folders(folder_rows)
 
-    user_permissions = {p.file_id: p for p in user.permissions.all()}
+    user_permissions = {
+        p.file_id: p for p in user.permissions.filter(
+            UserFilePermission.file_id.in_([entry['folder'].id for entry in folder_rows])
+        )
+    }
     return render_template(
         'admin/manage_permissions.html',
         user=user,
+        root=root,
         folder_rows=folder_rows,
         user_permissions=user_permissions,
+        page=page,
+        total_pages=total_pages,
         title='Manage Permissions'
     )
 
@@ -139,20 +168,21 @@ def manage_user_permissions(id):
 def delete_user(id):
     user = User.query.get_or_404(id)
     try:
-        from app.routes.files import _delete_file_tree
-
         # Remove permissions where user is grantee
         UserFilePermission.query.filter_by(user_id=user.id).delete()
 
-        # Remove files owned by the user (including nested children)
-        user_files = File.query.filter_by(owner_id=user.id).all()
-        for file_obj in user_files:
-            _delete_file_tree(file_obj)
-            db.session.delete(file_obj)
+        # Remove files owned by the user (including nested children) in one pass
+        _delete_records(File.owner_id == user.id)
+
+        # Pending resumable uploads by or into this user
+        sessions = UploadSession.query.filter(
+            or_(UploadSession.user_id == user.id, UploadSession.owner_id == user.id)
+        ).all()
+        for session in sessions:
+            _discard_session(session)
+        remove_jobs(Job.user_id == user.id)
 
-        upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], f'user_{user.id}')
-        if os.path.isdir(upload_dir):
-            shutil.rmtree(upload_dir, ignore_errors=True)
+        move_to_trash(os.path.join(current_app.config['UPLOAD_FOLDER'], f'user_{user.id}'))
 
         db.session.delete(user)
         db.session.commit()
@@ -162,3 +192,77 @@ def delete_user(id):
         db.session.rollback()
         flash('Failed to delete user. Please try again.', 'danger')
     return redirect(url_for('admin.list_users'))
+
+
+def _parse_permission_change(raw):
+    """Returns ``(action, user_ids, file_ids, can_read, can_write)`` or None if malformed."""
+    if not isinstance(raw, dict) or raw.get('action') not in GRANT_ACTIONS:
+        return None
+    user_ids, file_ids = raw.get('user_ids'), raw.get('file_ids')
+    if not isinstance(user_ids, list) or not isinstance(file_ids, list) or not user_ids or not file_ids:
+        return None
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in user_ids + file_ids):
+        return None
+    # Revoking with no flags clears both; granting or setting defaults to read-only.
+    revoke = raw['action'] == 'revoke'
+    can_read, can_write = raw.get('can_read', True), raw.get('can_write', revoke)
+    if not isinstance(can_read, bool) or not isinstance(can_write, bool):
+        return None
+    return raw['action'], user_ids, file_ids, can_read, can_write
+
+
+@bp.route('/api/permissions', methods=['POST'])
+@login_required
+@admin_required
+def bulk_update_permissions():
+    """Applies grant/revoke/set changes across many users and files in one transaction."""
+    data = request.get_json(silent=True) or {}
+    raw_changes = data.get('changes')
+    if not isinstance(raw_changes, list) or not raw_changes:
+        return jsonify({'error': 'No changes given'}), 400
+
+    changes = []
+    for raw in raw_changes:
+        change = _parse_permission_change(raw)
+        if change is None:
+            return jsonify({'error': 'Invalid change', 'change': raw}), 400
+        changes.append(change)
+
+    pair_count = sum(len(set(change[1])) * len(set(change[2])) for change in changes)
+    if pair_count > PERMISSION_CHANGES_MAX_PAIRS:
+        return jsonify({'error': f'Too many user/file pairs (max {PERMISSION_CHANGES_MAX_PAIRS})'}), 400
+
+    user_ids = {user_id for change in changes for user_id in change[1]}
+    file_ids = {file_id for change in changes for file_id in change[2]}
+    unknown_users = user_ids - {row[0] for row in db.session.query(User.id).filter(User.id.in_(user_ids))}
+    if unknown_users:
+        return jsonify({'error': 'Unknown users', 'ids': sorted(unknown_users)}), 404
+    unknown_files = file_ids - {row[0] for row in db.session.query(File.id).filter(File.id.in_(file_ids))}
+    if unknown_files:
+        return jsonify({'error': 'Unknown files', 'ids': sorted(unknown_files)}), 404
+
+    try:
+        result = apply_permission_changes(changes)
+        db.session.commit()
+    except Exception as exc:
+        current_app.logger.exception('Failed to apply permission changes: %s', exc)
+        db.session.rollback()
+        return jsonify({'error': 'Failed to update permissions'}), 500
+    current_app.logger.info('Permission changes applied: %s', result)
+    return jsonify(result)
+
+
+@bp.route('/api/jobs/<kind>', methods=['POST'])
+@login_required
+@admin_required
+def queue_maintenance_job(kind):
+    """Queues a maintenance job for `flask jobs-worker` instead of running it in the request."""
+    data = request.get_json(silent=True) or {}
+    if kind == 'sync_uploads':
+        job = enqueue(kind, current_user.id, incremental=bool(data.get('incremental')))
+    elif kind == 'purge_trash':
+        job = enqueue(kind, current_user.id)
+    else:
+        return jsonify({'error': f'Unknown job kind {kind}'}), 404
+    db.session.commit()
+    return jsonify(job.to_dict()), 202
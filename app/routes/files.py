@@ -1,19 +1,48 @@
-from flask import Blueprint, jsonify, request, current_app, send_from_directory, send_file, after_this_request
+from flask import Blueprint, Response, jsonify, request, current_app, send_file
 from flask_login import login_required, current_user
+from sqlalchemy import and_, asc, cast, desc, func, insert, or_, tuple_
+from sqlalchemy.orm import aliased
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from app.models import File, UserFilePermission
+from app.archive import iter_folder_members, stream_zip
+from app.diskcache import DiskCache
+from app.thumbnails import (
+    DEFAULT_SIZE as DEFAULT_THUMBNAIL_SIZE,
+    THUMBNAIL_SIZES,
+    can_thumbnail,
+    get_thumbnail,
+    thumbnail_key,
+    thumbnails_available,
+)
+from app.blobs import blob_store_enabled, ingest as ingest_blob, release as release_blobs
+from app.metrics import count_upload, timed_zip
+from app.models import File, UserFilePermission, touch_ancestors
+from app.permissions import get_permission_index, invalidate as invalidate_permissions
+from app.staging import StagedUpload
+from app.trash import move_to_trash
 from app import db
+from collections import defaultdict
+from datetime import datetime
+from itertools import chain
+from urllib.parse import quote
+import base64
+import hashlib
+import json
+import mimetypes
 import os
-import shutil
-import tempfile
-import zipfile
+import unicodedata
 
 bp = Blueprint('files', __name__)
 
+COPY_BUFFER_SIZE = 1024 * 1024
+# Bump when the archive layout changes so cached ZIPs are not reused.
+ARCHIVE_CACHE_FORMAT = 1
+SEARCH_MIN_QUERY_LENGTH = 2
+SEARCH_DEFAULT_LIMIT = 50
+
 
 def _build_permission_cache():
-    permissions = UserFilePermission.query.filter_by(user_id=current_user.id).all()
-    return {permission.file_id: permission for permission in permissions}
+    return get_permission_index(current_user)
 
 
 def _has_access(file_obj, permissions, require_write=False):
@@ -23,19 +52,7 @@ def _has_access(file_obj, permissions, require_write=False):
     if file_obj.owner_id == current_user.id:
         return True
 
-    node = file_obj
-    while node is not None:
-        permission = permissions.get(node.id)
-        if permission:
-            if require_write:
-                if permission.can_write:
-                    return True
-            else:
-                if permission.can_read or permission.can_write:
-                    return True
-        node = node.parent
-
-    return False
+    return permissions.allows(file_obj, require_write=require_write)
 
 
 def _resolve_disk_path(owner_id, folder=None):
@@ -43,16 +60,14 @@ def _resolve_disk_path(owner_id, folder=None):
     if folder is None:
         return base_path
 
-    segments = []
-    node = folder
-    while node is not None:
-        segments.append(node.filename)
-        node = node.parent
+    segments = [ancestor.filename for ancestor in folder.get_ancestors()]
+    segments.append(folder.filename)
+    return os.path.join(base_path, *segments)
 
-    if segments:
-        base_path = os.path.join(base_path, *reversed(segments))
 
-    return base_path
+def _file_disk_path(file_obj):
+    """Absolute disk path of a File without loading its parent separately."""
+    return _resolve_disk_path(file_obj.owner_id, file_obj)
 
 
 def _sanitize_folder_name(name):
@@ -68,28 +83,55 @@ def _sanitize_folder_name(name):
 
 def _entry_exists(file_obj):
     if file_obj.is_folder:
-        folder_path = _resolve_disk_path(file_obj.owner_id, file_obj)
-        return os.path.isdir(folder_path)
-    base_path = _resolve_disk_path(file_obj.owner_id, file_obj.parent)
-    file_path = os.path.join(base_path, file_obj.filename)
-    return os.path.isfile(file_path)
+        return os.path.isdir(_file_disk_path(file_obj))
+    return os.path.isfile(_file_disk_path(file_obj))
 
 
-def _delete_file_tree(file_obj):
-    """Remove registros e arquivos físicos associados a um File."""
+def _subtree_criterion(file_obj):
+    """Matches a File and, for folders, everything below it."""
+    entries = File.id == file_obj.id
     if file_obj.is_folder:
-        children = list(file_obj.children.order_by(File.id))
-        for child in children:
-            _delete_file_tree(child)
-        folder_path = _resolve_disk_path(file_obj.owner_id, file_obj)
-        if os.path.isdir(folder_path):
-            shutil.rmtree(folder_path, ignore_errors=True)
-    else:
-        file_path = os.path.join(_resolve_disk_path(file_obj.owner_id, file_obj.parent), file_obj.filename)
-        try:
-            os.remove(file_path)
-        except FileNotFoundError:
-            pass
+        entries = or_(entries, File.tree_path.like(file_obj.subtree_prefix + '%'))
+    return entries
+
+
+def _delete_records(entries):
+    """Remove, com poucas instruções em lote, os Files que casam com ``entries`` e suas permissões."""
+    touch_ancestors(tree_path for (tree_path,) in db.session.query(File.tree_path).filter(entries).distinct())
+    entry_ids = db.session.query(File.id).filter(entries)
+    grants = UserFilePermission.file_id.in_(entry_ids)
+    affected_users = db.session.query(UserFilePermission.user_id).filter(grants).distinct()
+    invalidate_permissions(user_id for (user_id,) in affected_users)
+    UserFilePermission.query.filter(grants).delete(synchronize_session=False)
+
+    blob_refs = dict(
+        db.session.query(File.blob_id, func.count()).filter(entries, File.blob_id.isnot(None)).group_by(File.blob_id)
+    )
+    File.query.filter(entries).delete(synchronize_session=False)
+    release_blobs(blob_refs)
+
+
+def _delete_file_records(file_obj):
+    """Remove os registros do banco ligados a um File (o próprio, a subárvore e permissões), sem tocar no disco."""
+    _delete_records(_subtree_criterion(file_obj))
+    if file_obj in db.session:
+        db.session.expunge(file_obj)
+
+
+def _delete_file_tree(file_obj):
+    """Remove os registros de um File e manda o que estiver no disco para a lixeira."""
+    disk_path = _file_disk_path(file_obj)
+    _delete_file_records(file_obj)
+    move_to_trash(disk_path)
+
+
+def _topmost_entries(files):
+    """Drops entries that sit inside another folder of ``files``.
+
+    Deleting a folder removes its whole subtree, so those would be gone already.
+    """
+    folder_ids = {file_obj.id for file_obj in files if file_obj.is_folder}
+    return [file_obj for file_obj in files if not folder_ids.intersection(file_obj.ancestor_ids())]
 
 
 def _prune_missing_entries(files):
@@ -100,18 +142,108 @@ def _prune_missing_entries(files):
             kept.append(file_obj)
             continue
         _delete_file_tree(file_obj)
-        db.session.delete(file_obj)
         removed = True
     if removed:
         db.session.commit()
     return kept
 
 
+def _listing_key(sort_by):
+    """Column a listing is sorted by, after putting folders first."""
+    if sort_by == 'date':
+        return File.created_at
+    return func.lower(File.filename)
+
+
+def _encode_cursor(file_obj, key):
+    """``key`` is the sort value the database returned with ``file_obj``.
+
+    It must not be recomputed in Python: ``str.lower()`` and SQL ``lower()``
+    disagree outside ASCII (SQLite only folds A-Z), and a cursor built from
+    the wrong one skips or repeats rows.
+    """
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    payload = json.dumps([file_obj.is_folder, key, file_obj.id])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(raw, sort_by):
+    """Returns ``(is_folder, key, id)`` or None when the cursor is malformed."""
+    try:
+        is_folder, key, file_id = json.loads(base64.urlsafe_b64decode(raw.encode('ascii')))
+        if sort_by == 'date':
+            key = datetime.fromisoformat(key)
+        elif not isinstance(key, str):
+            return None
+        return bool(is_folder), key, int(file_id)
+    except (ValueError, TypeError, UnicodeError):
+        return None
+
+
+def _after_cursor(cursor, key_column, descending):
+    _is_folder, key, file_id = cursor
+    if descending:
+        return tuple_(key_column, File.id) < tuple_(key, file_id)
+    return tuple_(key_column, File.id) > tuple_(key, file_id)
+
+
+def _list_page(query, key_column, descending, cursor=None, limit=None):
+    """Runs a listing as two index range scans, folders then files.
+
+    Splitting on ``is_folder`` keeps every scan a plain walk of
+    ``(parent_id, is_folder, key, id)`` in either direction; a single
+    ``ORDER BY is_folder DESC, key ASC`` cannot be served by one index.
+    Returns up to ``limit + 1`` ``(file, key)`` rows so the caller can tell
+    if more follow and build the next cursor from the last key.
+    """
+    direction = desc if descending else asc
+    items = []
+    for is_folder in (True, False):
+        if cursor is not None and is_folder and not cursor[0]:
+            continue
+        part = query.add_columns(key_column).filter(File.is_folder.is_(is_folder))
+        if cursor is not None and cursor[0] == is_folder:
+            part = part.filter(_after_cursor(cursor, key_column, descending))
+        part = part.order_by(direction(key_column), direction(File.id))
+        if limit is not None:
+            part = part.limit(limit + 1 - len(items))
+        items.extend(part.all())
+        if limit is not None and len(items) > limit:
+            break
+    return items
+
+
+def _visible_root_ids(user_id):
+    """Subquery of the root entries a non-admin user can see: the ones they
+    own plus the ones shared with them. Each half is an index lookup, so the
+    cost follows what the user can see, not how many users or roots exist."""
+    owned = db.session.query(File.id).filter(File.owner_id == user_id, File.parent_id.is_(None))
+    shared = db.session.query(UserFilePermission.file_id).join(
+        File, File.id == UserFilePermission.file_id
+    ).filter(
+        UserFilePermission.user_id == user_id,
+        or_(UserFilePermission.can_read.is_(True), UserFilePermission.can_write.is_(True)),
+        File.parent_id.is_(None)
+    )
+    return owned.union(shared)
+
+
 @bp.route('/files', methods=['GET'])
 @login_required
 def list_files():
+    """Lists a folder (or the root), folders first, sorted in the database.
+
+    Without ``limit`` the whole folder is returned as an array. With ``limit``
+    the response is ``{"items": [...], "next_cursor": ...}`` and the next page
+    is requested by passing ``next_cursor`` back as ``cursor``.
+    """
     parent_id = request.args.get('parent_id', default=None, type=int)
     sort_by = request.args.get('sort_by', default='name', type=str)
+    order = request.args.get('order')
+    descending = order == 'desc' if order else sort_by == 'date'
+    limit = request.args.get('limit', default=None, type=int)
+    raw_cursor = request.args.get('cursor')
     permissions = _build_permission_cache()
 
     if parent_id is not None:
@@ -120,27 +252,294 @@ def list_files():
             return jsonify({'error': 'Invalid folder'}), 400
         if not _has_access(parent, permissions):
             return jsonify({'error': 'Permission denied'}), 403
-        items = File.query.filter_by(parent_id=parent_id).all()
+        query = File.query.filter_by(parent_id=parent_id)
     else:
         if current_user.is_admin():
-            items = File.query.filter_by(parent_id=None).all()
+            query = File.query.filter_by(parent_id=None)
         else:
-            candidates = File.query.filter_by(parent_id=None).all()
-            items = []
-            for file_obj in candidates:
-                if file_obj.owner_id == current_user.id or _has_access(file_obj, permissions):
-                    items.append(file_obj)
-    items = _prune_missing_entries(items)
-
-    def _sort_key(file_obj):
-        folder_key = 0 if file_obj.is_folder else 1
-        if sort_by == 'date':
-            return (folder_key, -file_obj.created_at.timestamp())
-        return (folder_key, file_obj.filename.lower())
+            query = File.query.filter(File.id.in_(_visible_root_ids(current_user.id)))
+
+    key_column = _listing_key(sort_by)
+    cursor = None
+    if raw_cursor:
+        cursor = _decode_cursor(raw_cursor, sort_by)
+        if cursor is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    next_cursor = None
+    if limit is None:
+        rows = _list_page(query, key_column, descending, cursor)
+    else:
+        limit = max(1, min(limit, current_app.config['FILE_LIST_MAX_PAGE_SIZE']))
+        rows = _list_page(query, key_column, descending, cursor, limit)
+        if len(rows) > limit:
+            next_cursor = _encode_cursor(*rows[limit - 1])
+            rows = rows[:limit]
+    items = [item for item, _key in rows]
+
+    if not current_app.config['UPLOAD_WATCHER_ENABLED']:
+        items = _prune_missing_entries(items)
+
+    payload = [item.to_dict() for item in items]
+    if limit is None:
+        return jsonify(payload)
+    return jsonify({'items': payload, 'next_cursor': next_cursor})
+
+def _readable_criterion(user_id):
+    """SQL filter for the entries ``user_id`` may read: owned ones, plus any
+    entry that is or sits below a granted one (grants cover whole subtrees)."""
+    granted = aliased(File)
+    shared = db.session.query(UserFilePermission.file_id).join(
+        granted, granted.id == UserFilePermission.file_id
+    ).filter(
+        UserFilePermission.user_id == user_id,
+        or_(UserFilePermission.can_read.is_(True), UserFilePermission.can_write.is_(True)),
+        or_(
+            granted.id == File.id,
+            File.tree_path.like(granted.tree_path + cast(granted.id, db.Text) + '/%')
+        )
+    )
+    return or_(File.owner_id == user_id, shared.exists())
+
+
+def _visible_path(file_obj, permissions):
+    """``full_path`` as the caller may see it: whole for owners and admins,
+    otherwise starting at the topmost entry shared with them, so the names of
+    the owner's folders above it are not disclosed."""
+    if current_user.is_admin() or file_obj.owner_id == current_user.id:
+        return file_obj.get_full_path()
+    names = file_obj.get_full_path().split('/')[1:]
+    for depth, entry_id in enumerate(file_obj.ancestor_ids() + [file_obj.id]):
+        if entry_id in permissions.readable:
+            return '/' + '/'.join(names[depth:])
+    return '/' + file_obj.filename
 
-    items.sort(key=_sort_key)
 
-    return jsonify([item.to_dict() for item in items])
+def _like_pattern(text):
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+@bp.route('/search', methods=['GET'])
+@login_required
+def search_files():
+    """Finds entries whose name or path contains ``q`` (case-insensitive).
+
+    Matches ``File.full_path`` (trigram-indexed on PostgreSQL) and filters by
+    the caller's permissions in the same query, so only readable entries are
+    ever loaded. ``parent_id`` restricts the search to one folder's subtree.
+    Results come ordered by path as ``{"items": [...], "next_cursor": ...}``;
+    a page can come back short when matches only hit folder names the caller
+    cannot see, so keep following ``next_cursor`` until it is null.
+    """
+    term = (request.args.get('q') or '').strip()
+    if len(term) < SEARCH_MIN_QUERY_LENGTH:
+        return jsonify({'error': f'Search needs at least {SEARCH_MIN_QUERY_LENGTH} characters'}), 400
+    parent_id = request.args.get('parent_id', default=None, type=int)
+    limit = request.args.get('limit', default=SEARCH_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, current_app.config['FILE_LIST_MAX_PAGE_SIZE']))
+    raw_cursor = request.args.get('cursor')
+
+    key_column = func.lower(File.full_path)
+    # Lowered by the database on both sides: Python and SQLite disagree outside ASCII.
+    query = File.query.filter(key_column.like(func.lower(_like_pattern(term)), escape='\\'))
+    if not current_user.is_admin():
+        query = query.filter(_readable_criterion(current_user.id))
+    if parent_id is not None:
+        parent = File.query.get_or_404(parent_id)
+        if not parent.is_folder:
+            return jsonify({'error': 'Invalid folder'}), 400
+        if not _has_access(parent, _build_permission_cache()):
+            return jsonify({'error': 'Permission denied'}), 403
+        query = query.filter(File.tree_path.like(parent.subtree_prefix + '%'))
+    if raw_cursor:
+        cursor = _decode_cursor(raw_cursor, 'path')
+        if cursor is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        query = query.filter(_after_cursor(cursor, key_column, False))
+
+    rows = query.add_columns(key_column).order_by(key_column, File.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = _encode_cursor(*rows[limit - 1])
+        rows = rows[:limit]
+
+    permissions = None if current_user.is_admin() else _build_permission_cache()
+    payload = []
+    for item, _key in rows:
+        path = _visible_path(item, permissions)
+        if path != item.full_path and term.lower() not in path.lower():
+            continue
+        payload.append(dict(item.to_dict(), path=path))
+    return jsonify({'items': payload, 'next_cursor': next_cursor})
+
+
+def _parse_parent_id(raw_parent):
+    """Returns ``(parent_id, ok)`` for a form/JSON parent id value."""
+    if raw_parent in (None, '', 'null'):
+        return None, True
+    try:
+        return int(raw_parent), True
+    except (TypeError, ValueError):
+        return None, False
+
+
+def _get_upload_folder(parent_id, permissions):
+    """Returns ``(target_folder, owner_id, error_response)`` for an upload destination."""
+    if parent_id is None:
+        return None, current_user.id, None
+    target_folder = File.query.get_or_404(parent_id)
+    if not target_folder.is_folder:
+        return None, None, (jsonify({'error': 'Invalid destination'}), 400)
+    if not _has_access(target_folder, permissions, require_write=True):
+        return None, None, (jsonify({'error': 'Permission denied'}), 403)
+    return target_folder, target_folder.owner_id, None
+
+
+def _split_folder_path(path):
+    """Returns the sanitized segments of a '/'-separated folder path."""
+    segments = (_sanitize_folder_name(part) for part in (path or '').split('/'))
+    return [segment for segment in segments if segment]
+
+
+def _materialize_folders(owner_id, parent_id, paths):
+    """Resolves or creates every folder in ``paths`` below ``parent_id`` in one pass.
+
+    Works one depth level at a time: a single query finds the folders that
+    already exist at that level and the missing ones are inserted with one
+    flush, so a whole upload costs O(depth) round trips instead of one lookup
+    per file and path segment. New folders go in with one bulk INSERT per
+    level, which skips mapper events, so their ``tree_path`` and
+    ``full_path`` are filled in here; nothing is committed. Returns a dict mapping
+    each sanitized path (``'a/b'``) to its folder id.
+    """
+    levels = defaultdict(set)
+    for path in paths:
+        segments = _split_folder_path(path)
+        for depth in range(1, len(segments) + 1):
+            levels[depth].add(tuple(segments[:depth]))
+
+    resolved = {(): parent_id}
+    tree_paths = {(): '/'}
+    base_full_path = ''
+    if parent_id is not None and levels:
+        parent_path, base_full_path = db.session.query(File.tree_path, File.full_path).filter(
+            File.id == parent_id
+        ).one()
+        tree_paths[()] = f'{parent_path}{parent_id}/'
+    for depth in sorted(levels):
+        keys = levels[depth]
+        parent_ids = list({resolved[key[:-1]] for key in keys})
+        names = list({key[-1] for key in keys})
+
+        existing = {}
+        for start in range(0, len(parent_ids), 500):
+            query = db.session.query(File.id, File.parent_id, File.filename, File.tree_path).filter(
+                File.owner_id == owner_id,
+                File.is_folder.is_(True),
+                File.filename.in_(names)
+            )
+            batch = parent_ids[start:start + 500]
+            if batch == [None]:
+                query = query.filter(File.parent_id.is_(None))
+            else:
+                query = query.filter(File.parent_id.in_(batch))
+            for folder_id, folder_parent_id, filename, tree_path in query:
+                existing.setdefault((folder_parent_id, filename), (folder_id, tree_path))
+
+        missing = []
+        for key in keys:
+            found = existing.get((resolved[key[:-1]], key[-1]))
+            if found is None:
+                missing.append(key)
+            else:
+                resolved[key] = found[0]
+                tree_paths[key] = f'{found[1]}{found[0]}/'
+        if missing:
+            rows = db.session.execute(
+                insert(File).returning(File.id, File.parent_id, File.filename),
+                [
+                    {
+                        'filename': key[-1],
+                        'owner_id': owner_id,
+                        'parent_id': resolved[key[:-1]],
+                        'is_folder': True,
+                        'tree_path': tree_paths[key[:-1]],
+                        'full_path': base_full_path + '/' + '/'.join(key)
+                    }
+                    for key in missing
+                ]
+            )
+            created = {(folder_parent_id, filename): folder_id for folder_id, folder_parent_id, filename in rows}
+            for key in missing:
+                resolved[key] = created[(resolved[key[:-1]], key[-1])]
+                tree_paths[key] = f'{tree_paths[key[:-1]]}{resolved[key]}/'
+            touch_ancestors({tree_paths[key[:-1]] for key in missing})
+
+    return {'/'.join(key): folder_id for key, folder_id in resolved.items() if key}
+
+
+def _save_upload(file_storage, temp_file_path):
+    """Puts an uploaded file on disk and returns ``(path, size, sha256)``.
+
+    Parts that :class:`~app.staging.UploadRequest` streamed into the staging
+    folder are already complete and hashed, so they are used where they are.
+    Anything else is copied to ``temp_file_path``, hashing it on the way.
+    """
+    stream = file_storage.stream
+    if isinstance(stream, StagedUpload):
+        count_upload(stream.size)
+        return stream.detach(), stream.size, stream.sha256
+    digest = hashlib.sha256()
+    size = 0
+    with open(temp_file_path, 'wb') as target:
+        for block in iter(lambda: stream.read(COPY_BUFFER_SIZE), b''):
+            digest.update(block)
+            target.write(block)
+            size += len(block)
+    count_upload(size)
+    return temp_file_path, size, digest.hexdigest()
+
+
+def _store_upload(temp_file_path, file_path, sha256=None):
+    """Moves a finished upload to ``file_path``.
+
+    In blob-store mode the content goes into the store and ``file_path``
+    becomes a hard link to it; the Blob id is returned for the new File row
+    (None if the content had to be kept outside the store).
+    """
+    if blob_store_enabled():
+        blob = ingest_blob(temp_file_path, file_path, sha256=sha256)
+        return blob.id if blob is not None else None
+    os.replace(temp_file_path, file_path)
+    return None
+
+
+def _file_metadata(file_path, size, sha256):
+    """Column values describing a file that was just stored at ``file_path``."""
+    return {
+        'size': size,
+        'mtime': datetime.utcfromtimestamp(os.stat(file_path).st_mtime),
+        'checksum': sha256
+    }
+
+
+def _ensure_relative_folders(owner_id, parent_id, destination_path, relative_path):
+    """Creates the folders named by ``relative_path`` (all but its last segment).
+
+    Returns the id and disk path of the innermost folder.
+    """
+    segments = _split_folder_path('/'.join((relative_path or '').split('/')[:-1]))
+    if not segments:
+        return parent_id, destination_path
+    resolved = _materialize_folders(owner_id, parent_id, ['/'.join(segments)])
+    return resolved['/'.join(segments)], os.path.join(destination_path, *segments)
+
+
+@bp.errorhandler(RequestEntityTooLarge)
+def _upload_too_large(exc):
+    return jsonify({'error': 'File too large'}), 413
+
 
 @bp.route('/files/upload', methods=['POST'])
 @login_required
@@ -152,20 +551,13 @@ def upload_file():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
-    raw_parent = request.form.get('parent_id')
-    parent_id = None
-    if raw_parent not in (None, '', 'null'):
-        try:
-            parent_id = int(raw_parent)
-        except ValueError:
-            return jsonify({'error': 'Invalid parent id'}), 400
+    parent_id, valid_parent = _parse_parent_id(request.form.get('parent_id'))
+    if not valid_parent:
+        return jsonify({'error': 'Invalid parent id'}), 400
 
     relative_path = request.form.get('relative_path')
     permissions = _build_permission_cache()
 
-    target_folder = None
-    storage_owner_id = current_user.id
-
     try:
         current_app.logger.info(
             'Uploading file "%s" (size=%s) parent_id=%s relative_path=%s user=%s',
@@ -176,55 +568,28 @@ def upload_file():
             current_user.id
         )
 
-        if parent_id is not None:
-            target_folder = File.query.get_or_404(parent_id)
-            if not target_folder.is_folder:
-                return jsonify({'error': 'Invalid destination'}), 400
-            if not _has_access(target_folder, permissions, require_write=True):
-                return jsonify({'error': 'Permission denied'}), 403
-            storage_owner_id = target_folder.owner_id
+        target_folder, storage_owner_id, error = _get_upload_folder(parent_id, permissions)
+        if error:
+            return error
 
         filename = secure_filename(file.filename)
         destination_path = _resolve_disk_path(storage_owner_id, target_folder)
-
-        if relative_path:
-            path_parts = [part for part in relative_path.split('/') if part]
-            if len(path_parts) > 1:
-                current_parent_id = parent_id
-                for raw_part in path_parts[:-1]:
-                    part = _sanitize_folder_name(raw_part)
-                    if not part:
-                        continue
-                    folder = File.query.filter_by(
-                        owner_id=storage_owner_id,
-                        parent_id=current_parent_id,
-                        filename=part,
-                        is_folder=True
-                    ).first()
-                    if not folder:
-                        folder = File(
-                            filename=part,
-                            owner_id=storage_owner_id,
-                            parent_id=current_parent_id,
-                            is_folder=True
-                        )
-                        db.session.add(folder)
-                        db.session.commit()
-                    current_parent_id = folder.id
-                    destination_path = os.path.join(destination_path, part)
-                parent_id = current_parent_id
+        parent_id, destination_path = _ensure_relative_folders(
+            storage_owner_id, parent_id, destination_path, relative_path
+        )
 
         os.makedirs(destination_path, exist_ok=True)
         file_path = os.path.join(destination_path, filename)
-        temp_file_path = file_path + '.uploading'
-        file.save(temp_file_path)
-        os.replace(temp_file_path, file_path)
+        temp_file_path, size, sha256 = _save_upload(file, file_path + '.uploading')
+        blob_id = _store_upload(temp_file_path, file_path, sha256)
 
         new_file = File(
             filename=filename,
             owner_id=storage_owner_id,
             parent_id=parent_id,
-            is_folder=False
+            is_folder=False,
+            blob_id=blob_id,
+            **_file_metadata(file_path, size, sha256)
         )
         db.session.add(new_file)
         db.session.commit()
@@ -236,6 +601,113 @@ def upload_file():
         return jsonify({'error': 'File upload failed'}), 500
 
 
+def _batch_destinations(files, permissions):
+    """Returns ``(destinations, error_response)`` for a batch upload request.
+
+    Each file goes either into the folder named by its ``parent_ids`` entry
+    (ids returned by ``/folders/batch``) or below ``parent_id`` following its
+    ``relative_paths`` entry. Destinations are ``(owner_id, parent_id, disk_path)``.
+    """
+    raw_parent_ids = request.form.getlist('parent_ids')
+    if raw_parent_ids:
+        if len(raw_parent_ids) != len(files):
+            return None, (jsonify({'error': 'parent_ids must match files'}), 400)
+        parent_ids = []
+        for raw_parent in raw_parent_ids:
+            parent_id, valid_parent = _parse_parent_id(raw_parent)
+            if not valid_parent:
+                return None, (jsonify({'error': 'Invalid parent id'}), 400)
+            parent_ids.append(parent_id)
+
+        targets = {None: (current_user.id, _resolve_disk_path(current_user.id))}
+        folder_ids = {parent_id for parent_id in parent_ids if parent_id is not None}
+        folders = File.query.filter(File.id.in_(folder_ids)).all() if folder_ids else []
+        for folder in folders:
+            if not folder.is_folder:
+                return None, (jsonify({'error': 'Invalid destination'}), 400)
+            if not _has_access(folder, permissions, require_write=True):
+                return None, (jsonify({'error': 'Permission denied'}), 403)
+            targets[folder.id] = (folder.owner_id, _resolve_disk_path(folder.owner_id, folder))
+        if not folder_ids.issubset(targets):
+            return None, (jsonify({'error': 'Invalid destination'}), 404)
+        return [(targets[parent_id][0], parent_id, targets[parent_id][1]) for parent_id in parent_ids], None
+
+    relative_paths = request.form.getlist('relative_paths')
+    if relative_paths and len(relative_paths) != len(files):
+        return None, (jsonify({'error': 'relative_paths must match files'}), 400)
+    parent_id, valid_parent = _parse_parent_id(request.form.get('parent_id'))
+    if not valid_parent:
+        return None, (jsonify({'error': 'Invalid parent id'}), 400)
+    target_folder, owner_id, error = _get_upload_folder(parent_id, permissions)
+    if error:
+        return None, error
+
+    base_path = _resolve_disk_path(owner_id, target_folder)
+    folder_paths = [
+        '/'.join(_split_folder_path('/'.join(path.split('/')[:-1]))) for path in relative_paths
+    ] or [''] * len(files)
+    resolved = _materialize_folders(owner_id, parent_id, folder_paths)
+    resolved[''] = parent_id
+    return [
+        (owner_id, resolved[path], os.path.join(base_path, *path.split('/')) if path else base_path)
+        for path in folder_paths
+    ], None
+
+
+@bp.route('/files/upload/batch', methods=['POST'])
+@login_required
+def upload_batch():
+    """Stores many small files in one request and one transaction."""
+    files = request.files.getlist('files')
+    if not files:
+        return jsonify({'error': 'No file part'}), 400
+    if len(files) > current_app.config['UPLOAD_BATCH_MAX_FILES']:
+        return jsonify({'error': 'Too many files in one request'}), 413
+
+    permissions = _build_permission_cache()
+    written = []
+    created = []
+    try:
+        destinations, error = _batch_destinations(files, permissions)
+        if error:
+            return error
+
+        for file, (owner_id, parent_id, destination_path) in zip(files, destinations):
+            filename = secure_filename(file.filename or '')
+            if not filename:
+                continue
+            os.makedirs(destination_path, exist_ok=True)
+            file_path = os.path.join(destination_path, filename)
+            temp_file_path, size, sha256 = _save_upload(file, file_path + '.uploading')
+            blob_id = _store_upload(temp_file_path, file_path, sha256)
+            written.append(file_path)
+
+            new_file = File(
+                filename=filename,
+                owner_id=owner_id,
+                parent_id=parent_id,
+                is_folder=False,
+                blob_id=blob_id,
+                **_file_metadata(file_path, size, sha256)
+            )
+            db.session.add(new_file)
+            created.append(new_file)
+        db.session.commit()
+        current_app.logger.info(
+            'Batch upload completed: %s file(s) user=%s', len(created), current_user.id
+        )
+        return jsonify([file_obj.to_dict() for file_obj in created]), 201
+    except Exception as exc:
+        current_app.logger.exception('Batch upload failed: %s', exc)
+        db.session.rollback()
+        for file_path in written:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+        return jsonify({'error': 'File upload failed'}), 500
+
+
 @bp.route('/files/<int:file_id>', methods=['DELETE'])
 @login_required
 def delete_file(file_id):
@@ -254,7 +726,6 @@ def delete_file(file_id):
             current_user.id
         )
         _delete_file_tree(file_obj)
-        db.session.delete(file_obj)
         db.session.commit()
         return jsonify({'status': 'deleted', 'id': file_id})
     except Exception as exc:
@@ -263,30 +734,179 @@ def delete_file(file_id):
         return jsonify({'error': 'Failed to delete file'}), 500
 
 
-def _build_zip_for_file(file_obj):
-    temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-    temp_zip_path = temp_zip.name
-    temp_zip.close()
-    with zipfile.ZipFile(temp_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+def _archive_members(file_obj):
+    """Return an iterator of ``(abs_path, arcname)`` pairs for a File.
+
+    Disk paths are resolved here, while the request context is still around,
+    so the iterator itself can be consumed by a streaming response.
+    """
+    if file_obj.is_folder:
         folder_path = _resolve_disk_path(file_obj.owner_id, file_obj)
-        for root, dirs, files in os.walk(folder_path):
-            rel_root = os.path.relpath(root, folder_path)
-            if not files and not dirs:
-                folder_entry = file_obj.filename if rel_root == '.' else os.path.join(file_obj.filename, rel_root)
-                zipf.writestr(folder_entry.rstrip('/') + '/', '')
-            for fname in files:
-                abs_path = os.path.join(root, fname)
-                rel_path = os.path.relpath(abs_path, folder_path)
-                arcname = os.path.join(file_obj.filename, rel_path)
-                zipf.write(abs_path, arcname=arcname)
-    return temp_zip_path
-
-
-def _cleanup_temp(path):
+        return iter_folder_members(folder_path, file_obj.filename)
+    return iter([(_file_disk_path(file_obj), file_obj.filename)])
+
+
+def _stream_archive(members):
+    return timed_zip(stream_zip(members, workers=current_app.config['ARCHIVE_WORKERS']))
+
+
+def _build_zip_for_file(file_obj):
+    return _stream_archive(_archive_members(file_obj))
+
+
+def _set_attachment(response, download_name):
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+^`|~")
+        response.headers.set('Content-Disposition', 'attachment', filename=simple, **{'filename*': f"UTF-8''{quoted}"})
+    else:
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+
+
+def _zip_response(chunks, download_name):
+    """Stream an archive to the client as it is being built."""
+    response = Response(chunks, mimetype='application/zip', direct_passthrough=True)
+    _set_attachment(response, download_name)
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _archive_cache():
+    if current_app.config['ARCHIVE_CACHE_MAX_BYTES'] <= 0:
+        return None
+    cache = current_app.extensions.get('archive_cache')
+    if cache is None:
+        cache = current_app.extensions['archive_cache'] = DiskCache(
+            current_app.config['ARCHIVE_CACHE_FOLDER'], current_app.config['ARCHIVE_CACHE_MAX_BYTES']
+        )
+    return cache
+
+
+def _subtree_version(folder):
+    """Cache key of ``folder``'s archive.
+
+    Every write below a folder bumps its ``generation`` (see
+    ``touch_ancestors``), so the key costs no query and no disk access.
+    Changes made on disk behind the app's back count once they reach the
+    table: through ``flask watch-uploads``, or ``flask sync-uploads`` for
+    new entries.
+    """
+    key = f'{ARCHIVE_CACHE_FORMAT}:{folder.id}:{folder.created_at}:{folder.filename}:{folder.generation}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _folder_zip_response(folder):
+    """Serves a folder's ZIP from the archive cache, building and caching it on a miss."""
+    download_name = f'{folder.filename}.zip'
+    cache = _archive_cache()
+    if cache is None:
+        return _zip_response(_build_zip_for_file(folder), download_name)
+
+    version = _subtree_version(folder)
+    cached_path = cache.get(version)
+    if cached_path is not None:
+        response = send_file(
+            cached_path,
+            mimetype='application/zip',
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=version
+        )
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    response = _zip_response(cache.tee(version, _build_zip_for_file(folder)), download_name)
+    response.set_etag(version)
+    return response
+
+
+def _stored_etag(file_obj, st):
+    """The stored checksum, if the row still describes the file behind ``st``."""
+    if not file_obj.checksum or file_obj.size != st.st_size:
+        return None
+    if file_obj.mtime != datetime.utcfromtimestamp(st.st_mtime):
+        return None
+    return file_obj.checksum
+
+
+def _send_stored_file(file_obj):
+    """Sends a stored file once access has been checked.
+
+    Served directly, the response honours Range, If-Range and
+    If-None-Match against an ETag: the stored checksum while the row's size
+    and mtime still match the file on disk, otherwise one derived from the
+    file's mtime and size, so a file changed outside the app never answers
+    with its old checksum.
+    With ``DOWNLOAD_OFFLOAD`` set, only headers are returned and the front
+    proxy (nginx ``X-Accel-Redirect`` or Apache/lighttpd ``X-Sendfile``)
+    streams the bytes, ranges included, without holding a worker.
+    """
+    file_path = _file_disk_path(file_obj)
+    if not os.path.isfile(file_path):
+        return jsonify({'error': 'File not found'}), 404
+
+    offload = current_app.config['DOWNLOAD_OFFLOAD']
+    if not offload:
+        response = send_file(
+            file_path,
+            as_attachment=True,
+            download_name=file_obj.filename,
+            conditional=True,
+            etag=_stored_etag(file_obj, os.stat(file_path)) or True
+        )
+    else:
+        mimetype = mimetypes.guess_type(file_obj.filename)[0] or 'application/octet-stream'
+        response = Response(mimetype=mimetype)
+        _set_attachment(response, file_obj.filename)
+        if offload == 'x-accel-redirect':
+            relative = os.path.relpath(file_path, current_app.config['UPLOAD_FOLDER'])
+            prefix = current_app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/')
+            response.headers['X-Accel-Redirect'] = f"{prefix}/{quote(relative.replace(os.sep, '/'))}"
+        else:
+            response.headers['X-Sendfile'] = file_path
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@bp.route('/files/<int:file_id>/thumbnail', methods=['GET'])
+@login_required
+def file_thumbnail(file_id):
+    permissions = _build_permission_cache()
+    file_obj = File.query.get_or_404(file_id)
+
+    if not _has_access(file_obj, permissions):
+        return jsonify({'error': 'Permission denied'}), 403
+
+    if file_obj.is_folder or not can_thumbnail(file_obj.filename) or not thumbnails_available():
+        return jsonify({'error': 'No preview available'}), 404
+
+    size = request.args.get('size', DEFAULT_THUMBNAIL_SIZE, type=int)
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({'error': f'Size must be one of {list(THUMBNAIL_SIZES)}'}), 400
+
+    file_path = _file_disk_path(file_obj)
     try:
-        os.remove(path)
-    except OSError:
-        pass
+        if os.path.getsize(file_path) > current_app.config['THUMBNAIL_MAX_SOURCE_BYTES']:
+            return jsonify({'error': 'No preview available'}), 404
+        key = thumbnail_key(file_obj, file_path, size)
+        thumbnail_path = get_thumbnail(key, file_path, size)
+    except FileNotFoundError:
+        return jsonify({'error': 'File not found'}), 404
+    except Exception as exc:
+        current_app.logger.warning('Failed to render preview of "%s" (id=%s): %s', file_obj.filename, file_obj.id, exc)
+        return jsonify({'error': 'No preview available'}), 415
+
+    # The client versions the URL with the file's checksum/mtime, so it can cache freely.
+    response = send_file(thumbnail_path, mimetype='image/jpeg', conditional=True, etag=key, max_age=86400)
+    response.cache_control.private = True
+    response.cache_control.public = False
+    return response
 
 
 @bp.route('/files/download/<int:file_id>', methods=['GET'])
@@ -303,22 +923,9 @@ def download_file(file_id):
         if not os.path.exists(folder_path):
             return jsonify({'error': 'Folder not found'}), 404
 
-        temp_zip_path = _build_zip_for_file(file)
-
-        @after_this_request
-        def cleanup(response):
-            _cleanup_temp(temp_zip_path)
-            return response
-
-        return send_file(
-            temp_zip_path,
-            as_attachment=True,
-            download_name=f"{file.filename}.zip",
-            mimetype='application/zip'
-        )
+        return _folder_zip_response(file)
 
-    folder_path = _resolve_disk_path(file.owner_id, file.parent)
-    return send_from_directory(folder_path, file.filename, as_attachment=True)
+    return _send_stored_file(file)
 
 
 @bp.route('/files/download', methods=['POST'])
@@ -339,58 +946,12 @@ def download_bulk():
     if len(files) == 1:
         file_obj = files[0]
         if file_obj.is_folder:
-            temp_zip_path = _build_zip_for_file(file_obj)
-
-            @after_this_request
-            def cleanup(response):
-                _cleanup_temp(temp_zip_path)
-                return response
-
-            return send_file(
-                temp_zip_path,
-                as_attachment=True,
-                download_name=f"{file_obj.filename}.zip",
-                mimetype='application/zip'
-            )
+            return _folder_zip_response(file_obj)
 
-        folder_path = _resolve_disk_path(file_obj.owner_id, file_obj.parent)
-        return send_from_directory(folder_path, file_obj.filename, as_attachment=True)
-
-    temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-    temp_zip_path = temp_zip.name
-    temp_zip.close()
-
-    with zipfile.ZipFile(temp_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for file_obj in files:
-            if file_obj.is_folder:
-                folder_path = _resolve_disk_path(file_obj.owner_id, file_obj)
-                for root, dirs, file_names in os.walk(folder_path):
-                    rel_root = os.path.relpath(root, folder_path)
-                    if not file_names and not dirs:
-                        folder_entry = file_obj.filename if rel_root == '.' else os.path.join(file_obj.filename, rel_root)
-                        zipf.writestr(folder_entry.rstrip('/') + '/', '')
-                    for fname in file_names:
-                        abs_path = os.path.join(root, fname)
-                        rel_path = os.path.relpath(abs_path, folder_path)
-                        arcname = os.path.join(file_obj.filename, rel_path)
-                        zipf.write(abs_path, arcname=arcname)
-            else:
-                folder_path = _resolve_disk_path(file_obj.owner_id, file_obj.parent)
-                abs_path = os.path.join(folder_path, file_obj.filename)
-                if os.path.exists(abs_path):
-                    zipf.write(abs_path, arcname=file_obj.filename)
-
-    @after_this_request
-    def cleanup(response):
-        _cleanup_temp(temp_zip_path)
-        return response
+        return _send_stored_file(file_obj)
 
-    return send_file(
-        temp_zip_path,
-        as_attachment=True,
-        download_name='files.zip',
-        mimetype='application/zip'
-    )
+    members = chain.from_iterable([_archive_members(file_obj) for file_obj in files])
+    return _zip_response(_stream_archive(members), 'files.zip')
 
 
 @bp.route('/files/delete', methods=['POST'])
@@ -409,9 +970,8 @@ def delete_bulk():
             return jsonify({'error': f'Permission denied for {file_obj.filename}'}), 403
 
     try:
-        for file_obj in files:
+        for file_obj in _topmost_entries(files):
             _delete_file_tree(file_obj)
-            db.session.delete(file_obj)
         db.session.commit()
         return jsonify({'status': 'deleted', 'ids': ids})
     except Exception as exc:
@@ -462,3 +1022,40 @@ def create_folder():
     os.makedirs(os.path.join(folder_path, sanitized_name), exist_ok=True)
 
     return jsonify(new_folder.to_dict()), 201
+
+
+@bp.route('/folders/batch', methods=['POST'])
+@login_required
+def create_folders_batch():
+    """Resolves or creates a whole set of folder paths and returns their ids.
+
+    Uploaders send every directory of a tree up front and then upload each file
+    straight into its folder id, so individual uploads never resolve paths.
+    """
+    data = request.get_json() or {}
+    paths = data.get('paths')
+    if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+        return jsonify({'error': 'paths must be a list of strings'}), 400
+
+    parent_id, valid_parent = _parse_parent_id(data.get('parent_id'))
+    if not valid_parent:
+        return jsonify({'error': 'Invalid parent id'}), 400
+
+    permissions = _build_permission_cache()
+    target_folder, owner_id, error = _get_upload_folder(parent_id, permissions)
+    if error:
+        return error
+
+    resolved = _materialize_folders(owner_id, parent_id, paths)
+    db.session.commit()
+
+    base_path = _resolve_disk_path(owner_id, target_folder)
+    folders = {}
+    for path in paths:
+        segments = _split_folder_path(path)
+        if not segments:
+            continue
+        folders[path] = resolved['/'.join(segments)]
+        os.makedirs(os.path.join(base_path, *segments), exist_ok=True)
+
+    return jsonify({'parent_id': parent_id, 'folders': folders}), 201
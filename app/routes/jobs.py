@@ -0,0 +1,71 @@
+from flask import Blueprint, jsonify, request, current_app, send_file
+from flask_login import login_required, current_user
+from app.jobs import enqueue
+from app.models import File, Job
+from app.routes.files import _build_permission_cache, _has_access
+from app import db
+import os
+
+bp = Blueprint('jobs', __name__)
+
+
+def _get_visible_job(job_id):
+    job = db.session.get(Job, job_id)
+    if job is None or (job.user_id != current_user.id and not current_user.is_admin()):
+        return None
+    return job
+
+
+@bp.route('/jobs/archive', methods=['POST'])
+@login_required
+def create_archive_job():
+    """Queues a ZIP of the selected entries; fetch it from the job's artifact when done."""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids', [])
+    if not ids:
+        return jsonify({'error': 'No files selected'}), 400
+
+    permissions = _build_permission_cache()
+    files = File.query.filter(File.id.in_(ids)).all()
+    if not files:
+        return jsonify({'error': 'File not found'}), 404
+
+    for file_obj in files:
+        if not _has_access(file_obj, permissions):
+            return jsonify({'error': f'Permission denied for {file_obj.filename}'}), 403
+
+    name = f'{files[0].filename}.zip' if len(files) == 1 else 'files.zip'
+    job = enqueue('archive', current_user.id, file_ids=[file_obj.id for file_obj in files], name=name)
+    db.session.commit()
+    current_app.logger.info('Archive job %s queued for %s entries by user=%s', job.id, len(files), current_user.id)
+    return jsonify(job.to_dict()), 202
+
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    job = _get_visible_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+
+@bp.route('/jobs/<job_id>/artifact', methods=['GET'])
+@login_required
+def get_job_artifact(job_id):
+    job = _get_visible_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status != 'done' or not job.artifact_path:
+        return jsonify({'error': 'Job has no artifact yet', 'status': job.status}), 409
+    if not os.path.isfile(job.artifact_path):
+        return jsonify({'error': 'Artifact expired'}), 410
+
+    response = send_file(
+        job.artifact_path,
+        as_attachment=True,
+        download_name=job.artifact_name or os.path.basename(job.artifact_path),
+        conditional=True
+    )
+    response.cache_control.private = True
+    return response
@@ -0,0 +1,319 @@
+from flask import Blueprint, jsonify, request, current_app
+from flask_login import login_required, current_user
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+from app.blobs import blob_store_enabled, file_sha256, find_blob, link_blob, make_challenge, verify_challenge
+from app.metrics import count_upload
+from app.models import File, UploadSession, UploadChunk
+from app.routes.files import (
+    _build_permission_cache,
+    _ensure_relative_folders,
+    _file_metadata,
+    _get_upload_folder,
+    _parse_parent_id,
+    _resolve_disk_path,
+    _store_upload,
+)
+from app.staging import exceeds_max_size, staging_folder
+from app import db
+import os
+
+bp = Blueprint('uploads', __name__)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+CHALLENGE_MAX_AGE = 300
+
+
+def _staging_path(session):
+    return os.path.join(staging_folder(), f'{session.id}.part')
+
+
+def _get_own_session(session_id):
+    session = db.session.get(UploadSession, session_id)
+    if session is None or session.user_id != current_user.id:
+        return None
+    return session
+
+
+def _discard_session(session):
+    try:
+        os.remove(_staging_path(session))
+    except FileNotFoundError:
+        pass
+    db.session.delete(session)
+
+
+@bp.route('/files/uploads', methods=['POST'])
+@login_required
+def create_upload_session():
+    data = request.get_json() or {}
+    filename = secure_filename(data.get('filename') or '')
+    if not filename:
+        return jsonify({'error': 'Filename is required'}), 400
+
+    try:
+        total_size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid size'}), 400
+    if total_size < 0:
+        return jsonify({'error': 'Invalid size'}), 400
+    if exceeds_max_size(total_size):
+        return jsonify({'error': 'File too large'}), 413
+
+    parent_id, valid_parent = _parse_parent_id(data.get('parent_id'))
+    if not valid_parent:
+        return jsonify({'error': 'Invalid parent id'}), 400
+
+    permissions = _build_permission_cache()
+    _target_folder, owner_id, error = _get_upload_folder(parent_id, permissions)
+    if error:
+        return error
+
+    session = UploadSession(
+        user_id=current_user.id,
+        owner_id=owner_id,
+        parent_id=parent_id,
+        filename=filename,
+        relative_path=data.get('relative_path') or None,
+        total_size=total_size,
+        chunk_size=current_app.config['UPLOAD_CHUNK_SIZE']
+    )
+    db.session.add(session)
+    db.session.flush()
+    with open(_staging_path(session), 'wb') as staging:
+        staging.truncate(total_size)
+    db.session.commit()
+    current_app.logger.info(
+        'Upload session %s created for "%s" (size=%s) parent_id=%s user=%s',
+        session.id, filename, total_size, parent_id, current_user.id
+    )
+    return jsonify(session.to_dict()), 201
+
+
+@bp.route('/files/uploads/<session_id>', methods=['GET'])
+@login_required
+def get_upload_session(session_id):
+    session = _get_own_session(session_id)
+    if session is None:
+        return jsonify({'error': 'Upload session not found'}), 404
+    return jsonify(session.to_dict())
+
+
+@bp.route('/files/uploads/<session_id>', methods=['PUT'])
+@bp.route('/files/uploads/<session_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def put_upload_chunk(session_id, index=None):
+    """Stores one chunk, addressed by index or by a chunk-aligned ``offset`` query arg.
+
+    Re-sending a chunk overwrites the same bytes, so clients can retry freely.
+    """
+    session = _get_own_session(session_id)
+    if session is None:
+        return jsonify({'error': 'Upload session not found'}), 404
+
+    if index is None:
+        offset = request.args.get('offset', type=int)
+        if offset is None or offset % session.chunk_size:
+            return jsonify({'error': 'Offset must be a multiple of the chunk size'}), 400
+        index = offset // session.chunk_size
+    if index < 0 or index >= session.total_chunks:
+        return jsonify({'error': 'Chunk index out of range'}), 416
+
+    expected = session.chunk_length(index)
+    written = 0
+    with open(_staging_path(session), 'r+b') as staging:
+        staging.seek(index * session.chunk_size)
+        while written < expected:
+            data = request.stream.read(min(COPY_BUFFER_SIZE, expected - written))
+            if not data:
+                break
+            staging.write(data)
+            written += len(data)
+    count_upload(written)
+    if written != expected or request.stream.read(1):
+        return jsonify({'error': f'Chunk {index} must be exactly {expected} bytes'}), 400
+
+    if db.session.get(UploadChunk, (session.id, index)) is None:
+        db.session.add(UploadChunk(session_id=session.id, index=index))
+        session.updated_at = db.func.now()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent retry of the same chunk recorded it first.
+            db.session.rollback()
+
+    return jsonify({'id': session.id, 'index': index, 'received_chunks': session.chunks.count()})
+
+
+@bp.route('/files/uploads/<session_id>/complete', methods=['POST'])
+@login_required
+def complete_upload_session(session_id):
+    session = _get_own_session(session_id)
+    if session is None:
+        return jsonify({'error': 'Upload session not found'}), 404
+
+    missing = session.total_chunks - session.chunks.count()
+    if missing:
+        return jsonify({'error': f'{missing} chunk(s) still missing', 'received': session.received_ranges()}), 409
+
+    permissions = _build_permission_cache()
+    target_folder, owner_id, error = _get_upload_folder(session.parent_id, permissions)
+    if error:
+        return error
+
+    staging_path = _staging_path(session)
+    stored = False
+    try:
+        destination_path = _resolve_disk_path(owner_id, target_folder)
+        parent_id, destination_path = _ensure_relative_folders(
+            owner_id, session.parent_id, destination_path, session.relative_path
+        )
+        os.makedirs(destination_path, exist_ok=True)
+        file_path = os.path.join(destination_path, session.filename)
+        # Chunks arrive in any order, so the content is hashed once here.
+        sha256 = file_sha256(staging_path)
+        blob_id = _store_upload(staging_path, file_path, sha256)
+        stored = True
+
+        new_file = File(
+            filename=session.filename,
+            owner_id=owner_id,
+            parent_id=parent_id,
+            is_folder=False,
+            blob_id=blob_id,
+            **_file_metadata(file_path, session.total_size, sha256)
+        )
+        db.session.add(new_file)
+        db.session.delete(session)
+        db.session.commit()
+        current_app.logger.info(
+            'Upload session %s completed: "%s" id=%s user=%s',
+            session_id, new_file.filename, new_file.id, current_user.id
+        )
+        return jsonify(new_file.to_dict()), 201
+    except Exception as exc:
+        current_app.logger.exception('Failed to complete upload session %s: %s', session_id, exc)
+        db.session.rollback()
+        if stored:
+            # The row was not committed: put the content back so the session can be completed again.
+            try:
+                os.replace(file_path, staging_path)
+            except OSError as restore_exc:
+                current_app.logger.error('Could not return %s to staging: %s', file_path, restore_exc)
+        return jsonify({'error': 'File upload failed'}), 500
+
+
+@bp.route('/files/uploads/<session_id>', methods=['DELETE'])
+@login_required
+def abort_upload_session(session_id):
+    session = _get_own_session(session_id)
+    if session is None:
+        return jsonify({'error': 'Upload session not found'}), 404
+    _discard_session(session)
+    db.session.commit()
+    return jsonify({'status': 'aborted', 'id': session_id})
+
+
+def _challenge_serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='blob-challenge')
+
+
+def _parse_blob_request(data):
+    """Returns ``(sha256, size)`` from a dedup request, or ``(None, None)``."""
+    sha256 = (data.get('sha256') or '').lower()
+    if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+        return None, None
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return None, None
+    return sha256, size
+
+
+@bp.route('/files/uploads/precheck', methods=['POST'])
+@login_required
+def precheck_upload():
+    """Tells the client whether content with this SHA-256 is already stored.
+
+    When it is, the response carries a byte range of the content for the
+    client to hash and a signed token; ``/files/uploads/link`` then creates
+    the file without transferring it.
+    """
+    if not blob_store_enabled():
+        return jsonify({'enabled': False, 'found': False})
+    sha256, size = _parse_blob_request(request.get_json() or {})
+    if sha256 is None:
+        return jsonify({'error': 'Invalid sha256 or size'}), 400
+    if exceeds_max_size(size):
+        return jsonify({'error': 'File too large'}), 413
+
+    blob = find_blob(sha256, size)
+    if blob is None:
+        return jsonify({'enabled': True, 'found': False})
+    challenge = make_challenge(blob)
+    token = _challenge_serializer().dumps({'user': current_user.id, 'sha256': sha256, **challenge})
+    return jsonify({'enabled': True, 'found': True, 'challenge': challenge, 'token': token})
+
+
+@bp.route('/files/uploads/link', methods=['POST'])
+@login_required
+def link_upload():
+    """Creates a file from stored content after the client answered the precheck challenge."""
+    if not blob_store_enabled():
+        return jsonify({'error': 'Blob store is disabled'}), 404
+    data = request.get_json() or {}
+    sha256, size = _parse_blob_request(data)
+    filename = secure_filename(data.get('filename') or '')
+    if sha256 is None or not filename:
+        return jsonify({'error': 'Invalid request'}), 400
+    if exceeds_max_size(size):
+        return jsonify({'error': 'File too large'}), 413
+    try:
+        challenge = _challenge_serializer().loads(data.get('token') or '', max_age=CHALLENGE_MAX_AGE)
+    except BadSignature:
+        return jsonify({'error': 'Invalid or expired token'}), 403
+    if challenge.get('user') != current_user.id or challenge.get('sha256') != sha256:
+        return jsonify({'error': 'Invalid or expired token'}), 403
+
+    blob = find_blob(sha256, size)
+    if blob is None:
+        return jsonify({'error': 'Content not found'}), 404
+    if not verify_challenge(blob, challenge, data.get('proof')):
+        return jsonify({'error': 'Proof does not match'}), 403
+
+    parent_id, valid_parent = _parse_parent_id(data.get('parent_id'))
+    if not valid_parent:
+        return jsonify({'error': 'Invalid parent id'}), 400
+    permissions = _build_permission_cache()
+    target_folder, owner_id, error = _get_upload_folder(parent_id, permissions)
+    if error:
+        return error
+
+    try:
+        destination_path = _resolve_disk_path(owner_id, target_folder)
+        parent_id, destination_path = _ensure_relative_folders(
+            owner_id, parent_id, destination_path, data.get('relative_path')
+        )
+        os.makedirs(destination_path, exist_ok=True)
+        file_path = os.path.join(destination_path, filename)
+        link_blob(blob, file_path)
+
+        new_file = File(
+            filename=filename,
+            owner_id=owner_id,
+            parent_id=parent_id,
+            is_folder=False,
+            blob_id=blob.id,
+            **_file_metadata(file_path, blob.size, blob.sha256)
+        )
+        db.session.add(new_file)
+        db.session.commit()
+        current_app.logger.info(
+            'Deduplicated upload: "%s" id=%s blob=%s user=%s', filename, new_file.id, blob.id, current_user.id
+        )
+        return jsonify(new_file.to_dict()), 201
+    except Exception as exc:
+        current_app.logger.exception('Failed to link "%s": %s', filename, exc)
+        db.session.rollback()
+        return jsonify({'error': 'File upload failed'}), 500
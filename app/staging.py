@@ -0,0 +1,105 @@
+"""Staging area for uploads that are still arriving.
+
+Resumable uploads keep their ``.part`` files here, and :class:`UploadRequest`
+streams every multipart file part straight into a ``.stream`` file here,
+hashing and counting the bytes as they are written. The folder must be on
+the same filesystem as UPLOAD_FOLDER, so storing a finished upload is a
+rename: each byte is written to disk once and nothing goes through ``/tmp``.
+"""
+import hashlib
+import os
+import time
+import uuid
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+STREAM_SUFFIX = '.stream'
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def staging_folder():
+    folder = current_app.config.get('UPLOAD_STAGING_FOLDER') or os.path.join(
+        current_app.config['UPLOAD_FOLDER'], '.staging'
+    )
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def exceeds_max_size(size):
+    """True when a file of ``size`` bytes is over UPLOAD_MAX_FILE_SIZE."""
+    max_size = current_app.config['UPLOAD_MAX_FILE_SIZE']
+    return bool(max_size) and size > max_size
+
+
+class StagedUpload:
+    """Writable file for one uploaded part that tracks its size and SHA-256.
+
+    The staging file is removed on close unless :meth:`detach` handed it over.
+    """
+
+    def __init__(self, folder, max_size=0):
+        self.path = os.path.join(folder, uuid.uuid4().hex + STREAM_SUFFIX)
+        self.max_size = max_size
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._file = open(self.path, 'w+b', buffering=WRITE_BUFFER_SIZE)
+        self._detached = False
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size and self.size > self.max_size:
+            self.close()
+            raise RequestEntityTooLarge()
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def detach(self):
+        """Closes the file and returns its path; from now on the caller owns it."""
+        self._file.close()
+        self._detached = True
+        return self.path
+
+    def close(self):
+        self._file.close()
+        if not self._detached:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """Request whose multipart file parts are written to the staging folder
+    as they are parsed, instead of being spooled to a temporary file."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if content_length is not None and exceeds_max_size(content_length):
+            raise RequestEntityTooLarge()
+        return StagedUpload(staging_folder(), current_app.config['UPLOAD_MAX_FILE_SIZE'])
+
+
+def purge_streams(max_age_seconds):
+    """Removes ``.stream`` files older than ``max_age_seconds``, left behind
+    by uploads whose request never finished. Returns how many went."""
+    folder = staging_folder()
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.name.endswith(STREAM_SUFFIX):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
@@ -33,6 +33,18 @@ document.addEventListener('DOMContentLoaded', function () {
     let currentViewMode = 'details';
     let selectionMode = false;
     const selectedIds = new Set();
+    const FILE_PAGE_SIZE = 200;
+    const THUMBNAIL_EXTENSIONS = new Set(['bmp', 'gif', 'jpeg', 'jpg', 'png', 'tif', 'tiff', 'webp']);
+    let nextCursor = null;
+    let loadingMore = false;
+    let listRequestToken = 0;
+    const pageObserver = 'IntersectionObserver' in window
+        ? new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadMoreFiles();
+            }
+        }, { rootMargin: '400px' })
+        : null;
 
     function formatDuration(seconds) {
         if (!seconds || !isFinite(seconds) || seconds <= 0) {
@@ -46,6 +58,16 @@ document.addEventListener('DOMContentLoaded', function () {
         return `${secs}s`;
     }
 
+    function formatBytes(bytes) {
+        if (!bytes || bytes <= 0) {
+            return '0 B';
+        }
+        const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+        const exponent = Math.min(units.length - 1, Math.floor(Math.log(bytes) / Math.log(1024)));
+        const value = bytes / Math.pow(1024, exponent);
+        return `${value.toFixed(exponent === 0 ? 0 : 1)} ${units[exponent]}`;
+    }
+
     function setTransferStatus({ active = true, message = '', percent = null, etaSeconds = null, detail = '', variant = 'info', indeterminate = false } = {}) {
         if (!transferStatus) return;
         if (transferHideTimeout) {
@@ -109,6 +131,10 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     function applySorting(files) {
+        if (currentSort.key !== 'type') {
+            // Name and date ordering come from the server, page by page.
+            return [...files];
+        }
         const sorted = [...files];
         sorted.sort((a, b) => {
             let valueA;
@@ -151,6 +177,7 @@ document.addEventListener('DOMContentLoaded', function () {
                     Esta pasta está vazia.
                 </div>
             `;
+            renderLoadMore();
             return;
         }
 
@@ -159,9 +186,34 @@ document.addEventListener('DOMContentLoaded', function () {
         } else {
             renderGridView(files);
         }
+        renderLoadMore();
         updateSelectionUI();
     }
 
+    function renderLoadMore() {
+        if (pageObserver) {
+            pageObserver.disconnect();
+        }
+        document.getElementById('file-list-more')?.remove();
+        if (!nextCursor) {
+            return;
+        }
+        const sentinel = document.createElement('div');
+        sentinel.id = 'file-list-more';
+        sentinel.className = 'text-center py-3';
+        sentinel.innerHTML = `
+            <button type="button" class="btn btn-sm btn-outline-secondary">
+                <span class="spinner-border spinner-border-sm me-1 ${loadingMore ? '' : 'd-none'}" role="status" aria-hidden="true"></span>
+                Carregar mais
+            </button>
+        `;
+        sentinel.querySelector('button').addEventListener('click', loadMoreFiles);
+        fileContainer.appendChild(sentinel);
+        if (pageObserver) {
+            pageObserver.observe(sentinel);
+        }
+    }
+
     function toggleSelection(id) {
         if (selectedIds.has(id)) {
             selectedIds.delete(id);
@@ -186,6 +238,7 @@ document.addEventListener('DOMContentLoaded', function () {
             const iconClass = file.is_folder ? 'bi-folder-fill text-warning' : 'bi-file-earmark';
             const fileType = file.is_folder ? 'Pasta' : (file.filename.split('.').pop() || 'Arquivo');
             const date = new Date(file.created_at).toLocaleString();
+            const size = file.is_folder || file.size === null ? '—' : formatBytes(file.size);
             return `
                 <tr class="file-row" data-file-entry="true" data-file-id="${file.id}" data-is-folder="${file.is_folder}" data-file-name="${file.filename}">
                     <td>
@@ -194,6 +247,7 @@ document.addEventListener('DOMContentLoaded', function () {
                         ${file.filename}
                     </td>
                     <td>${fileType}</td>
+                    <td>${size}</td>
                     <td>${date}</td>
                     <td class="text-end">
                         <button type="button" class="btn btn-sm btn-outline-secondary download-btn" data-file-id="${file.id}" data-is-folder="${file.is_folder}" data-filename="${file.filename}">
@@ -216,6 +270,7 @@ document.addEventListener('DOMContentLoaded', function () {
                         <tr>
                             <th>Nome</th>
                             <th>Tipo</th>
+                            <th>Tamanho</th>
                             <th>Modificado</th>
                             <th class="text-end">Ações</th>
                         </tr>
@@ -226,23 +281,36 @@ document.addEventListener('DOMContentLoaded', function () {
         `;
     }
 
+    function thumbnailUrl(file) {
+        if (file.is_folder || !THUMBNAIL_EXTENSIONS.has((file.filename.split('.').pop() || '').toLowerCase())) {
+            return null;
+        }
+        // The version keeps the browser cache from showing a replaced image.
+        const version = encodeURIComponent(file.checksum || file.mtime || file.created_at);
+        return `/api/files/${file.id}/thumbnail?size=256&v=${version}`;
+    }
+
     function renderGridView(files) {
         const cards = files.map(file => {
+            const thumbnail = thumbnailUrl(file);
             const iconClass = file.is_folder ? 'bi-folder-fill text-warning' : 'bi-file-earmark-text';
             const fileType = file.is_folder ? 'Pasta' : (file.filename.split('.').pop() || 'Arquivo');
             const date = new Date(file.created_at).toLocaleDateString();
+            const meta = file.is_folder || file.size === null ? `${fileType} · ${date}` : `${fileType} · ${formatBytes(file.size)} · ${date}`;
             return `
                 <div class="col file-card-wrapper">
                     <div class="file-card" data-file-entry="true" data-file-id="${file.id}" data-is-folder="${file.is_folder}" data-file-name="${file.filename}">
                         ${selectionMode ? `<div class="form-check">
                             <input class="form-check-input select-checkbox" type="checkbox" data-file-id="${file.id}" ${selectedIds.has(file.id) ? 'checked' : ''}>
                         </div>` : ''}
-                        <div class="file-card-icon">
+                        ${thumbnail ? `<img class="file-card-thumb" src="${thumbnail}" alt="" loading="lazy" decoding="async"
+                            onerror="this.nextElementSibling.hidden = false; this.remove();">` : ''}
+                        <div class="file-card-icon" ${thumbnail ? 'hidden' : ''}>
                             <i class="bi ${iconClass}"></i>
                         </div>
                         <div class="file-card-body">
                             <div class="file-card-name" title="${file.filename}">${file.filename}</div>
-                            <div class="file-card-meta">${fileType} · ${date}</div>
+                            <div class="file-card-meta">${meta}</div>
                         </div>
                         <div class="file-card-actions">
                             <button type="button" class="btn btn-sm btn-outline-secondary download-btn" data-file-id="${file.id}" data-is-folder="${file.is_folder}" data-filename="${file.filename}">
@@ -454,8 +522,34 @@ document.addEventListener('DOMContentLoaded', function () {
         });
     }
 
+    function listFilesUrl(parentId, cursor) {
+        const params = new URLSearchParams();
+        if (parentId) {
+            params.append('parent_id', parentId);
+        }
+        const serverSort = currentSort.key === 'date' ? currentSort : { key: 'name', direction: currentSort.key === 'name' ? currentSort.direction : 'asc' };
+        params.append('sort_by', serverSort.key);
+        params.append('order', serverSort.direction);
+        params.append('limit', FILE_PAGE_SIZE);
+        if (cursor) {
+            params.append('cursor', cursor);
+        }
+        return `/api/files?${params.toString()}`;
+    }
+
+    async function fetchFilesPage(parentId, cursor) {
+        const response = await fetch(listFilesUrl(parentId, cursor));
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json();
+    }
+
     async function fetchAndRenderFiles(parentId = null, folderName = null) {
         currentParentId = parentId;
+        const token = ++listRequestToken;
+        nextCursor = null;
+        loadingMore = false;
         if (fileContainer) {
             fileContainer.innerHTML = `
                 <div class="placeholder text-center text-muted py-5">
@@ -465,16 +559,12 @@ document.addEventListener('DOMContentLoaded', function () {
         }
 
         try {
-            let url = '/api/files';
-            const params = new URLSearchParams();
-            if (parentId) {
-                params.append('parent_id', parentId);
-            }
-            const response = await fetch(`${url}?${params.toString()}`);
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
+            const page = await fetchFilesPage(parentId, null);
+            if (token !== listRequestToken) {
+                return;
             }
-            currentFiles = await response.json();
+            currentFiles = page.items;
+            nextCursor = page.next_cursor;
             const validIds = new Set(currentFiles.map(file => file.id));
             [...selectedIds].forEach(id => {
                 if (!validIds.has(id)) {
@@ -494,7 +584,31 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     }
 
-    function uploadFile({ file, relativePath, parentId, onProgress }) {
+    async function loadMoreFiles() {
+        if (!nextCursor || loadingMore) {
+            return;
+        }
+        const token = listRequestToken;
+        loadingMore = true;
+        renderLoadMore();
+        try {
+            const page = await fetchFilesPage(currentParentId, nextCursor);
+            if (token !== listRequestToken) {
+                return;
+            }
+            currentFiles = currentFiles.concat(page.items);
+            nextCursor = page.next_cursor;
+        } catch (error) {
+            console.error('Failed to fetch more files:', error);
+        } finally {
+            if (token === listRequestToken) {
+                loadingMore = false;
+                renderFiles();
+            }
+        }
+    }
+
+    function uploadFileSimple({ file, relativePath, parentId, onProgress }) {
         let xhr = null;
         return new Promise((resolve, reject) => {
             const formData = new FormData();
@@ -546,6 +660,304 @@ document.addEventListener('DOMContentLoaded', function () {
         });
     }
 
+    const CHUNKED_UPLOAD_THRESHOLD = 64 * 1024 * 1024;
+    const CHUNK_MAX_RETRIES = 6;
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    async function jsonRequest(url, options = {}) {
+        const response = await fetch(url, options);
+        const payload = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            const error = new Error(payload.error || `Request failed with status ${response.status}`);
+            error.status = response.status;
+            throw error;
+        }
+        return payload;
+    }
+
+    function putChunk(url, blob, onProgress) {
+        return new Promise((resolve, reject) => {
+            const xhr = new XMLHttpRequest();
+            xhr.open('PUT', url, true);
+            xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+            let lastLoaded = 0;
+            xhr.upload.addEventListener('progress', (event) => {
+                if (!event.lengthComputable) {
+                    return;
+                }
+                const delta = event.loaded - lastLoaded;
+                lastLoaded = event.loaded;
+                if (delta > 0) {
+                    onProgress(delta);
+                }
+            });
+            xhr.addEventListener('load', () => {
+                if (xhr.status >= 200 && xhr.status < 300) {
+                    if (blob.size > lastLoaded) {
+                        onProgress(blob.size - lastLoaded);
+                    }
+                    resolve();
+                } else {
+                    onProgress(-lastLoaded);
+                    const error = new Error(`Chunk upload failed with status ${xhr.status}`);
+                    error.status = xhr.status;
+                    reject(error);
+                }
+            });
+            xhr.addEventListener('error', () => {
+                onProgress(-lastLoaded);
+                reject(new Error('Network error during chunk upload'));
+            });
+            xhr.send(blob);
+        });
+    }
+
+    async function uploadFileChunked({ file, relativePath, parentId, onProgress }) {
+        const storageKey = `fileserv-upload:${parentId ?? 'root'}:${relativePath || file.name}:${file.size}:${file.lastModified}`;
+        let session = null;
+        const savedId = window.localStorage.getItem(storageKey);
+        if (savedId) {
+            session = await jsonRequest(`/api/files/uploads/${savedId}`).catch(() => null);
+        }
+        if (!session) {
+            session = await jsonRequest('/api/files/uploads', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    filename: file.name,
+                    size: file.size,
+                    parent_id: typeof parentId === 'number' ? parentId : null,
+                    relative_path: relativePath || null
+                })
+            });
+            window.localStorage.setItem(storageKey, session.id);
+        }
+
+        let uploaded = 0;
+        const received = new Set();
+        session.received.forEach(([start, end]) => {
+            for (let offset = start; offset < end; offset += session.chunk_size) {
+                received.add(Math.floor(offset / session.chunk_size));
+            }
+            uploaded += end - start;
+        });
+        const report = (delta) => {
+            uploaded += delta;
+            if (onProgress) {
+                onProgress(delta, uploaded, file.size);
+            }
+        };
+        if (uploaded > 0 && onProgress) {
+            onProgress(uploaded, uploaded, file.size);
+        }
+
+        for (let index = 0; index < session.total_chunks; index += 1) {
+            if (received.has(index)) {
+                continue;
+            }
+            const start = index * session.chunk_size;
+            const blob = file.slice(start, Math.min(file.size, start + session.chunk_size));
+            for (let attempt = 0; ; attempt += 1) {
+                try {
+                    await putChunk(`/api/files/uploads/${session.id}/chunks/${index}`, blob, report);
+                    break;
+                } catch (error) {
+                    if (attempt + 1 >= CHUNK_MAX_RETRIES || error.status === 404 || error.status === 403) {
+                        throw error;
+                    }
+                    await sleep(Math.min(30000, 1000 * 2 ** attempt));
+                }
+            }
+        }
+
+        const created = await jsonRequest(`/api/files/uploads/${session.id}/complete`, { method: 'POST' });
+        window.localStorage.removeItem(storageKey);
+        return created;
+    }
+
+    const UPLOAD_CONCURRENCY = 4;
+    const BATCH_FILE_MAX_BYTES = 1024 * 1024;
+    const BATCH_MAX_FILES = 100;
+    const BATCH_MAX_BYTES = 8 * 1024 * 1024;
+
+    function uploadBatch({ files, onProgress }) {
+        return new Promise((resolve, reject) => {
+            const formData = new FormData();
+            files.forEach(({ file, parentId }) => {
+                formData.append('files', file);
+                formData.append('parent_ids', typeof parentId === 'number' ? parentId : '');
+            });
+
+            const totalSize = files.reduce((sum, { file }) => sum + (file.size || 0), 0);
+            const xhr = new XMLHttpRequest();
+            xhr.open('POST', '/api/files/upload/batch', true);
+            let lastLoaded = 0;
+
+            // Multipart overhead makes event.total larger than the payload; scale it back.
+            xhr.upload.addEventListener('progress', (event) => {
+                if (!onProgress || !event.lengthComputable || !event.total) {
+                    return;
+                }
+                const loaded = Math.min(totalSize, Math.round((event.loaded / event.total) * totalSize));
+                const delta = loaded - lastLoaded;
+                lastLoaded = loaded;
+                if (delta > 0) {
+                    onProgress(delta, loaded, totalSize);
+                }
+            });
+
+            xhr.addEventListener('load', () => {
+                if (xhr.status >= 200 && xhr.status < 300) {
+                    if (onProgress && totalSize > lastLoaded) {
+                        onProgress(totalSize - lastLoaded, totalSize, totalSize);
+                    }
+                    resolve(JSON.parse(xhr.responseText));
+                } else {
+                    reject(new Error(`Batch upload failed with status ${xhr.status}`));
+                }
+            });
+
+            xhr.addEventListener('error', () => {
+                reject(new Error('Network error during upload'));
+            });
+
+            xhr.send(formData);
+        });
+    }
+
+    function folderOf(relativePath) {
+        const parts = (relativePath || '').split('/').filter(Boolean);
+        return parts.slice(0, -1).join('/');
+    }
+
+    async function materializeFolders(parentId, files) {
+        const paths = [...new Set(files.map(file => folderOf(file.webkitRelativePath)).filter(Boolean))];
+        if (!paths.length) {
+            return {};
+        }
+        const payload = await jsonRequest('/api/folders/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ parent_id: typeof parentId === 'number' ? parentId : null, paths })
+        });
+        return payload.folders || {};
+    }
+
+    function buildUploadTasks(entries) {
+        const tasks = [];
+        let batch = [];
+        let batchBytes = 0;
+        const flush = () => {
+            if (batch.length) {
+                tasks.push({ batch });
+                batch = [];
+                batchBytes = 0;
+            }
+        };
+        entries.forEach(entry => {
+            const size = entry.file.size || 0;
+            if (size > BATCH_FILE_MAX_BYTES) {
+                tasks.push({ single: entry });
+                return;
+            }
+            if (batch.length >= BATCH_MAX_FILES || batchBytes + size > BATCH_MAX_BYTES) {
+                flush();
+            }
+            batch.push(entry);
+            batchBytes += size;
+        });
+        flush();
+        return tasks;
+    }
+
+    async function runWithConcurrency(tasks, limit, worker) {
+        let next = 0;
+        let failed = null;
+        const runners = Array.from({ length: Math.min(limit, tasks.length) }, async () => {
+            while (!failed && next < tasks.length) {
+                const task = tasks[next];
+                next += 1;
+                try {
+                    await worker(task);
+                } catch (error) {
+                    failed = failed || error;
+                }
+            }
+        });
+        await Promise.all(runners);
+        if (failed) {
+            throw failed;
+        }
+    }
+
+    // Files in this range are hashed first so content the server already
+    // stores is linked instead of uploaded. crypto.subtle needs the whole
+    // file in memory, hence the upper bound.
+    const DEDUP_MIN_BYTES = 1024 * 1024;
+    const DEDUP_MAX_BYTES = 512 * 1024 * 1024;
+    let dedupAvailable = Boolean(window.crypto && window.crypto.subtle);
+
+    async function sha256Hex(blob) {
+        const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function uploadFileDeduplicated({ file, relativePath, parentId, onProgress }) {
+        const sha256 = await sha256Hex(file);
+        const check = await jsonRequest('/api/files/uploads/precheck', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ sha256, size: file.size })
+        });
+        if (!check.enabled) {
+            dedupAvailable = false;
+            return null;
+        }
+        if (!check.found) {
+            return null;
+        }
+        const { offset, length } = check.challenge;
+        const proof = await sha256Hex(file.slice(offset, offset + length));
+        const created = await jsonRequest('/api/files/uploads/link', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                sha256,
+                size: file.size,
+                proof,
+                token: check.token,
+                filename: file.name,
+                parent_id: typeof parentId === 'number' ? parentId : null,
+                relative_path: relativePath || null
+            })
+        });
+        if (onProgress) {
+            onProgress(file.size, file.size, file.size);
+        }
+        return created;
+    }
+
+    async function uploadFile(options) {
+        const size = options.file.size;
+        if (dedupAvailable && size >= DEDUP_MIN_BYTES && size <= DEDUP_MAX_BYTES) {
+            try {
+                const created = await uploadFileDeduplicated(options);
+                if (created) {
+                    return created;
+                }
+            } catch (error) {
+                console.warn('Deduplication check failed, uploading normally:', error);
+            }
+        }
+        if (size > CHUNKED_UPLOAD_THRESHOLD) {
+            return uploadFileChunked(options);
+        }
+        return uploadFileSimple(options);
+    }
+
     viewModeButtons.forEach(button => {
         button.addEventListener('click', () => {
             const mode = button.dataset.viewMode;
@@ -570,7 +982,11 @@ document.addEventListener('DOMContentLoaded', function () {
             if (sortLabel) {
                 sortLabel.textContent = option.textContent.trim();
             }
-            renderFiles();
+            if (currentSort.key === 'type') {
+                renderFiles();
+            } else {
+                fetchAndRenderFiles(currentParentId);
+            }
         });
     });
 
@@ -658,7 +1074,7 @@ document.addEventListener('DOMContentLoaded', function () {
             const percent = totalBytes ? (uploadedBytes / totalBytes) * 100 : (uploadedFilesCount / files.length) * 100;
             setTransferStatus({
                 active: true,
-                message: `Enviando ${files.length} arquivos (${Math.min(percent, 100).toFixed(0)}%)`,
+                message: `Enviando ${uploadedFilesCount}/${files.length} arquivos (${Math.min(percent, 100).toFixed(0)}%)`,
                 percent: totalBytes ? percent : Math.min(100, percent),
                 etaSeconds: etaSeconds || null,
                 variant: 'info',
@@ -667,18 +1083,32 @@ document.addEventListener('DOMContentLoaded', function () {
         };
 
         try {
-            for (const file of files) {
-                await uploadFile({
-                    file,
-                    relativePath: file.webkitRelativePath,
-                    parentId: parentIdSnapshot,
-                    onProgress: handleProgress
-                });
-                uploadedFilesCount += 1;
+            const folderIds = await materializeFolders(parentIdSnapshot, files);
+            const tasks = buildUploadTasks(files.map(file => ({
+                file,
+                parentId: folderIds[folderOf(file.webkitRelativePath)] ?? parentIdSnapshot
+            })));
+
+            await runWithConcurrency(tasks, UPLOAD_CONCURRENCY, async (task) => {
+                if (task.batch) {
+                    await uploadBatch({
+                        files: task.batch,
+                        onProgress: handleProgress
+                    });
+                    uploadedFilesCount += task.batch.length;
+                } else {
+                    await uploadFile({
+                        file: task.single.file,
+                        relativePath: task.single.file.name,
+                        parentId: task.single.parentId,
+                        onProgress: handleProgress
+                    });
+                    uploadedFilesCount += 1;
+                }
                 if (totalBytes === 0) {
                     handleProgress(0);
                 }
-            }
+            });
             uploadFolderModal.hide();
             fetchAndRenderFiles(currentParentId);
             updateUploadFolderUI({ loading: false, message: 'Upload completed!', variant: 'success', autoHide: true });
@@ -768,25 +1198,36 @@ document.addEventListener('DOMContentLoaded', function () {
             let received = 0;
             const startTime = performance.now();
 
-            if (response.body && response.body.getReader && contentLength) {
+            if (response.body && response.body.getReader) {
                 const reader = response.body.getReader();
                 while (true) {
                     const { done, value } = await reader.read();
                     if (done) break;
                     chunks.push(value);
                     received += value.length;
-                    const percent = (received / contentLength) * 100;
-                    const elapsedSeconds = (performance.now() - startTime) / 1000;
-                    const speed = elapsedSeconds > 0 ? received / elapsedSeconds : 0;
-                    const remainingBytes = contentLength - received;
-                    const etaSeconds = speed > 0 ? remainingBytes / speed : null;
-                    setTransferStatus({
-                        active: true,
-                        message: `Baixando "${filename}" (${Math.min(percent, 100).toFixed(0)}%)`,
-                        percent,
-                        etaSeconds,
-                        variant: 'info'
-                    });
+                    if (contentLength) {
+                        const percent = (received / contentLength) * 100;
+                        const elapsedSeconds = (performance.now() - startTime) / 1000;
+                        const speed = elapsedSeconds > 0 ? received / elapsedSeconds : 0;
+                        const remainingBytes = contentLength - received;
+                        const etaSeconds = speed > 0 ? remainingBytes / speed : null;
+                        setTransferStatus({
+                            active: true,
+                            message: `Baixando "${filename}" (${Math.min(percent, 100).toFixed(0)}%)`,
+                            percent,
+                            etaSeconds,
+                            variant: 'info'
+                        });
+                    } else {
+                        setTransferStatus({
+                            active: true,
+                            message: `Baixando "${filename}"...`,
+                            percent: null,
+                            detail: `${formatBytes(received)} recebidos`,
+                            variant: 'info',
+                            indeterminate: true
+                        });
+                    }
                 }
                 const blob = new Blob(chunks, { type: 'application/zip' });
                 const url = window.URL.createObjectURL(blob);
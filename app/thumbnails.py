@@ -0,0 +1,114 @@
+"""Downscaled JPEG previews of uploaded images.
+
+Previews are rendered on first request by a small thread pool (Pillow
+releases the GIL while decoding and resizing) and kept in a size-bounded
+:class:`~app.diskcache.DiskCache` keyed by file id, content version and
+size. Concurrent requests for the same preview wait on a single render
+instead of decoding the original several times.
+
+Pillow is optional: without it :func:`thumbnails_available` is False and the
+endpoint answers 404, leaving the client on its generic icons.
+"""
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app.diskcache import DiskCache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+THUMBNAIL_SIZES = (128, 256, 512)
+DEFAULT_SIZE = 256
+JPEG_QUALITY = 80
+THUMBNAIL_EXTENSIONS = frozenset({'.bmp', '.gif', '.jpeg', '.jpg', '.png', '.tif', '.tiff', '.webp'})
+
+_executor = None
+_inflight = {}
+# Re-entrant: a future that is already done runs its callback while we hold it.
+_lock = threading.RLock()
+
+
+def thumbnails_available():
+    return Image is not None and current_app.config['THUMBNAIL_CACHE_MAX_BYTES'] > 0
+
+
+def can_thumbnail(filename):
+    return os.path.splitext(filename)[1].lower() in THUMBNAIL_EXTENSIONS
+
+
+def _cache():
+    cache = current_app.extensions.get('thumbnail_cache')
+    if cache is None:
+        cache = current_app.extensions['thumbnail_cache'] = DiskCache(
+            current_app.config['THUMBNAIL_CACHE_FOLDER'], current_app.config['THUMBNAIL_CACHE_MAX_BYTES']
+        )
+    return cache
+
+
+def thumbnail_key(file_obj, source_path, size):
+    """Cache key for a preview; changes whenever the stored content does."""
+    st = os.stat(source_path)
+    version = f'{file_obj.checksum}:{st.st_size}:{st.st_mtime_ns}'
+    return hashlib.sha256(f'{file_obj.id}:{version}:{size}'.encode()).hexdigest()
+
+
+def _render(source_path, size):
+    with Image.open(source_path) as image:
+        image.draft('RGB', (size * 2, size * 2))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        return output.getvalue()
+
+
+def _render_and_store(cache, key, source_path, size):
+    return cache.put(key, _render(source_path, size))
+
+
+def get_thumbnail(key, source_path, size):
+    """Returns the path of the cached preview, rendering it once if needed.
+
+    Raises whatever Pillow raises for unreadable images.
+    """
+    cache = _cache()
+    cached_path = cache.get(key)
+    if cached_path is not None:
+        return cached_path
+
+    with _lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _get_executor().submit(_render_and_store, cache, key, source_path, size)
+            _inflight[key] = future
+            future.add_done_callback(lambda _future: _forget(key))
+    return future.result()
+
+
+def _forget(key):
+    with _lock:
+        _inflight.pop(key, None)
+
+
+def _get_executor():
+    """Returns the shared render pool. Called with ``_lock`` held."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=current_app.config['THUMBNAIL_WORKERS'], thread_name_prefix='thumbnail'
+        )
+    return _executor
@@ -0,0 +1,139 @@
+"""Deferred removal of deleted files and folders.
+
+Deleting a folder used to ``rmtree`` it inside the request, holding the
+worker and the database transaction for as long as the disk took. Now the
+entry is renamed into ``UPLOAD_FOLDER/.trash`` (one ``rename`` on the same
+filesystem, whatever its size) and the bytes are reclaimed later by a
+background thread or ``flask purge-trash``.
+
+Moves are tied to the database session: an entry stays ``<uuid>.pending``
+until the transaction that deleted its rows commits, and is renamed back to
+where it was if the transaction rolls back. Only committed entries are purged.
+"""
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+
+PENDING_SUFFIX = '.pending'
+# A pending entry this old belongs to a process that died mid-request.
+PENDING_MAX_AGE = 3600
+
+_purge_event = threading.Event()
+_purger = None
+_purger_lock = threading.Lock()
+
+
+def trash_folder(upload_folder=None):
+    folder = os.path.join(upload_folder or current_app.config['UPLOAD_FOLDER'], '.trash')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def move_to_trash(path):
+    """Renames ``path`` into the trash until the current transaction ends.
+
+    Returns False when there was nothing at ``path``.
+    """
+    pending = os.path.join(trash_folder(), uuid.uuid4().hex + PENDING_SUFFIX)
+    # Begin the transaction now if needed, so that its end settles the move.
+    db.session.connection()
+    try:
+        os.rename(path, pending)
+    except FileNotFoundError:
+        return False
+    db.session.info.setdefault('trash_moves', []).append((pending, path))
+    db.session.info['trash_app'] = current_app._get_current_object()
+    return True
+
+
+@event.listens_for(Session, 'after_commit')
+def _commit_trash(session):
+    moves = session.info.pop('trash_moves', None)
+    app = session.info.pop('trash_app', None)
+    if not moves:
+        return
+    for pending, _original in moves:
+        try:
+            os.rename(pending, pending[:-len(PENDING_SUFFIX)])
+        except FileNotFoundError:
+            pass
+    wake_purger(app)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _restore_trash(session, transaction):
+    # Runs after after_commit, so anything left was rolled back or discarded.
+    if transaction.parent is not None:
+        return
+    moves = session.info.pop('trash_moves', None)
+    app = session.info.pop('trash_app', None)
+    for pending, original in reversed(moves or []):
+        try:
+            os.rename(pending, original)
+            continue
+        except OSError as exc:
+            if app is not None:
+                app.logger.warning('Could not restore %s from the trash: %s', original, exc)
+        try:
+            # The original location is taken or gone; leave it for purging.
+            os.rename(pending, pending[:-len(PENDING_SUFFIX)])
+        except OSError as exc:
+            # Still pending, so purge_trash removes it once PENDING_MAX_AGE has passed.
+            if app is not None:
+                app.logger.error('Could not release trash entry %s for purging: %s', pending, exc)
+
+
+def purge_trash(upload_folder):
+    """Deletes every committed trash entry. Returns how many were removed."""
+    folder = trash_folder(upload_folder)
+    removed = 0
+    now = time.time()
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.endswith(PENDING_SUFFIX):
+                try:
+                    if now - entry.stat(follow_symlinks=False).st_ctime < PENDING_MAX_AGE:
+                        continue
+                except FileNotFoundError:
+                    continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+            removed += 1
+    return removed
+
+
+def _purge_loop(app):
+    while True:
+        _purge_event.wait()
+        _purge_event.clear()
+        try:
+            removed = purge_trash(app.config['UPLOAD_FOLDER'])
+            if removed:
+                app.logger.info('Purged %s trash entr%s', removed, 'y' if removed == 1 else 'ies')
+        except Exception as exc:
+            app.logger.exception('Trash purge failed: %s', exc)
+
+
+def wake_purger(app):
+    """Asks this process's purger thread to empty the trash, starting it if needed."""
+    global _purger
+    if app is None or not app.config['TRASH_PURGE_IN_BACKGROUND']:
+        return
+    with _purger_lock:
+        if _purger is None or not _purger.is_alive():
+            _purger = threading.Thread(target=_purge_loop, args=(app,), name='trash-purger', daemon=True)
+            _purger.start()
+    _purge_event.set()
@@ -0,0 +1,416 @@
+"""Keeps the ``files`` table in sync with ``UPLOAD_FOLDER`` using inotify.
+
+``flask watch-uploads`` runs :class:`UploadWatcher` as a separate process.
+It watches every directory below ``UPLOAD_FOLDER/user_<id>`` and, once a
+directory has been quiet for ``UPLOAD_WATCHER_SETTLE`` seconds, compares it
+with its rows: entries that appeared on disk are inserted and entries that
+vanished are removed, together with their subtree and grants. Renames seen
+as a matching MOVED_FROM/MOVED_TO pair keep their row (and its grants).
+
+With ``UPLOAD_WATCHER_ENABLED`` set, listings and the admin folder tree skip
+their per-entry disk checks and trust the database.
+
+Names starting with a dot (``.staging`` and friends) and in-progress
+``*.uploading`` files are ignored. Entries modified within the settle delay
+are left for a later pass, so the upload request that wrote them gets to
+commit its own row first.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+from app.blobs import release as release_blobs
+from app.models import File, User
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+    | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+# A directory that never goes quiet is still reconciled this often.
+MAX_DELAY_FACTOR = 15
+
+
+class Inotify:
+    """Minimal ctypes binding for the Linux inotify API."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._libc.inotify_init1.argtypes = [ctypes.c_int]
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout):
+        """Returns ``(wd, mask, cookie, name)`` tuples, waiting up to ``timeout`` seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buffer = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def ignored_name(name):
+    """True for names the watcher and ``flask sync-uploads`` leave alone."""
+    return not name or name.startswith('.') or name.endswith('.uploading')
+
+
+class UploadWatcher:
+    def __init__(self, upload_folder, settle=2.0, logger=None):
+        self.root = os.path.abspath(upload_folder)
+        self.settle = settle
+        self.logger = logger or current_app.logger
+        self.inotify = Inotify()
+        self.watches = {}
+        self.paths = {}
+        self.dirty = {}
+        self.first_dirty = None
+        self.pending_moves = {}
+        self.moves = []
+
+    # -- watches ---------------------------------------------------------
+
+    def _watch(self, path):
+        if path in self.paths:
+            return
+        try:
+            wd = self.inotify.add_watch(path)
+        except OSError as exc:
+            if exc.errno == errno.ENOSPC:
+                self.logger.warning('inotify watch limit reached, not watching %s', path)
+            elif exc.errno not in (errno.ENOENT, errno.ENOTDIR):
+                raise
+            return
+        self.watches[wd] = path
+        self.paths[path] = wd
+
+    def _watch_tree(self, path):
+        """Watches ``path`` and every directory below it, marking them all dirty."""
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            self._watch(current)
+            self._mark(current)
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if not ignored_name(entry.name) and entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    def _unwatch_tree(self, path):
+        prefix = path + os.sep
+        for watched in [p for p in self.paths if p == path or p.startswith(prefix)]:
+            wd = self.paths.pop(watched)
+            self.watches.pop(wd, None)
+            self.inotify.rm_watch(wd)
+
+    def _watch_all(self):
+        self._watch(self.root)
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.startswith('user_') and entry.is_dir(follow_symlinks=False):
+                    self._watch_tree(entry.path)
+
+    # -- events ----------------------------------------------------------
+
+    def _mark(self, path):
+        now = time.monotonic()
+        self.dirty[path] = now
+        if self.first_dirty is None:
+            self.first_dirty = now
+
+    def _handle(self, wd, mask, cookie, name):
+        if mask & IN_Q_OVERFLOW:
+            self.logger.warning('inotify queue overflow, rescanning %s', self.root)
+            self._watch_all()
+            return
+        if mask & IN_IGNORED:
+            path = self.watches.pop(wd, None)
+            if path is not None:
+                self.paths.pop(path, None)
+            return
+
+        directory = self.watches.get(wd)
+        if directory is None or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            return
+        if directory == self.root:
+            if name.startswith('user_') and mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(os.path.join(self.root, name))
+            return
+        if ignored_name(name):
+            return
+
+        path = os.path.join(directory, name)
+        self._mark(directory)
+        if mask & IN_MOVED_FROM:
+            if mask & IN_ISDIR:
+                self._unwatch_tree(path)
+            self.pending_moves[cookie] = path
+        elif mask & IN_MOVED_TO:
+            source = self.pending_moves.pop(cookie, None)
+            if source is not None:
+                self.moves.append((source, path))
+            if mask & IN_ISDIR:
+                self._watch_tree(path)
+        elif mask & IN_CREATE and mask & IN_ISDIR:
+            self._watch_tree(path)
+
+    # -- reconciliation --------------------------------------------------
+
+    def _locate(self, path, located):
+        """Returns ``(owner_id, folder)`` for a directory on disk, ``folder`` being
+        None for a user's root; ``None`` if the directory has no row yet."""
+        if path in located:
+            return located[path]
+        relative = os.path.relpath(path, self.root)
+        if relative.startswith('..') or relative == '.':
+            return None
+        parts = relative.split(os.sep)
+        try:
+            owner_id = int(parts[0].split('_', 1)[1])
+        except (IndexError, ValueError):
+            return None
+        if db.session.get(User, owner_id) is None:
+            return None
+
+        if len(parts) == 1:
+            result = (owner_id, None)
+        else:
+            parent = self._locate(os.path.dirname(path), located)
+            folder = None
+            if parent is not None:
+                folder = File.query.filter_by(
+                    owner_id=owner_id,
+                    parent_id=parent[1].id if parent[1] is not None else None,
+                    filename=parts[-1],
+                    is_folder=True
+                ).order_by(File.id).first()
+            result = (owner_id, folder) if folder is not None else None
+        located[path] = result
+        return result
+
+    def _find_row(self, path, located):
+        parent = self._locate(os.path.dirname(path), located)
+        if parent is None:
+            return None, None
+        owner_id, folder = parent
+        row = File.query.filter_by(
+            owner_id=owner_id,
+            parent_id=folder.id if folder is not None else None,
+            filename=os.path.basename(path)
+        ).order_by(File.id).first()
+        return row, parent
+
+    def _apply_moves(self, located):
+        from app.routes.files import _delete_file_records
+
+        for source, target in self.moves:
+            row, _ = self._find_row(source, located)
+            if row is None or not os.path.lexists(target):
+                continue
+            destination = self._locate(os.path.dirname(target), located)
+            if destination is None or destination[0] != row.owner_id:
+                continue
+            existing, _ = self._find_row(target, located)
+            if existing is not None and existing.id != row.id:
+                # Replaced an entry that already had a row; the moved one wins.
+                _delete_file_records(existing)
+            row.move_to(destination[1], os.path.basename(target))
+            self.logger.info('Watcher: moved id=%s %s -> %s', row.id, source, target)
+            located.clear()
+        self.moves = []
+        db.session.flush()
+
+    def _reconcile(self, path, located, fresh):
+        """Brings the rows below one directory in line with its contents."""
+        from app.routes.files import _delete_file_records
+
+        location = self._locate(path, located)
+        if location is None:
+            return
+        owner_id, folder = location
+        parent_id = folder.id if folder is not None else None
+
+        on_disk = {}
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if ignored_name(entry.name) or entry.is_symlink():
+                        continue
+                    on_disk[entry.name] = entry
+        except (FileNotFoundError, NotADirectoryError):
+            return
+
+        rows = File.query.filter_by(owner_id=owner_id, parent_id=parent_id).order_by(File.id).all()
+        known = {}
+        now = time.time()
+        for row in rows:
+            entry = on_disk.get(row.filename)
+            if entry is not None and entry.is_dir() == row.is_folder:
+                kept = known.get(row.filename)
+                if kept is None:
+                    known[row.filename] = row
+                    if not row.is_folder:
+                        self._refresh_metadata(row, entry, now, path, fresh)
+                    continue
+                if row.is_folder:
+                    # Two rows for one directory: keep the older and move the other's
+                    # children (and their grants) under it before dropping it.
+                    self._merge_folder(row, kept, entry.path, located, fresh)
+            _delete_file_records(row)
+            self.logger.info('Watcher: removed id=%s "%s" under %s', row.id, row.filename, path)
+
+        for name, entry in on_disk.items():
+            if name in known:
+                continue
+            st = entry.stat(follow_symlinks=False)
+            if now - st.st_mtime < self.settle:
+                fresh.add(path)
+                continue
+            new_file = File(
+                filename=name,
+                owner_id=owner_id,
+                parent=folder,
+                is_folder=entry.is_dir()
+            )
+            if not new_file.is_folder:
+                new_file.size = st.st_size
+                new_file.mtime = datetime.utcfromtimestamp(st.st_mtime)
+            db.session.add(new_file)
+            self.logger.info('Watcher: added "%s" under %s', name, path)
+            if new_file.is_folder:
+                db.session.flush()
+                located[entry.path] = (owner_id, new_file)
+                self._watch(entry.path)
+                self._reconcile(entry.path, located, fresh)
+
+    def _merge_folder(self, duplicate, kept, path, located, fresh):
+        children = File.query.filter_by(parent_id=duplicate.id).all()
+        for child in children:
+            child.move_to(kept)
+        db.session.flush()
+        if children:
+            self.logger.info(
+                'Watcher: merged %s entries of duplicate id=%s into id=%s at %s',
+                len(children), duplicate.id, kept.id, path
+            )
+            # The moved children may now clash with the kept folder's own.
+            located[path] = (kept.owner_id, kept)
+            self._reconcile(path, located, fresh)
+
+    def _refresh_metadata(self, row, entry, now, path, fresh):
+        """Updates size and mtime of a file changed in place; the checksum is dropped
+        until ``flask backfill-metadata`` recomputes it, and the row no longer
+        counts as a copy of its blob."""
+        st = entry.stat(follow_symlinks=False)
+        mtime = datetime.utcfromtimestamp(st.st_mtime)
+        if row.size == st.st_size and row.mtime == mtime:
+            return
+        if now - st.st_mtime < self.settle:
+            fresh.add(path)
+            return
+        row.size = st.st_size
+        row.mtime = mtime
+        row.checksum = None
+        if row.blob_id is not None:
+            release_blobs({row.blob_id: 1})
+            row.blob_id = None
+
+    def flush(self):
+        dirty = sorted(self.dirty, key=lambda p: p.count(os.sep))
+        self.dirty = {}
+        self.first_dirty = None
+        self.pending_moves = {}
+        located = {}
+        fresh = set()
+        try:
+            self._apply_moves(located)
+            for path in dirty:
+                self._reconcile(path, located, fresh)
+            db.session.commit()
+        except Exception:
+            self.logger.exception('Watcher: reconciliation failed, will retry')
+            db.session.rollback()
+            fresh.update(dirty)
+        finally:
+            db.session.remove()
+        for path in fresh:
+            self._mark(path)
+
+    def _due(self):
+        if not self.dirty:
+            return False
+        now = time.monotonic()
+        quiet = now - max(self.dirty.values()) >= self.settle
+        overdue = now - self.first_dirty >= self.settle * MAX_DELAY_FACTOR
+        return quiet or overdue
+
+    def run(self, once=False):
+        """Reconciles everything once, then follows changes until interrupted."""
+        self._watch_all()
+        self.logger.info('Watcher: watching %s directories under %s', len(self.paths), self.root)
+        self.flush()
+        if once:
+            return
+        try:
+            while True:
+                for event in self.inotify.read_events(self.settle / 2):
+                    self._handle(*event)
+                if self._due():
+                    self.flush()
+        finally:
+            self.inotify.close()
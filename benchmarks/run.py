@@ -0,0 +1,345 @@
+"""Microbenchmarks for the file-tree hot paths.
+
+    python -m benchmarks.run --depth 4 --fanout 4 --output bench.json
+    python -m benchmarks.run --compare bench.json
+
+Builds a synthetic tree (see :mod:`benchmarks.synthetic`) in a throwaway
+SQLite database and upload folder, runs each benchmark once to warm up and
+then ``--repeat`` times, and prints JSON with per-round timings. With
+``--compare`` the medians are checked against an earlier run and the exit
+status is 1 when any benchmark got slower than ``--threshold`` times the
+baseline, so it can gate a deploy.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from flask_login import login_user
+
+from app import create_app, db
+from app.models import File, User
+from config import Config
+
+from benchmarks.synthetic import PASSWORD, build_tree
+
+SAMPLE_SIZE = 200
+UPLOADS_PER_ROUND = 20
+
+_benchmarks = {}
+
+
+def benchmark(name):
+    """Registers ``setup(ctx)``, which returns ``(run_one_round, ops_per_round)``.
+
+    Setup runs inside an app context; rounds do not, so each one pushes its
+    own (or goes through the test client) and starts with a fresh session,
+    as a request would.
+    """
+    def register(setup):
+        _benchmarks[name] = setup
+        return setup
+    return register
+
+
+class Context:
+    def __init__(self, app, tree):
+        self.app = app
+        self.tree = tree
+        self.user_id = db.session.query(User.id).filter_by(username='user_0').scalar()
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+
+    def client(self):
+        client = self.app.test_client()
+        response = client.post('/auth/login', data={'username': 'user_0', 'password': PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError('Benchmark login failed')
+        return client
+
+    def own_folders(self, depth):
+        """Ids of user_0's folders ``depth`` levels below its root (1 = root folders)."""
+        return [
+            folder_id for folder_id, tree_path in db.session.query(File.id, File.tree_path).filter(
+                File.owner_id == self.user_id, File.is_folder.is_(True)
+            ).order_by(File.id)
+            if tree_path.count('/') == depth
+        ]
+
+
+@benchmark('list_files')
+def _list_files(ctx):
+    client = ctx.client()
+    shared = [
+        file_id for (file_id,) in db.session.query(File.id).filter(
+            File.owner_id != ctx.user_id, File.is_folder.is_(True)
+        ).order_by(File.id).limit(10)
+    ]
+    urls = ['/api/files'] + [f'/api/files?parent_id={folder_id}' for folder_id in ctx.own_folders(1)[:10]]
+    # Shared folders the user cannot read answer 403 quickly; they still exercise the check.
+    urls += [f'/api/files?parent_id={folder_id}' for folder_id in shared]
+
+    def run():
+        for url in urls:
+            client.get(url)
+    return run, len(urls)
+
+
+@benchmark('has_access')
+def _has_access_bench(ctx):
+    from app.routes.files import _build_permission_cache, _has_access
+
+    ids = [
+        file_id for (file_id,) in db.session.query(File.id).filter(File.owner_id != ctx.user_id).order_by(File.id)
+    ][::7][:SAMPLE_SIZE * 10]
+
+    def run():
+        with ctx.app.test_request_context():
+            login_user(db.session.get(User, ctx.user_id))
+            files = File.query.filter(File.id.in_(ids)).all()
+            permissions = _build_permission_cache()
+            for file_obj in files:
+                _has_access(file_obj, permissions)
+    return run, len(ids)
+
+
+@benchmark('resolve_disk_path')
+def _resolve_disk_path_bench(ctx):
+    from app.routes.files import _resolve_disk_path
+
+    ids = ctx.own_folders(ctx.tree['depth'])[:SAMPLE_SIZE]
+
+    def run():
+        with ctx.app.app_context():
+            for folder in File.query.filter(File.id.in_(ids)):
+                _resolve_disk_path(folder.owner_id, folder)
+    return run, len(ids)
+
+
+@benchmark('build_folder_rows')
+def _build_folder_rows_bench(ctx):
+    from app.routes.admin import _build_folder_rows
+
+    def run():
+        with ctx.app.app_context():
+            _build_folder_rows()
+    return run, 1
+
+
+@benchmark('upload_file')
+def _upload_file_bench(ctx):
+    client = ctx.client()
+    parent_id = ctx.own_folders(1)[0]
+    payload = b'x' * 4096
+    counter = iter(range(sys.maxsize))
+
+    def run():
+        for _ in range(UPLOADS_PER_ROUND):
+            response = client.post(
+                '/api/files/upload',
+                data={'parent_id': str(parent_id), 'file': (io.BytesIO(payload), f'upload_{next(counter)}.bin')},
+                content_type='multipart/form-data'
+            )
+            if response.status_code != 201:
+                raise RuntimeError(f'Upload failed with {response.status_code}')
+    return run, UPLOADS_PER_ROUND
+
+
+@benchmark('build_zip_for_file')
+def _build_zip_bench(ctx):
+    from app.routes.files import _build_zip_for_file
+
+    folder_id = ctx.own_folders(1)[-1]
+
+    def run():
+        with ctx.app.app_context():
+            for _chunk in _build_zip_for_file(db.session.get(File, folder_id)):
+                pass
+    return run, 1
+
+
+@benchmark('sync_directory')
+def _sync_directory_bench(ctx):
+    from app.cli import _sync_directory
+
+    path = os.path.join(ctx.upload_folder, f'user_{ctx.user_id}')
+
+    def run():
+        with ctx.app.app_context():
+            _sync_directory(path, ctx.user_id)
+    return run, 1
+
+
+@benchmark('sync_directory_incremental')
+def _sync_directory_incremental_bench(ctx):
+    from app.cli import _sync_directory
+
+    path = os.path.join(ctx.upload_folder, f'user_{ctx.user_id}')
+
+    def run():
+        with ctx.app.app_context():
+            _sync_directory(path, ctx.user_id, incremental=True)
+    return run, 1
+
+
+def _measure(run, repeat):
+    run()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _summary(timings, ops):
+    median = statistics.median(timings)
+    return {
+        'ops_per_round': ops,
+        'rounds': len(timings),
+        'min_s': min(timings),
+        'median_s': median,
+        'mean_s': statistics.fmean(timings),
+        'stdev_s': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'median_per_op_us': median / ops * 1e6 if ops else None,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _make_config(workdir):
+    class BenchmarkConfig(Config):
+        DEBUG = False
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(workdir, 'benchmark.db')
+        UPLOAD_FOLDER = os.path.join(workdir, 'uploads')
+        UPLOAD_STAGING_FOLDER = None
+        JOB_ARTIFACT_FOLDER = os.path.join(workdir, 'job_artifacts')
+        ARCHIVE_CACHE_FOLDER = os.path.join(workdir, 'archive_cache')
+        THUMBNAIL_CACHE_FOLDER = os.path.join(workdir, 'thumbnail_cache')
+        UPLOAD_WATCHER_ENABLED = False
+        BLOB_STORE_ENABLED = False
+        TRASH_PURGE_IN_BACKGROUND = False
+        METRICS_ENABLED = False
+        SQL_PROFILING = False
+    return BenchmarkConfig
+
+
+def run_benchmarks(args):
+    workdir = tempfile.mkdtemp(prefix='fileserv-bench-')
+    try:
+        app = create_app(_make_config(workdir))
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            tree = build_tree(
+                app.config['UPLOAD_FOLDER'],
+                users=args.users,
+                depth=args.depth,
+                fanout=args.fanout,
+                files_per_folder=args.files,
+                permission_density=args.density,
+                seed=args.seed
+            )
+            tree['build_seconds'] = time.perf_counter() - started
+            ctx = Context(app, tree)
+
+        results = {}
+        for name, setup in _benchmarks.items():
+            if args.only and name not in args.only:
+                continue
+            with app.app_context():
+                run, ops = setup(ctx)
+            results[name] = _summary(_measure(run, args.repeat), ops)
+            print(f'{name}: median {results[name]["median_s"] * 1000:.2f} ms', file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'tree': tree,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """Prints median ratios against ``baseline``; returns the names slower than ``threshold``."""
+    regressions = []
+    for name, result in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        ratio = result['median_s'] / previous['median_s'] if previous['median_s'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = '  <-- slower'
+        print(
+            f'{name:28} {previous["median_s"] * 1000:10.2f} ms -> {result["median_s"] * 1000:10.2f} ms'
+            f'  x{ratio:.2f}{flag}',
+            file=sys.stderr
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=3, help='Users owning a tree each.')
+    parser.add_argument('--depth', type=int, default=3, help='Folder levels below each user root.')
+    parser.add_argument('--fanout', type=int, default=4, help='Subfolders per folder.')
+    parser.add_argument('--files', type=int, default=5, help='Files per folder.')
+    parser.add_argument('--density', type=float, default=0.05,
+                        help="Share of the other users' folders each user is granted.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help='Timed rounds per benchmark.')
+    parser.add_argument('--only', nargs='+', choices=sorted(_benchmarks), help='Run only these benchmarks.')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+    parser.add_argument('--compare', help='Earlier JSON report to compare medians against.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='With --compare, fail when a median exceeds the baseline by this factor.')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        if baseline['meta'].get('tree', {}).get('files') != report['meta']['tree']['files']:
+            print('Warning: the baseline was run on a different tree size.', file=sys.stderr)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
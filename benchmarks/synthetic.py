@@ -0,0 +1,131 @@
+"""Synthetic file trees for the benchmarks.
+
+Every user gets ``fanout`` root folders, each holding ``fanout`` subfolders
+down to ``depth`` levels, with ``files_per_folder`` small files in every
+folder. Rows go in with bulk INSERTs carrying ``tree_path`` and
+``full_path`` (mapper events are skipped), and the same tree is written
+under ``UPLOAD_FOLDER/user_<id>`` so disk-backed code paths find it.
+Each user is granted access to roughly ``permission_density`` of the other
+users' folders.
+"""
+import os
+import random
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app import db
+from app.models import File, Role, User, UserFilePermission
+
+FILE_CONTENT = b'benchmark payload\n' * 16
+PASSWORD = 'benchmark'
+
+
+def create_users(count):
+    """Creates ``admin`` and ``user_0`` .. ``user_<count - 1>``; returns the regular users."""
+    Role.insert_roles()
+    admin = User(username='admin')
+    admin.set_password(PASSWORD)
+    db.session.add(admin)
+    users = []
+    for index in range(count):
+        user = User(username=f'user_{index}')
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        users.append(user)
+    db.session.commit()
+    return users
+
+
+def _build_owner_tree(upload_folder, owner_id, depth, fanout, files_per_folder, now):
+    """Returns the ids of the owner's folders, level by level."""
+    levels = []
+    # (folder id, tree_path of its children, full_path, disk path)
+    parents = [(None, '/', '', os.path.join(upload_folder, f'user_{owner_id}'))]
+    os.makedirs(parents[0][3], exist_ok=True)
+    for level in range(depth):
+        rows = []
+        disk_paths = {}
+        for parent_id, child_tree_path, parent_full_path, parent_disk in parents:
+            for index in range(fanout):
+                name = f'folder_{level}_{index}'
+                rows.append({
+                    'filename': name,
+                    'owner_id': owner_id,
+                    'parent_id': parent_id,
+                    'is_folder': True,
+                    'tree_path': child_tree_path,
+                    'full_path': f'{parent_full_path}/{name}'
+                })
+                disk_paths[(parent_id, name)] = os.path.join(parent_disk, name)
+        created = db.session.execute(
+            insert(File).returning(File.id, File.parent_id, File.filename, File.tree_path, File.full_path), rows
+        )
+        next_parents = []
+        for folder_id, parent_id, name, tree_path, full_path in created:
+            disk_path = disk_paths[(parent_id, name)]
+            os.makedirs(disk_path, exist_ok=True)
+            next_parents.append((folder_id, f'{tree_path}{folder_id}/', full_path, disk_path))
+        levels.append([folder[0] for folder in next_parents])
+
+        files = []
+        for folder_id, child_tree_path, full_path, disk_path in next_parents:
+            for index in range(files_per_folder):
+                name = f'file_{index}.txt'
+                with open(os.path.join(disk_path, name), 'wb') as handle:
+                    handle.write(FILE_CONTENT)
+                files.append({
+                    'filename': name,
+                    'owner_id': owner_id,
+                    'parent_id': folder_id,
+                    'is_folder': False,
+                    'tree_path': child_tree_path,
+                    'full_path': f'{full_path}/{name}',
+                    'size': len(FILE_CONTENT),
+                    'mtime': now
+                })
+        if files:
+            db.session.execute(insert(File), files)
+        parents = next_parents
+    return levels
+
+
+def build_tree(upload_folder, users=3, depth=3, fanout=4, files_per_folder=5, permission_density=0.05, seed=0):
+    """Populates the database and ``upload_folder``; returns a summary dict."""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    owners = create_users(users)
+    folders = {}
+    for owner in owners:
+        levels = _build_owner_tree(upload_folder, owner.id, depth, fanout, files_per_folder, now)
+        folders[owner.id] = [folder_id for level in levels for folder_id in level]
+    db.session.commit()
+
+    grants = []
+    for user in owners:
+        for owner_id, folder_ids in folders.items():
+            if owner_id == user.id:
+                continue
+            for folder_id in folder_ids:
+                if rng.random() < permission_density:
+                    grants.append({
+                        'user_id': user.id,
+                        'file_id': folder_id,
+                        'can_read': True,
+                        'can_write': rng.random() < 0.5
+                    })
+    if grants:
+        db.session.execute(insert(UserFilePermission), grants)
+    db.session.commit()
+
+    return {
+        'users': users,
+        'depth': depth,
+        'fanout': fanout,
+        'files_per_folder': files_per_folder,
+        'permission_density': permission_density,
+        'seed': seed,
+        'folders': sum(len(folder_ids) for folder_ids in folders.values()),
+        'files': File.query.filter(File.is_folder.is_(False)).count(),
+        'grants': len(grants),
+    }
@@ -10,4 +10,53 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(basedir, 'instance', 'uploads')
-    ASSET_VERSION = os.environ.get('ASSET_VERSION', '20251108')
+    # Resumable uploads are staged here; it must live on the same filesystem
+    # as UPLOAD_FOLDER so completion is a rename. Defaults to UPLOAD_FOLDER/.staging.
+    UPLOAD_STAGING_FOLDER = os.environ.get('UPLOAD_STAGING_FOLDER')
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    UPLOAD_BATCH_MAX_FILES = int(os.environ.get('UPLOAD_BATCH_MAX_FILES', 200))
+    # Largest file accepted by the multipart upload endpoints, in bytes; 0 means no limit.
+    UPLOAD_MAX_FILE_SIZE = int(os.environ.get('UPLOAD_MAX_FILE_SIZE', 0))
+    # Set when `flask watch-uploads` runs alongside the app; listings then
+    # trust the database instead of checking every entry on disk.
+    UPLOAD_WATCHER_ENABLED = os.environ.get('UPLOAD_WATCHER_ENABLED', '').lower() in ('1', 'true', 'yes')
+    UPLOAD_WATCHER_SETTLE = float(os.environ.get('UPLOAD_WATCHER_SETTLE', 2.0))
+    FILE_LIST_MAX_PAGE_SIZE = int(os.environ.get('FILE_LIST_MAX_PAGE_SIZE', 1000))
+    # Store uploads once per SHA-256 under UPLOAD_FOLDER/.blobs and hard-link
+    # them into user folders (see app/blobs.py).
+    BLOB_STORE_ENABLED = os.environ.get('BLOB_STORE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    # '' serves downloads from Python; 'x-accel-redirect' (nginx) or
+    # 'x-sendfile' (Apache/lighttpd) hand them to the front proxy after the
+    # permission check. For nginx, DOWNLOAD_ACCEL_PREFIX must be an
+    # `internal` location aliased to UPLOAD_FOLDER.
+    DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD', '').lower()
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')
+    # Deleted entries are renamed into UPLOAD_FOLDER/.trash and removed by a
+    # background thread after commit; set to 0 to leave that to `flask purge-trash`.
+    TRASH_PURGE_IN_BACKGROUND = os.environ.get('TRASH_PURGE_IN_BACKGROUND', '1').lower() in ('1', 'true', 'yes')
+    # Queued jobs (archives, trash purges, syncs) are run by `flask jobs-worker`;
+    # finished artifacts are kept under JOB_ARTIFACT_FOLDER for JOB_ARTIFACT_TTL seconds.
+    JOB_ARTIFACT_FOLDER = os.environ.get('JOB_ARTIFACT_FOLDER') or os.path.join(basedir, 'instance', 'job_artifacts')
+    JOB_ARTIFACT_TTL = int(os.environ.get('JOB_ARTIFACT_TTL', 24 * 3600))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+    ARCHIVE_WORKERS = int(os.environ.get('ARCHIVE_WORKERS', os.cpu_count() or 1))
+    # Folder ZIPs are kept here, keyed by the folder's content, and reused
+    # until it changes; least recently used ones go once the budget is exceeded.
+    # 0 disables the cache.
+    ARCHIVE_CACHE_FOLDER = os.environ.get('ARCHIVE_CACHE_FOLDER') or os.path.join(basedir, 'instance', 'archive_cache')
+    ARCHIVE_CACHE_MAX_BYTES = int(os.environ.get('ARCHIVE_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+    # Image previews for the grid view (needs Pillow); 0 disables them.
+    THUMBNAIL_CACHE_FOLDER = os.environ.get('THUMBNAIL_CACHE_FOLDER') or os.path.join(basedir, 'instance', 'thumbnail_cache')
+    THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', 512 * 1024 ** 2))
+    THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+    THUMBNAIL_MAX_SOURCE_BYTES = int(os.environ.get('THUMBNAIL_MAX_SOURCE_BYTES', 64 * 1024 ** 2))
+    # Prometheus metrics at /metrics (needs prometheus_client). When
+    # METRICS_TOKEN is set, scrapers must send it as a Bearer token.
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Log every request's SQL with timings and call sites, flagging a statement
+    # repeated this many times from one place as N+1. Admins can also turn it
+    # on for a single request with the X-Profile-SQL header.
+    SQL_PROFILING = os.environ.get('SQL_PROFILING', '').lower() in ('1', 'true', 'yes')
+    SQL_PROFILING_REPEAT_THRESHOLD = int(os.environ.get('SQL_PROFILING_REPEAT_THRESHOLD', 5))
+    ASSET_VERSION = os.environ.get('ASSET_VERSION', '20251116')
@@ -0,0 +1,51 @@
+"""Add materialized tree_path to files
+
+Revision ID: 7c2e4a91d5b3
+Revises: 3b1f6c2d9a4e
+Create Date: 2026-10-18 11:40:07.518362
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2e4a91d5b3'
+down_revision = '3b1f6c2d9a4e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tree_path', sa.Text(), nullable=True))
+
+    # Backfill every row from its parent chain in a single statement. Postgres
+    # joins the CTE once; SQLite has no UPDATE ... FROM before 3.33, so it
+    # falls back to a correlated lookup per row.
+    tree = """
+        WITH RECURSIVE tree(id, tree_path) AS (
+            SELECT id, CAST('/' AS TEXT) FROM files WHERE parent_id IS NULL
+            UNION ALL
+            SELECT f.id, t.tree_path || CAST(t.id AS TEXT) || '/'
+            FROM files f JOIN tree t ON f.parent_id = t.id
+        )
+    """
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(tree + 'UPDATE files SET tree_path = tree.tree_path FROM tree WHERE tree.id = files.id')
+    else:
+        op.execute(tree + 'UPDATE files SET tree_path = (SELECT tree.tree_path FROM tree WHERE tree.id = files.id)')
+    op.execute("UPDATE files SET tree_path = '/' WHERE tree_path IS NULL")
+
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.alter_column('tree_path', existing_type=sa.Text(), nullable=False)
+        batch_op.create_index(
+            'ix_files_tree_path', ['tree_path'], unique=False,
+            postgresql_ops={'tree_path': 'text_pattern_ops'}
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_index('ix_files_tree_path')
+        batch_op.drop_column('tree_path')
@@ -0,0 +1,24 @@
+"""Add mtime to blobs
+
+Revision ID: a6c2e9f4b1d8
+Revises: d8f1a3c6e2b7
+Create Date: 2026-10-18 21:04:37.118524
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c2e9f4b1d8'
+down_revision = 'd8f1a3c6e2b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('blobs', sa.Column('mtime', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('blobs', 'mtime')
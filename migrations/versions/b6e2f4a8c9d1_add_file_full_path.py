@@ -0,0 +1,45 @@
+"""Add searchable full_path to files
+
+Revision ID: b6e2f4a8c9d1
+Revises: a3d5e9c1b284
+Create Date: 2026-10-18 16:05:41.203118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2f4a8c9d1'
+down_revision = 'a3d5e9c1b284'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('files', sa.Column('full_path', sa.Text(), nullable=True))
+
+    # Same backfill as tree_path: one join on Postgres, a correlated lookup on SQLite.
+    tree = """
+        WITH RECURSIVE tree(id, full_path) AS (
+            SELECT id, '/' || filename FROM files WHERE parent_id IS NULL
+            UNION ALL
+            SELECT f.id, t.full_path || '/' || f.filename
+            FROM files f JOIN tree t ON f.parent_id = t.id
+        )
+    """
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(tree + 'UPDATE files SET full_path = tree.full_path FROM tree WHERE tree.id = files.id')
+    else:
+        op.execute(tree + 'UPDATE files SET full_path = (SELECT tree.full_path FROM tree WHERE tree.id = files.id)')
+
+    # Substring search (/api/search) uses a trigram index where available.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE INDEX ix_files_full_path_trgm ON files USING gin (lower(full_path) gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_files_full_path_trgm')
+    op.drop_column('files', 'full_path')
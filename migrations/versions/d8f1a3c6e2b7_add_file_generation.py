@@ -0,0 +1,24 @@
+"""Add folder generation counter to files
+
+Revision ID: d8f1a3c6e2b7
+Revises: b6e2f4a8c9d1
+Create Date: 2026-10-18 18:22:09.641275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f1a3c6e2b7'
+down_revision = 'b6e2f4a8c9d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('files', sa.Column('generation', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('files', 'generation')
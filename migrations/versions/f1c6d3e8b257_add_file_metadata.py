@@ -0,0 +1,41 @@
+"""Add size, mtime and checksum to files
+
+Revision ID: f1c6d3e8b257
+Revises: e7f3b8a2c419
+Create Date: 2026-10-18 17:36:05.471920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c6d3e8b257'
+down_revision = 'e7f3b8a2c419'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ALTERs: a batch rebuild of "files" on SQLite would drop the
+    # expression index ix_files_parent_name.
+    op.add_column('files', sa.Column('size', sa.BigInteger(), nullable=True))
+    op.add_column('files', sa.Column('mtime', sa.DateTime(), nullable=True))
+    op.add_column('files', sa.Column('checksum', sa.String(length=64), nullable=True))
+
+    # Rows backed by the blob store already know their size and hash; the
+    # rest are filled in from disk by `flask backfill-metadata`.
+    op.execute(
+        """
+        UPDATE files
+        SET size = (SELECT blobs.size FROM blobs WHERE blobs.id = files.blob_id),
+            checksum = (SELECT blobs.sha256 FROM blobs WHERE blobs.id = files.blob_id)
+        WHERE blob_id IS NOT NULL
+        """
+    )
+
+
+def downgrade():
+    op.drop_column('files', 'checksum')
+    op.drop_column('files', 'mtime')
+    op.drop_column('files', 'size')
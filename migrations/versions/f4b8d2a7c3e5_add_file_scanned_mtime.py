@@ -0,0 +1,27 @@
+"""Add scanned_mtime to files
+
+Revision ID: f4b8d2a7c3e5
+Revises: a6c2e9f4b1d8
+Create Date: 2026-10-18 21:37:52.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b8d2a7c3e5'
+down_revision = 'a6c2e9f4b1d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('files', sa.Column('scanned_mtime', sa.DateTime(), nullable=True))
+    # sync-uploads used to keep its scan marker in mtime, which is NULL for folders.
+    op.execute(sa.text('UPDATE files SET scanned_mtime = mtime, mtime = NULL WHERE is_folder'))
+
+
+def downgrade():
+    op.execute(sa.text('UPDATE files SET mtime = scanned_mtime WHERE is_folder'))
+    op.drop_column('files', 'scanned_mtime')
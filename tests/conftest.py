@@ -0,0 +1,51 @@
+import pytest
+
+from app import create_app, db, permissions
+from app.models import Role, User
+from config import Config
+
+PASSWORD = 'pw'
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'test.db')
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        UPLOAD_STAGING_FOLDER = None
+        JOB_ARTIFACT_FOLDER = str(tmp_path / 'job_artifacts')
+        ARCHIVE_CACHE_FOLDER = str(tmp_path / 'archive_cache')
+        THUMBNAIL_CACHE_FOLDER = str(tmp_path / 'thumbnail_cache')
+        UPLOAD_WATCHER_ENABLED = False
+        BLOB_STORE_ENABLED = False
+        TRASH_PURGE_IN_BACKGROUND = False
+        SQL_PROFILING = False
+
+    # Indexes are cached per process by user id, and every test reuses the same ids.
+    permissions._cache.clear()
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        for username in ('admin', 'alice', 'bob'):
+            user = User(username=username)
+            user.set_password(PASSWORD)
+            db.session.add(user)
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def login(app):
+    """Returns a test client logged in as the given user."""
+    def login(username):
+        client = app.test_client()
+        response = client.post('/auth/login', data={'username': username, 'password': PASSWORD})
+        assert response.status_code == 302
+        return client
+    return login
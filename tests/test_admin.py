@@ -0,0 +1,25 @@
+import re
+
+import app.routes.admin as admin_routes
+from app.models import File, User
+
+
+def _paths(response):
+    assert response.status_code == 200
+    return re.findall(r'<td><code>([^<]+)</code></td>', response.get_data(as_text=True))
+
+
+def test_permissions_page_lists_one_level_per_page(app, login, monkeypatch):
+    alice = login('alice')
+    paths = [f'r{i}/s{j}' for i in range(3) for j in range(2)]
+    assert alice.post('/api/folders/batch', json={'paths': paths}).status_code == 201
+    with app.app_context():
+        bob_id = User.query.filter_by(username='bob').one().id
+        r1 = File.query.filter_by(filename='r1', parent_id=None).one().id
+
+    monkeypatch.setattr(admin_routes, 'FOLDER_ROWS_PER_PAGE', 2)
+    admin = login('admin')
+    url = f'/admin/users/manage_permissions/{bob_id}'
+    assert _paths(admin.get(url)) == ['/r0', '/r1']
+    assert _paths(admin.get(url + '?page=2')) == ['/r2']
+    assert _paths(admin.get(url + f'?root={r1}')) == ['/r1', '/r1/s0', '/r1/s1']
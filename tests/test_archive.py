@@ -0,0 +1,74 @@
+import io
+import os
+import zipfile
+
+from app.archive import (
+    CHUNK_SIZE, ZIP_DEFLATED, ZIP_STORED, compression_for, iter_folder_members, stream_zip
+)
+
+
+def _tree(root):
+    os.makedirs(os.path.join(root, 'sub'))
+    os.makedirs(os.path.join(root, 'empty'))
+    contents = {
+        'a.txt': b'hello ' * 1000,
+        'sub/big.bin': os.urandom(1024) * 3000,
+    }
+    for name, data in contents.items():
+        with open(os.path.join(root, name), 'wb') as handle:
+            handle.write(data)
+    return contents
+
+
+def test_streamed_archive_round_trips(tmp_path):
+    root = str(tmp_path / 'folder')
+    contents = _tree(root)
+
+    for workers in (1, 4):
+        data = b''.join(stream_zip(iter_folder_members(root, 'folder'), workers=workers, chunk_size=64 * 1024))
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.testzip() is None
+            assert 'folder/empty/' in archive.namelist()
+            for name, expected in contents.items():
+                assert archive.read(f'folder/{name}') == expected
+
+
+def test_bulk_download_streams_every_selection(login):
+    client = login('alice')
+    folder = client.post('/api/folders', json={'folder_name': 'docs'}).get_json()
+    client.post(
+        '/api/files/upload',
+        data={'parent_id': str(folder['id']), 'file': (io.BytesIO(b'inside'), 'a.txt')},
+        content_type='multipart/form-data'
+    ).get_json()
+    loose = client.post(
+        '/api/files/upload',
+        data={'file': (io.BytesIO(b'loose'), 'b.txt')},
+        content_type='multipart/form-data'
+    ).get_json()
+
+    response = client.post('/api/files/download', json={'ids': [folder['id'], loose['id']]})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+        assert archive.read('docs/a.txt') == b'inside'
+        assert archive.read('b.txt') == b'loose'
+
+
+def test_compression_follows_name_size_and_content():
+    text = b'compressible text ' * 4096
+    assert compression_for('photo.JPG', 10, text) == (ZIP_STORED, 0)
+    assert compression_for('empty.txt', 0, b'') == (ZIP_STORED, 0)
+    assert compression_for('random.dat', CHUNK_SIZE, os.urandom(64 * 1024)) == (ZIP_STORED, 0)
+    assert compression_for('small.txt', len(text), text) == (ZIP_DEFLATED, 9)
+    assert compression_for('medium.txt', 10 * CHUNK_SIZE, text) == (ZIP_DEFLATED, 6)
+    assert compression_for('large.txt', 1024 * CHUNK_SIZE, text) == (ZIP_DEFLATED, 1)
+
+
+def test_stored_members_are_written_uncompressed(tmp_path):
+    path = tmp_path / 'noise.bin'
+    path.write_bytes(os.urandom(200 * 1024))
+    data = b''.join(stream_zip([(str(path), 'noise.bin'), (str(path), 'noise.zip')]))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert {info.compress_type for info in archive.infolist()} == {zipfile.ZIP_STORED}
+        assert archive.read('noise.zip') == path.read_bytes()
@@ -0,0 +1,57 @@
+import io
+
+from app import db
+from app.models import File
+
+
+def _generations(app):
+    with app.app_context():
+        return {row.filename: row.generation for row in File.query.filter(File.is_folder.is_(True))}
+
+
+def _upload(client, name, parent_id):
+    response = client.post(
+        '/api/files/upload',
+        data={'parent_id': str(parent_id), 'file': (io.BytesIO(b'data'), name)},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def test_writes_bump_every_ancestor_generation(app, login):
+    client = login('alice')
+    folders = client.post('/api/folders/batch', json={'paths': ['a/b/c', 'other']}).get_json()['folders']
+
+    before = _generations(app)
+    file_id = _upload(client, 'x.txt', folders['a/b/c'])
+    after_upload = _generations(app)
+    assert all(after_upload[name] > before[name] for name in 'abc')
+    assert after_upload['other'] == before['other']
+
+    assert client.delete(f'/api/files/{file_id}').status_code == 200
+    after_delete = _generations(app)
+    assert all(after_delete[name] > after_upload[name] for name in 'abc')
+
+    with app.app_context():
+        c = db.session.get(File, folders['a/b/c'])
+        c.move_to(db.session.get(File, folders['other']))
+        db.session.commit()
+    after_move = _generations(app)
+    assert after_move['b'] > after_delete['b'] and after_move['other'] > after_delete['other']
+
+
+def test_folder_zip_is_cached_until_the_folder_changes(app, login):
+    client = login('alice')
+    folder_id = client.post('/api/folders', json={'folder_name': 'docs'}).get_json()['id']
+    _upload(client, 'one.txt', folder_id)
+
+    first = client.get(f'/api/files/download/{folder_id}')
+    first.get_data()  # the archive is cached as it is streamed
+    etag = first.headers['ETag']
+    assert client.get(f'/api/files/download/{folder_id}', headers={'If-None-Match': etag}).status_code == 304
+
+    _upload(client, 'two.txt', folder_id)
+    changed = client.get(f'/api/files/download/{folder_id}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
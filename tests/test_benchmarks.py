@@ -0,0 +1,26 @@
+import json
+
+from benchmarks.run import compare, main
+
+
+def _report(**medians):
+    return {'results': {name: {'median_s': median} for name, median in medians.items()}}
+
+
+def test_compare_flags_only_regressions_past_the_threshold():
+    baseline = _report(fast=1.0, slow=1.0, gone=1.0)
+    report = _report(fast=0.5, slow=1.5, new=2.0)
+    assert compare(report, baseline, 1.25) == ['slow']
+    assert compare(report, baseline, 2.0) == []
+
+
+def test_suite_writes_a_report_and_compares_against_it(tmp_path):
+    output = tmp_path / 'report.json'
+    args = ['--users', '2', '--depth', '1', '--fanout', '2', '--files', '1', '--repeat', '1',
+            '--only', 'list_files', 'has_access', '--output', str(output)]
+    assert main(args) == 0
+
+    report = json.loads(output.read_text())
+    assert set(report['results']) == {'list_files', 'has_access'}
+    assert report['meta']['repeat'] == 1
+    assert main(args + ['--compare', str(output), '--threshold', '1000']) == 0
@@ -0,0 +1,88 @@
+import hashlib
+import io
+import os
+import stat
+
+from app import db
+from app.blobs import blob_path, release
+from app.models import Blob, File
+
+
+def _upload(client, name, data):
+    response = client.post(
+        '/api/files/upload',
+        data={'file': (io.BytesIO(data), name)},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def test_identical_uploads_share_one_read_only_blob(app, login):
+    app.config['BLOB_STORE_ENABLED'] = True
+    _upload(login('alice'), 'a.txt', b'same bytes')
+    _upload(login('bob'), 'b.txt', b'same bytes')
+
+    with app.app_context():
+        blob = Blob.query.one()
+        assert blob.ref_count == 2
+        stored = os.stat(blob_path(blob.sha256))
+        assert stored.st_nlink == 3
+        assert not stored.st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+def test_upload_is_kept_apart_from_a_blob_changed_on_disk(app, login):
+    app.config['BLOB_STORE_ENABLED'] = True
+    _upload(login('alice'), 'a.txt', b'original')
+    alice_path = os.path.join(app.config['UPLOAD_FOLDER'], 'user_2', 'a.txt')
+    os.chmod(alice_path, 0o644)
+    with open(alice_path, 'wb') as handle:
+        handle.write(b'edited in place')
+
+    uploaded = _upload(login('bob'), 'b.txt', b'original')
+
+    with app.app_context():
+        assert db.session.get(File, uploaded['id']).blob_id is None
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], 'user_3', 'b.txt'), 'rb') as handle:
+        assert handle.read() == b'original'
+
+
+def test_released_blob_survives_a_rollback(app, login):
+    app.config['BLOB_STORE_ENABLED'] = True
+    _upload(login('alice'), 'a.txt', b'content')
+
+    with app.app_context():
+        blob = Blob.query.one()
+        path = blob_path(blob.sha256)
+        release({blob.id: 1})
+        assert not os.path.exists(path)
+        db.session.rollback()
+        assert os.path.exists(path)
+
+        release({blob.id: 1})
+        db.session.commit()
+        assert not os.path.exists(path)
+        assert Blob.query.count() == 0
+
+
+def test_known_content_is_linked_after_the_challenge(app, login):
+    app.config['BLOB_STORE_ENABLED'] = True
+    content = os.urandom(200 * 1024)
+    _upload(login('alice'), 'a.bin', content)
+    bob = login('bob')
+    body = {'sha256': hashlib.sha256(content).hexdigest(), 'size': len(content)}
+
+    precheck = bob.post('/api/files/uploads/precheck', json=body).get_json()
+    assert precheck['found'] is True
+    offset, length = precheck['challenge']['offset'], precheck['challenge']['length']
+    link = dict(body, filename='b.bin', token=precheck['token'])
+
+    assert bob.post('/api/files/uploads/link', json=dict(link, proof='0' * 64)).status_code == 403
+    proof = hashlib.sha256(content[offset:offset + length]).hexdigest()
+    response = bob.post('/api/files/uploads/link', json=dict(link, proof=proof))
+    assert response.status_code == 201
+    assert bob.get(f'/api/files/download/{response.get_json()["id"]}').data == content
+    assert login('alice').post('/api/files/uploads/link', json=dict(link, proof=proof)).status_code == 403
+
+    unknown = dict(body, sha256=hashlib.sha256(b'other').hexdigest())
+    assert bob.post('/api/files/uploads/precheck', json=unknown).get_json()['found'] is False
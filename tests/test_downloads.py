@@ -0,0 +1,38 @@
+import io
+import os
+
+
+def _upload(client, name, data):
+    response = client.post(
+        '/api/files/upload',
+        data={'file': (io.BytesIO(data), name)},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def test_etag_is_the_checksum_while_the_file_is_unchanged(login):
+    client = login('alice')
+    uploaded = _upload(client, 'a.txt', b'first')
+
+    response = client.get(f'/api/files/download/{uploaded["id"]}')
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{uploaded["checksum"]}"'
+    again = client.get(f'/api/files/download/{uploaded["id"]}', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_etag_falls_back_to_stat_when_the_file_changed_on_disk(app, login):
+    client = login('alice')
+    uploaded = _upload(client, 'a.txt', b'first')
+    etag = client.get(f'/api/files/download/{uploaded["id"]}').headers['ETag']
+
+    path = os.path.join(app.config['UPLOAD_FOLDER'], 'user_2', 'a.txt')
+    with open(path, 'wb') as handle:
+        handle.write(b'changed outside the app')
+
+    response = client.get(f'/api/files/download/{uploaded["id"]}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.data == b'changed outside the app'
+    assert response.headers['ETag'] != etag
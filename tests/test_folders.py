@@ -0,0 +1,33 @@
+import os
+
+from app import db
+from app.models import File
+
+
+def test_folder_batch_resolves_existing_and_creates_missing(app, login):
+    client = login('alice')
+    first = client.post('/api/folders/batch', json={'paths': ['a/b', 'a/c']})
+    assert first.status_code == 201
+    folders = first.get_json()['folders']
+
+    second = client.post('/api/folders/batch', json={'paths': ['a/b/d', '/a//c/', 'e']}).get_json()['folders']
+    assert second['/a//c/'] == folders['a/c']
+
+    with app.app_context():
+        d = db.session.get(File, second['a/b/d'])
+        assert d.parent_id == folders['a/b']
+        assert d.full_path == '/a/b/d'
+        assert d.tree_path == f'/{d.parent.parent_id}/{folders["a/b"]}/'
+        assert File.query.filter_by(filename='a').count() == 1
+    assert os.path.isdir(os.path.join(app.config['UPLOAD_FOLDER'], 'user_2', 'a', 'b', 'd'))
+
+
+def test_folder_batch_below_a_parent_needs_write_access(login):
+    alice = login('alice')
+    parent = alice.post('/api/folders', json={'folder_name': 'shared'}).get_json()['id']
+    nested = alice.post('/api/folders/batch', json={'paths': ['x'], 'parent_id': parent}).get_json()
+    assert nested['parent_id'] == parent
+
+    bob = login('bob')
+    assert bob.post('/api/folders/batch', json={'paths': ['x'], 'parent_id': parent}).status_code == 403
+    assert bob.post('/api/folders/batch', json={'paths': 'x'}).status_code == 400
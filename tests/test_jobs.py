@@ -0,0 +1,42 @@
+import io
+import zipfile
+
+from app import db
+from app.jobs import enqueue, run_worker
+from app.models import Job
+
+
+def test_archive_job_runs_on_the_worker(app, login):
+    alice = login('alice')
+    uploaded = alice.post(
+        '/api/files/upload',
+        data={'file': (io.BytesIO(b'queued'), 'a.txt')},
+        content_type='multipart/form-data'
+    ).get_json()
+
+    queued = alice.post('/api/jobs/archive', json={'ids': [uploaded['id']]})
+    assert queued.status_code == 202
+    job_id = queued.get_json()['id']
+    assert alice.get(f'/api/jobs/{job_id}/artifact').status_code == 409
+    assert login('bob').get(f'/api/jobs/{job_id}').status_code == 404
+
+    with app.app_context():
+        run_worker(once=True)
+
+    job = alice.get(f'/api/jobs/{job_id}').get_json()
+    assert job['status'] == 'done'
+    artifact = alice.get(f'/api/jobs/{job_id}/artifact')
+    assert artifact.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(artifact.get_data())) as archive:
+        assert archive.read('a.txt') == b'queued'
+
+
+def test_failed_jobs_record_the_error(app):
+    with app.app_context():
+        job = enqueue('archive', file_ids=[12345])
+        db.session.commit()
+        run_worker(once=True)
+        db.session.expire_all()
+        job = db.session.get(Job, job.id)
+        assert job.status == 'failed'
+        assert job.error == 'Nothing left to archive'
@@ -0,0 +1,50 @@
+from app import db
+from app.models import User, UserFilePermission
+from app.permissions import invalidate
+
+
+NAMES = ['alpha', 'Beta', 'zeta', 'Zulu', 'Ágata', 'Élan', 'ágil', 'éter']
+
+
+def _page_through(client, url):
+    seen = []
+    cursor = None
+    while True:
+        response = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+        assert response.status_code == 200
+        body = response.get_json()
+        seen.extend(item['filename'] for item in body['items'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return seen
+
+
+def test_list_files_pages_through_non_ascii_names(login):
+    client = login('alice')
+    for name in NAMES:
+        assert client.post('/api/folders', json={'folder_name': name}).status_code == 201
+
+    full = [item['filename'] for item in client.get('/api/files').get_json()]
+    assert sorted(full) == sorted(NAMES)
+    for order in ('asc', 'desc'):
+        paged = _page_through(client, f'/api/files?limit=1&order={order}')
+        assert paged == (full if order == 'asc' else full[::-1])
+
+
+
+def test_root_listing_shows_owned_and_shared_roots(app, login):
+    alice = login('alice')
+    folders = alice.post('/api/folders/batch', json={'paths': ['shared', 'private', 'private/nested']}).get_json()
+    folders = folders['folders']
+    login('bob').post('/api/folders', json={'folder_name': 'own'})
+    with app.app_context():
+        bob = User.query.filter_by(username='bob').one()
+        for name in ('shared', 'private/nested'):
+            db.session.add(UserFilePermission(user_id=bob.id, file_id=folders[name], can_read=True))
+        invalidate([bob.id])
+        db.session.commit()
+
+    names = [item['filename'] for item in login('bob').get('/api/files').get_json()]
+    assert sorted(names) == ['own', 'shared']
+    admin_names = [item['filename'] for item in login('admin').get('/api/files').get_json()]
+    assert sorted(admin_names) == ['own', 'private', 'shared']
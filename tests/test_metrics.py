@@ -0,0 +1,29 @@
+import io
+
+import pytest
+
+from app.jobs import run_worker
+
+prometheus_client = pytest.importorskip('prometheus_client')
+
+
+def _downloaded(endpoint):
+    value = prometheus_client.REGISTRY.get_sample_value('fileserv_downloaded_bytes_total', {'endpoint': endpoint})
+    return value or 0.0
+
+
+def test_job_artifact_downloads_are_counted(app, login):
+    client = login('alice')
+    response = client.post(
+        '/api/files/upload',
+        data={'file': (io.BytesIO(b'artifact content'), 'a.txt')},
+        content_type='multipart/form-data'
+    )
+    job = client.post('/api/jobs/archive', json={'ids': [response.get_json()['id']]}).get_json()
+    with app.app_context():
+        run_worker(once=True)
+
+    before = _downloaded('jobs.get_job_artifact')
+    artifact = client.get(f'/api/jobs/{job["id"]}/artifact')
+    assert artifact.status_code == 200
+    assert _downloaded('jobs.get_job_artifact') - before == len(artifact.data)
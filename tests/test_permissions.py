@@ -0,0 +1,77 @@
+from app import db
+from app.models import File, User, UserFilePermission
+from app.permissions import get_permission_index, invalidate
+
+
+def _grant(app, username, file_id, can_write=False, bump=True):
+    with app.app_context():
+        user = User.query.filter_by(username=username).one()
+        db.session.add(UserFilePermission(user_id=user.id, file_id=file_id, can_read=True, can_write=can_write))
+        if bump:
+            invalidate([user.id])
+        db.session.commit()
+
+
+def test_grant_takes_effect_once_invalidated(app, login):
+    folder = login('alice').post('/api/folders', json={'folder_name': 'docs'}).get_json()['id']
+    bob = login('bob')
+    assert bob.get('/api/files', query_string={'parent_id': folder}).status_code == 403
+
+    _grant(app, 'bob', folder, bump=False)
+    # The cached index is keyed on permissions_version, which nothing bumped.
+    assert bob.get('/api/files', query_string={'parent_id': folder}).status_code == 403
+
+    with app.app_context():
+        invalidate([User.query.filter_by(username='bob').one().id])
+        db.session.commit()
+    assert bob.get('/api/files', query_string={'parent_id': folder}).status_code == 200
+
+
+def test_grants_cover_the_subtree(app, login):
+    alice = login('alice')
+    folders = alice.post('/api/folders/batch', json={'paths': ['a', 'a/b/c']}).get_json()['folders']
+    _grant(app, 'bob', folders['a'])
+
+    with app.app_context():
+        bob = User.query.filter_by(username='bob').one()
+        index = get_permission_index(bob)
+        deep = db.session.get(File, folders['a/b/c'])
+        assert index.allows(deep)
+        assert not index.allows(deep, require_write=True)
+        assert get_permission_index(bob) is index
+
+
+def test_permission_api_writes_only_what_changed(app, login):
+    alice = login('alice')
+    folders = alice.post('/api/folders/batch', json={'paths': ['x', 'y']}).get_json()['folders']
+    files = [folders['x'], folders['y']]
+    admin = login('admin')
+    with app.app_context():
+        bob_id = User.query.filter_by(username='bob').one().id
+
+    def post(*changes):
+        return admin.post('/admin/api/permissions', json={'changes': list(changes)})
+
+    grant = {'action': 'grant', 'user_ids': [bob_id], 'file_ids': files}
+    assert post(grant).get_json() == {'created': 2, 'updated': 0, 'deleted': 0}
+    assert post(grant).get_json() == {'created': 0, 'updated': 0, 'deleted': 0}
+    write = {'action': 'set', 'user_ids': [bob_id], 'file_ids': files[:1], 'can_read': True, 'can_write': True}
+    assert post(write).get_json() == {'created': 0, 'updated': 1, 'deleted': 0}
+    revoke = {'action': 'revoke', 'user_ids': [bob_id], 'file_ids': files[1:]}
+    assert post(revoke).get_json() == {'created': 0, 'updated': 0, 'deleted': 1}
+
+    with app.app_context():
+        rows = UserFilePermission.query.filter_by(user_id=bob_id).all()
+        assert [(row.file_id, row.can_read, row.can_write) for row in rows] == [(files[0], True, True)]
+    bob = login('bob')
+    assert bob.get('/api/files', query_string={'parent_id': files[0]}).status_code == 200
+    assert bob.get('/api/files', query_string={'parent_id': files[1]}).status_code == 403
+
+
+def test_permission_api_rejects_bad_requests(app, login):
+    admin = login('admin')
+    change = {'action': 'grant', 'user_ids': [3], 'file_ids': [999]}
+    assert admin.post('/admin/api/permissions', json={'changes': [change]}).status_code == 404
+    assert admin.post('/admin/api/permissions', json={'changes': [dict(change, action='own')]}).status_code == 400
+    assert admin.post('/admin/api/permissions', json={'changes': []}).status_code == 400
+    assert login('bob').post('/admin/api/permissions', json={'changes': [change]}).status_code == 403
@@ -0,0 +1,11 @@
+def test_profile_headers_are_only_sent_to_admins(app, login):
+    app.config['SQL_PROFILING'] = True
+
+    alice = login('alice').get('/api/files')
+    assert alice.status_code == 200
+    assert 'X-SQL-Profile' not in alice.headers
+    assert 'Server-Timing' not in alice.headers
+
+    admin = login('admin').get('/api/files')
+    assert admin.headers['X-SQL-Profile'].startswith('statements=')
+    assert admin.headers['Server-Timing'].startswith('sql;dur=')
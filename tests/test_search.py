@@ -0,0 +1,58 @@
+from app import db
+from app.models import User, UserFilePermission
+from app.permissions import invalidate
+
+from tests.test_listing import NAMES, _page_through
+
+
+def _make_folder(client, name, parent_id=None):
+    response = client.post('/api/folders', json={'folder_name': name, 'parent_id': parent_id})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def _grant(app, username, file_id):
+    with app.app_context():
+        user = User.query.filter_by(username=username).one()
+        db.session.add(UserFilePermission(user_id=user.id, file_id=file_id, can_read=True))
+        invalidate([user.id])
+        db.session.commit()
+
+
+def _search(client, query):
+    response = client.get('/api/search', query_string={'q': query})
+    assert response.status_code == 200
+    return {item['filename']: item['path'] for item in response.get_json()['items']}
+
+
+def test_search_pages_through_non_ascii_paths(login):
+    client = login('alice')
+    for name in NAMES:
+        assert client.post('/api/folders', json={'folder_name': name + '-doc'}).status_code == 201
+
+    full = [item['filename'] for item in client.get('/api/search?q=-doc').get_json()['items']]
+    assert sorted(full) == sorted(name + '-doc' for name in NAMES)
+    assert _page_through(client, '/api/search?q=-doc&limit=1') == full
+
+
+def test_search_matches_accented_terms(login):
+    client = login('alice')
+    _make_folder(client, 'Élan')
+    _make_folder(client, 'Relatório')
+
+    assert _search(client, 'Élan') == {'Élan': '/Élan'}
+    assert _search(client, 'latório') == {'Relatório': '/Relatório'}
+
+
+def test_search_paths_start_at_the_shared_folder(app, login):
+    alice = login('alice')
+    secret = _make_folder(alice, 'Secret')
+    shared = _make_folder(alice, 'Shared', secret)
+    _make_folder(alice, 'report', shared)
+    _grant(app, 'bob', shared)
+
+    bob = login('bob')
+    assert _search(bob, 'report') == {'report': '/Shared/report'}
+    # Matches on folder names above the grant are not disclosed.
+    assert _search(bob, 'Secret') == {}
+    assert _search(alice, 'report') == {'report': '/Secret/Shared/report'}
@@ -0,0 +1,44 @@
+import os
+
+from app.models import File
+
+
+def _write(path, data=b'x'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as handle:
+        handle.write(data)
+
+
+def test_sync_creates_rows_for_files_on_disk(app):
+    root = os.path.join(app.config['UPLOAD_FOLDER'], 'user_2')
+    _write(os.path.join(root, 'docs', 'a.txt'), b'abc')
+    _write(os.path.join(root, 'b.txt'))
+
+    result = app.test_cli_runner().invoke(args=['sync-uploads'])
+    assert 'Synchronization complete. 3 entries created.' in result.output
+
+    with app.app_context():
+        docs = File.query.filter_by(filename='docs').one()
+        a = File.query.filter_by(filename='a.txt').one()
+        assert a.parent_id == docs.id
+        assert a.full_path == '/docs/a.txt'
+        assert a.size == 3
+        assert docs.mtime is None
+        assert docs.scanned_mtime is not None
+        assert docs.to_dict()['mtime'] is None
+
+
+def test_incremental_sync_skips_unchanged_directories(app):
+    root = os.path.join(app.config['UPLOAD_FOLDER'], 'user_2')
+    _write(os.path.join(root, 'docs', 'a.txt'))
+    _write(os.path.join(root, 'other', 'b.txt'))
+    runner = app.test_cli_runner()
+    runner.invoke(args=['sync-uploads'])
+
+    _write(os.path.join(root, 'docs', 'new.txt'))
+    result = runner.invoke(args=['sync-uploads', '--incremental'])
+    assert '1 file(s)' in result.output
+    assert '1 unchanged' in result.output
+
+    with app.app_context():
+        assert File.query.filter_by(filename='new.txt').one().full_path == '/docs/new.txt'
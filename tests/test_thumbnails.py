@@ -0,0 +1,46 @@
+import io
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def _upload(client, name, data):
+    response = client.post(
+        '/api/files/upload',
+        data={'file': (io.BytesIO(data), name)},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def _png(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_thumbnail_is_a_bounded_jpeg(login):
+    client = login('alice')
+    file_id = _upload(client, 'wide.png', _png(1000, 400))
+
+    response = client.get(f'/api/files/{file_id}/thumbnail', query_string={'size': 128})
+    assert response.status_code == 200
+    assert response.mimetype == 'image/jpeg'
+    with Image.open(io.BytesIO(response.get_data())) as preview:
+        assert max(preview.size) == 128
+    cached = client.get(f'/api/files/{file_id}/thumbnail', query_string={'size': 128},
+                        headers={'If-None-Match': response.headers['ETag']})
+    assert cached.status_code == 304
+    assert client.get(f'/api/files/{file_id}/thumbnail', query_string={'size': 100}).status_code == 400
+
+
+def test_thumbnail_is_refused_for_other_files(login):
+    client = login('alice')
+    text_id = _upload(client, 'notes.txt', b'not an image')
+    broken_id = _upload(client, 'broken.png', b'not a png either')
+
+    assert client.get(f'/api/files/{text_id}/thumbnail').status_code == 404
+    assert client.get(f'/api/files/{broken_id}/thumbnail').status_code == 415
+    assert login('bob').get(f'/api/files/{broken_id}/thumbnail').status_code == 403
@@ -0,0 +1,39 @@
+import os
+
+from app import db
+from app.trash import move_to_trash, purge_trash, trash_folder
+
+
+def test_trash_entries_follow_the_transaction(app, tmp_path):
+    with app.app_context():
+        path = tmp_path / 'doomed'
+        path.mkdir()
+        (path / 'a.txt').write_bytes(b'a')
+
+        assert move_to_trash(str(path))
+        assert not path.exists()
+        db.session.rollback()
+        assert (path / 'a.txt').read_bytes() == b'a'
+
+        assert move_to_trash(str(path))
+        db.session.commit()
+        assert not path.exists()
+        folder = trash_folder()
+        assert len(os.listdir(folder)) == 1
+        assert purge_trash(app.config['UPLOAD_FOLDER']) == 1
+        assert os.listdir(folder) == []
+        assert not move_to_trash(str(path))
+
+
+def test_deleting_a_folder_moves_it_to_the_trash(app, login):
+    client = login('alice')
+    folder = client.post('/api/folders/batch', json={'paths': ['docs/inner']}).get_json()['folders']['docs/inner']
+    disk_path = os.path.join(app.config['UPLOAD_FOLDER'], 'user_2', 'docs')
+
+    parent = client.get('/api/files').get_json()[0]['id']
+    assert client.delete(f'/api/files/{parent}').status_code == 200
+    assert not os.path.exists(disk_path)
+    assert client.get('/api/files', query_string={'parent_id': folder}).status_code == 404
+
+    with app.app_context():
+        assert purge_trash(app.config['UPLOAD_FOLDER']) == 1
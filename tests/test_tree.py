@@ -0,0 +1,44 @@
+import pytest
+
+from app import db
+from app.models import File
+
+
+def _folder(name, parent=None):
+    folder = File(filename=name, owner_id=2, is_folder=True, parent=parent)
+    db.session.add(folder)
+    db.session.flush()
+    return folder
+
+
+def test_tree_path_is_assigned_on_insert(app):
+    with app.app_context():
+        a = _folder('a')
+        b = _folder('b', a)
+        c = _folder('c', b)
+        db.session.commit()
+
+        assert a.tree_path == '/'
+        assert c.tree_path == f'/{a.id}/{b.id}/'
+        assert c.ancestor_ids() == [a.id, b.id]
+        assert [f.filename for f in c.get_ancestors()] == ['a', 'b']
+        assert {f.id for f in a.descendants()} == {b.id, c.id}
+
+
+def test_move_rewrites_the_whole_subtree(app):
+    with app.app_context():
+        a = _folder('a')
+        b = _folder('b', a)
+        c = _folder('c', b)
+        other = _folder('other')
+        db.session.commit()
+
+        b.move_to(other, filename='renamed')
+        db.session.commit()
+        db.session.expire_all()
+
+        assert c.tree_path == f'/{other.id}/{b.id}/'
+        assert c.full_path == '/other/renamed/c'
+        assert a.descendants().count() == 0
+        with pytest.raises(ValueError):
+            other.move_to(c)
@@ -0,0 +1,111 @@
+import hashlib
+import io
+
+from app import db
+from app.models import File
+
+
+def test_upload_session_over_the_size_limit_is_refused(app, login):
+    app.config['UPLOAD_MAX_FILE_SIZE'] = 10
+    client = login('alice')
+
+    assert client.post('/api/files/uploads', json={'filename': 'big.bin', 'size': 11}).status_code == 413
+    assert client.post('/api/files/uploads', json={'filename': 'ok.bin', 'size': 10}).status_code == 201
+
+
+def test_dedup_routes_apply_the_size_limit(app, login):
+    app.config['UPLOAD_MAX_FILE_SIZE'] = 10
+    app.config['BLOB_STORE_ENABLED'] = True
+    client = login('alice')
+    body = {'sha256': hashlib.sha256(b'x' * 11).hexdigest(), 'size': 11}
+
+    assert client.post('/api/files/uploads/precheck', json=body).status_code == 413
+    link = dict(body, filename='big.bin', token='', proof='')
+    assert client.post('/api/files/uploads/link', json=link).status_code == 413
+
+
+def test_chunked_upload_can_resume_out_of_order(app, login):
+    app.config['UPLOAD_CHUNK_SIZE'] = 4
+    client = login('alice')
+    data = b'0123456789'
+    session = client.post('/api/files/uploads', json={'filename': 'c.bin', 'size': len(data)}).get_json()
+    assert session['total_chunks'] == 3
+    url = f'/api/files/uploads/{session["id"]}'
+
+    assert client.put(f'{url}/chunks/2', data=data[8:]).status_code == 200
+    assert client.put(f'{url}/chunks/0', data=data[:4]).status_code == 200
+    assert client.put(f'{url}/chunks/1', data=b'short').status_code == 400
+    incomplete = client.post(f'{url}/complete')
+    assert incomplete.status_code == 409
+    assert incomplete.get_json()['received'] == [[0, 4], [8, 10]]
+
+    assert client.get(url).get_json()['received'] == [[0, 4], [8, 10]]
+    assert client.put(f'{url}?offset=4', data=data[4:8]).status_code == 200
+    completed = client.post(f'{url}/complete')
+    assert completed.status_code == 201
+    assert completed.get_json()['filename'] == 'c.bin'
+
+    assert client.get(url).status_code == 404
+    assert client.get(f'/api/files/download/{completed.get_json()["id"]}').data == data
+
+
+def test_upload_sessions_belong_to_their_creator(login):
+    session = login('alice').post('/api/files/uploads', json={'filename': 'a.bin', 'size': 1}).get_json()
+    bob = login('bob')
+
+    assert bob.get(f'/api/files/uploads/{session["id"]}').status_code == 404
+    assert bob.put(f'/api/files/uploads/{session["id"]}/chunks/0', data=b'x').status_code == 404
+    assert bob.delete(f'/api/files/uploads/{session["id"]}').status_code == 404
+
+
+def _batch(client, names, **fields):
+    data = {'files': [(io.BytesIO(name.encode()), name.rsplit('/', 1)[-1]) for name in names]}
+    data.update(fields)
+    return client.post('/api/files/upload/batch', data=data, content_type='multipart/form-data')
+
+
+def test_batch_upload_creates_folders_from_relative_paths(login):
+    client = login('alice')
+    response = _batch(client, ['top.txt', 'a/b/deep.txt'], relative_paths=['top.txt', 'a/b/deep.txt'])
+    assert response.status_code == 201
+
+    created = {row['filename']: row for row in response.get_json()}
+    assert created['top.txt']['parent_id'] is None
+    deep = created['deep.txt']
+    assert client.get(f'/api/files/download/{deep["id"]}').data == b'a/b/deep.txt'
+    listing = client.get('/api/files', query_string={'parent_id': deep['parent_id']}).get_json()
+    assert [row['filename'] for row in listing] == ['deep.txt']
+
+
+def test_batch_upload_checks_every_destination(login):
+    alice = login('alice')
+    folders = alice.post('/api/folders/batch', json={'paths': ['x', 'y']}).get_json()['folders']
+
+    response = _batch(alice, ['one.txt', 'two.txt'], parent_ids=[str(folders['x']), str(folders['y'])])
+    assert response.status_code == 201
+    assert [row['parent_id'] for row in response.get_json()] == [folders['x'], folders['y']]
+
+    assert _batch(login('bob'), ['intruder.txt'], parent_ids=[str(folders['x'])]).status_code == 403
+    assert _batch(alice, ['a.txt', 'b.txt'], parent_ids=[str(folders['x'])]).status_code == 400
+
+
+def test_upload_records_size_mtime_and_checksum(app, login):
+    response = login('alice').post(
+        '/api/files/upload',
+        data={'file': (io.BytesIO(b'metadata'), 'm.txt')},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 201
+    row = response.get_json()
+    assert row['size'] == len(b'metadata')
+    assert row['checksum'] == hashlib.sha256(b'metadata').hexdigest()
+    assert row['mtime'].endswith('Z')
+
+    with app.app_context():
+        file_obj = db.session.get(File, row['id'])
+        file_obj.size = file_obj.mtime = file_obj.checksum = None
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=['backfill-metadata'])
+    assert 'Backfill complete. 1 file(s) updated' in result.output
+    with app.app_context():
+        assert db.session.get(File, row['id']).checksum == row['checksum']
@@ -0,0 +1,80 @@
+import io
+import os
+
+from app import db
+from app.models import Blob, File
+from app.watcher import UploadWatcher
+
+
+def _reconcile(app):
+    with app.app_context():
+        watcher = UploadWatcher(app.config['UPLOAD_FOLDER'], settle=0)
+        watcher.run(once=True)
+        watcher.inotify.close()
+
+
+def _write(path, data=b'x'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as handle:
+        handle.write(data)
+
+
+def test_reconcile_adds_and_removes_rows(app):
+    root = os.path.join(app.config['UPLOAD_FOLDER'], 'user_2')
+    _write(os.path.join(root, 'docs', 'a.txt'), b'abc')
+    _write(os.path.join(root, '.staging', 'ignored.bin'))
+    _reconcile(app)
+
+    with app.app_context():
+        assert sorted(f.filename for f in File.query) == ['a.txt', 'docs']
+        assert File.query.filter_by(filename='a.txt').one().size == 3
+
+    os.remove(os.path.join(root, 'docs', 'a.txt'))
+    _reconcile(app)
+    with app.app_context():
+        assert [f.filename for f in File.query] == ['docs']
+
+
+def test_duplicate_folder_rows_are_merged(app):
+    root = os.path.join(app.config['UPLOAD_FOLDER'], 'user_2')
+    _write(os.path.join(root, 'docs', 'a.txt'))
+    _write(os.path.join(root, 'docs', 'b.txt'))
+    with app.app_context():
+        kept = File(filename='docs', owner_id=2, is_folder=True)
+        duplicate = File(filename='docs', owner_id=2, is_folder=True)
+        db.session.add_all([kept, duplicate])
+        db.session.flush()
+        db.session.add(File(filename='a.txt', owner_id=2, parent=kept))
+        db.session.add(File(filename='b.txt', owner_id=2, parent=duplicate))
+        db.session.commit()
+        kept_id = kept.id
+
+    _reconcile(app)
+
+    with app.app_context():
+        folders = File.query.filter_by(is_folder=True).all()
+        assert [f.id for f in folders] == [kept_id]
+        children = File.query.filter_by(is_folder=False).all()
+        assert sorted(f.filename for f in children) == ['a.txt', 'b.txt']
+        assert {f.parent_id for f in children} == {kept_id}
+
+
+def test_file_changed_in_place_is_detached_from_its_blob(app, login):
+    app.config['BLOB_STORE_ENABLED'] = True
+    response = login('alice').post(
+        '/api/files/upload',
+        data={'file': (io.BytesIO(b'original'), 'a.txt')},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 201
+    path = os.path.join(app.config['UPLOAD_FOLDER'], 'user_2', 'a.txt')
+    os.remove(path)
+    _write(path, b'replaced by hand')
+
+    _reconcile(app)
+
+    with app.app_context():
+        row = db.session.get(File, response.get_json()['id'])
+        assert row.blob_id is None
+        assert row.size == len(b'replaced by hand')
+        assert Blob.query.count() == 0